@@ -0,0 +1,41 @@
+"""Per page parse time of the battlefield parsers.
+
+Run from the repository root:
+    python -m benchmarks.bfparse_benchmark [page.html ...] [--repeat N]
+"""
+import argparse
+import timeit
+
+from rocalert.services.rocwebservices import BattlefieldPageService
+
+_DEFAULT_PAGES = ["tests/testpages/battlefield/battlefield_p3.html"]
+
+
+def _time_per_call(func, repeat: int) -> float:
+    runs = timeit.repeat(func, number=repeat, repeat=5)
+    return min(runs) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", default=_DEFAULT_PAGES)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    for path in args.pages:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        pagenum = BattlefieldPageService.parse_page_range(text)[0]
+
+        soup = _time_per_call(
+            lambda: BattlefieldPageService.parse_page_soup(text, pagenum), args.repeat)
+        fast = _time_per_call(
+            lambda: BattlefieldPageService.parse_page(text, pagenum), args.repeat)
+
+        print(path)
+        print(f"  BeautifulSoup: {soup * 1000:8.3f} ms/page")
+        print(f"  lxml:          {fast * 1000:8.3f} ms/page ({soup / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
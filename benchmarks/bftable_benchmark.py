@@ -0,0 +1,70 @@
+"""Filter time over a battlefield as target objects and as a BattlefieldTable.
+
+Run from the repository root:
+    python -m benchmarks.bftable_benchmark [--players N]
+"""
+import argparse
+import random
+import timeit
+
+from rocalert.battlefieldtable import BattlefieldTable
+from rocalert.rocaccount import BattlefieldTarget
+
+_SKIP_RANKS = {112, 666}
+_SKIP_IDS = {"7530"}
+_BAD_ALLIANCES = ["Example Alliance Name"]
+_MIN_GOLD = 2.5 * 10**9
+
+
+def _make_targets(count: int) -> list[BattlefieldTarget]:
+    alliances = [None, "TSG", "BOB", "Example Alliance Name"]
+    return [
+        BattlefieldTarget(
+            str(random.randint(1, 10**6)), rank, f"player{rank}",
+            random.choice(alliances), random.randint(1, 10**7), "Soldiers",
+            random.randint(-1, 10**10),
+        )
+        for rank in range(1, count + 1)
+    ]
+
+
+def _object_filter(targets: list[BattlefieldTarget]) -> list[BattlefieldTarget]:
+    return [
+        x for x in targets
+        if x.gold >= _MIN_GOLD
+        and x.id not in _SKIP_IDS
+        and x.rank not in _SKIP_RANKS
+        and x.alliance not in _BAD_ALLIANCES
+    ]
+
+
+def _table_mask(table: BattlefieldTable):
+    return (
+        table.gold_at_least(_MIN_GOLD)
+        & table.id_not_in(_SKIP_IDS)
+        & table.rank_not_in(_SKIP_RANKS)
+        & table.alliance_not_in(_BAD_ALLIANCES)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    targets = _make_targets(args.players)
+    table = BattlefieldTable.from_targets(targets)
+
+    objects = min(timeit.repeat(lambda: _object_filter(targets), number=args.repeat, repeat=5))
+    masked = min(timeit.repeat(lambda: _table_mask(table), number=args.repeat, repeat=5))
+    top = min(timeit.repeat(lambda: table.top_k("gold", 10), number=args.repeat, repeat=5))
+
+    print(f"{args.players} players")
+    print(f"  object filter: {objects / args.repeat * 1e6:10.1f} us")
+    print(f"  table mask:    {masked / args.repeat * 1e6:10.1f} us")
+    print(f"  table top 10:  {top / args.repeat * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
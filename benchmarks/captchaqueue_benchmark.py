@@ -0,0 +1,93 @@
+"""Throughput of CaptchaExpirationQueue under many producer and consumer threads.
+
+Run from the repository root:
+    python -m benchmarks.captchaqueue_benchmark [--producers N] [--consumers N]
+"""
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+
+from rocalert.captcha.captchaexpirationqueue import CaptchaExpirationQueue
+from rocalert.roc_web_handler import Captcha
+
+
+class _ListQueue:
+    """The list scan the heap queue replaced, without events or timers"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._captchas = []
+
+    def add(self, captcha: Captcha) -> bool:
+        if captcha.is_expired:
+            return False
+        with self._lock:
+            self._captchas.append(captcha)
+        return True
+
+    def pop(self) -> Captcha:
+        with self._lock:
+            if not any(x for x in self._captchas if not x.is_expired):
+                return None
+            oldest = min(x.creation_date for x in self._captchas if not x.is_expired)
+            captcha = next(x for x in self._captchas if x.creation_date == oldest)
+            self._captchas.remove(captcha)
+            return captcha
+
+
+def _run(queue, producers: int, consumers: int, per_producer: int, backlog: int) -> float:
+    now = datetime.now()
+    for i in range(backlog):
+        queue.add(Captcha(f"backlog{i}", creation_date=now - timedelta(seconds=i % 60)))
+
+    total = producers * per_producer
+    popped = [0]
+    poplock = threading.Lock()
+    start = threading.Barrier(producers + consumers + 1)
+
+    def produce(worker: int) -> None:
+        start.wait()
+        for i in range(per_producer):
+            queue.add(Captcha(f"{worker}_{i}"))
+
+    def consume() -> None:
+        start.wait()
+        while True:
+            with poplock:
+                if popped[0] >= total:
+                    return
+            if queue.pop() is not None:
+                with poplock:
+                    popped[0] += 1
+
+    threads = [threading.Thread(target=produce, args=[i]) for i in range(producers)]
+    threads += [threading.Thread(target=consume) for _ in range(consumers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    begin = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - begin
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--producers", type=int, default=8)
+    parser.add_argument("--consumers", type=int, default=8)
+    parser.add_argument("--per-producer", type=int, default=2000)
+    parser.add_argument("--backlog", type=int, default=1000,
+                        help="captchas already queued when the run starts")
+    args = parser.parse_args()
+
+    ops = args.producers * args.per_producer * 2
+    print(f"{args.producers} producers, {args.consumers} consumers, "
+          f"{args.per_producer} captchas each, backlog {args.backlog}")
+    for name, queue in [("list scan", _ListQueue()), ("heap", CaptchaExpirationQueue())]:
+        seconds = _run(queue, args.producers, args.consumers, args.per_producer, args.backlog)
+        print(f"  {name:10} {seconds:8.3f}s  {ops / seconds:12,.0f} ops/s")
+
+
+if __name__ == "__main__":
+    main()
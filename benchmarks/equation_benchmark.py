@@ -0,0 +1,73 @@
+"""Equation captcha solve time with the AST evaluator against sympy, and import time.
+
+Run from the repository root:
+    python -m benchmarks.equation_benchmark [--count N]
+"""
+import argparse
+import random
+import subprocess
+import sys
+import time
+
+from rocalert.captcha.equation_solver import EquationSolver
+
+
+def _equations(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    ops = ["+", "-", "*", "/"]
+    return [
+        f"{rng.randint(1, 99)} {rng.choice(ops)} {rng.randint(1, 99)}"
+        for _ in range(count)
+    ]
+
+
+def _time_per_call(func, equations: list[str]) -> float:
+    start = time.perf_counter()
+    for eq in equations:
+        func(eq)
+    return (time.perf_counter() - start) / len(equations)
+
+
+def _import_seconds(module: str, runs: int = 3) -> float:
+    best = None
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c",
+             f"import time; s = time.perf_counter(); import {module}; "
+             "print(time.perf_counter() - s)"],
+            capture_output=True, text=True, check=True)
+        took = float(out.stdout)
+        best = took if best is None else min(best, took)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+
+    equations = _equations(args.count)
+    sympy_equations = equations[: max(1, args.count // 20)]
+
+    sympy_s = _time_per_call(EquationSolver._solve_sympy, sympy_equations)
+    ast_s = _time_per_call(EquationSolver.evaluate, equations)
+    # Repeats within the memo size, as when the same captcha comes back
+    repeated = equations[: EquationSolver.solve_equation.cache_info().maxsize]
+    EquationSolver.solve_equation.cache_clear()
+    for eq in repeated:
+        EquationSolver.solve_equation(eq)
+    cached_s = _time_per_call(EquationSolver.solve_equation, repeated)
+
+    for eq in sympy_equations:
+        assert str(EquationSolver.evaluate(eq)) == EquationSolver._solve_sympy(eq), eq
+
+    print(f"sympy solve:   {sympy_s * 1e6:10.2f} us/equation ({len(sympy_equations)} equations)")
+    print(f"ast evaluate:  {ast_s * 1e6:10.2f} us/equation ({sympy_s / ast_s:.0f}x)")
+    print(f"memoized:      {cached_s * 1e6:10.2f} us/equation ({sympy_s / cached_s:.0f}x)")
+
+    print(f"import sympy:          {_import_seconds('sympy') * 1000:8.1f} ms")
+    print(f"import equation_solver: {_import_seconds('rocalert.captcha.equation_solver') * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Accuracy and inference time of the local captcha digit classifier.
+
+Trains on the saved captcha corpus and times single and batched solves on
+the held back part. Run from the repository root:
+    python -m benchmarks.localsolver_benchmark [--synthetic N]
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+
+from rocalert.captcha.solvers.localdigitsolver import (
+    LocalDigitClassifier,
+    load_corpus,
+    split_corpus,
+)
+
+
+def _synthetic_corpus(count: int) -> tuple[list[bytes], list[str]]:
+    rng = np.random.default_rng(0)
+    font = PIL.ImageFont.load_default(size=28)
+    images, labels = [], []
+    for _ in range(count):
+        digit = str(rng.integers(1, 10))
+        img = PIL.Image.new("L", (40, 40), 255)
+        PIL.ImageDraw.Draw(img).text(
+            (12 + rng.integers(-2, 3), 4 + rng.integers(-2, 3)), digit, fill=0, font=font)
+        pixels = np.asarray(img, dtype=np.int16) + rng.integers(-20, 21, (40, 40))
+        out = io.BytesIO()
+        PIL.Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(out, format="PNG")
+        images.append(out.getvalue())
+        labels.append(digit)
+    return images, labels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default="captcha_img/")
+    parser.add_argument("--answers", default="logs/correct_ans.log")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="use N generated digit images instead of the saved corpus")
+    parser.add_argument("--batch", type=int, default=64)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        images, labels = _synthetic_corpus(args.synthetic)
+    else:
+        images, labels = load_corpus(args.images, args.answers)
+        if not images:
+            print("No labelled captchas found, using 2000 synthetic digits")
+            images, labels = _synthetic_corpus(2000)
+
+    train_x, train_y, test_x, test_y = split_corpus(images, labels, 0.2)
+    start = time.perf_counter()
+    model = LocalDigitClassifier().fit(train_x, train_y)
+    print(f"Trained on {len(train_x)} captchas in {time.perf_counter() - start:.2f}s")
+    print(f"Holdout accuracy: {model.accuracy(test_x, test_y):.1%} on {len(test_x)} captchas")
+
+    start = time.perf_counter()
+    for img in test_x:
+        model.predict(img)
+    single = (time.perf_counter() - start) / len(test_x)
+
+    start = time.perf_counter()
+    for i in range(0, len(test_x), args.batch):
+        model.predict_batch(test_x[i: i + args.batch])
+    batched = (time.perf_counter() - start) / len(test_x)
+
+    print(f"  single   {1000 * single:7.3f} ms per captcha")
+    print(f"  batch {args.batch:<3}{1000 * batched:7.3f} ms per captcha")
+
+
+if __name__ == "__main__":
+    main()
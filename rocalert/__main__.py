@@ -4,6 +4,9 @@ from datetime import datetime, timedelta
 
 import rocalert.services.captchaservices as captchaservices
 from rocalert.captcha.captcha_logger import CaptchaLogger
+from rocalert.captcha.answerindex import CaptchaAnswerIndex
+from rocalert.captcha.imagehashindex import ImageHashIndex
+from rocalert.captcha.imagestore import CaptchaImageStore
 from rocalert.pyrocalert import RocAlert
 from rocalert.roc_settings import (
     BuyerSettings,
@@ -47,6 +50,9 @@ def _run():
         generalLog=services["gen_captcha_logger"],
         remoteCaptcha=services["remote_captcha"],
         capsolver=services["capsolver"],
+        answerIndex=services["answer_index"],
+        imageIndex=services["image_index"],
+        imageStore=services["image_store"],
     )
 
     a.start()
@@ -78,12 +84,23 @@ def _settings_are_valid() -> bool:
 def _configure_services(user_settings: UserSettings) -> dict[str, object]:
     services = {}
 
+    log_format = user_settings.get_value("captcha_log_format").lower().strip()
     services["gen_captcha_logger"] = CaptchaLogger(
-        "logs/captcha_answers.log", timestamp=True
+        "logs/captcha_answers.log", timestamp=True, batched=True, fmt=log_format
     )
 
     services["correct_captcha_logger"] = CaptchaLogger(
-        "logs/correct_ans.log", log_correctness=False
+        "logs/correct_ans.log", log_correctness=False, batched=True, fmt=log_format
+    )
+
+    services["answer_index"] = CaptchaAnswerIndex(
+        "logs/captcha_index.bin", answerlog="logs/correct_ans.log"
+    )
+
+    services["image_index"] = ImageHashIndex.from_logs(
+        user_settings.get_value("captcha_save_path"),
+        "logs/correct_ans.log",
+        cachepath="logs/captcha_dhash.npz",
     )
 
     services["exception_handler"] = ExceptionHandler()
@@ -97,11 +114,18 @@ def _configure_services(user_settings: UserSettings) -> dict[str, object]:
 
     services["urlgenerator"] = ROCDecryptUrlGenerator()
 
-    services["capsolver"] = _get_captcha_solving_service(user_settings)
+    services["image_store"] = CaptchaImageStore(
+        user_settings.get_value("captcha_save_path"),
+        pack=user_settings.get_value("pack_captcha_images"),
+    )
+
+    services["capsolver"] = _get_captcha_solving_service(
+        user_settings, services["image_store"])
 
     services["rochandler"] = RocWebHandler(
         urlgenerator=services["urlgenerator"],
         default_headers=services["default_headers"],
+        cache_ttl=user_settings.get_value("page_cache_ttl_secs"),
     )
 
     services["buyer"] = ROCBuyer(
@@ -110,15 +134,47 @@ def _configure_services(user_settings: UserSettings) -> dict[str, object]:
     )
 
     services["trainer"] = SimpleRocTrainer(
-        TrainerSettings(filepath=_trainer_settings_fp)
+        TrainerSettings(filepath=_trainer_settings_fp),
+        account_state=services["rochandler"].account_state,
     )
 
     return services
 
 
-def _get_captcha_solving_service(user_settings: UserSettings):
-    service = user_settings.get_setting("auto_solve_captchas").value.lower().strip()
+def _get_captcha_solving_service(
+        user_settings: UserSettings, image_store: CaptchaImageStore = None):
+    services = user_settings.get_setting("auto_solve_captchas").value.lower().strip()
+
+    # Several services separated by commas are raced or routed between
+    if "," in services:
+        names = [service.strip() for service in services.split(",")]
+        solvers = {
+            name: _create_captcha_solver(name, user_settings, image_store) for name in names
+        }
+        solvers = {name: solver for name, solver in solvers.items() if solver is not None}
+
+        if user_settings.get_value("captcha_solver_strategy").lower().strip() == "adaptive":
+            costs = {
+                name: (captchaservices.get_captcha_settings(name) or {}).get("cost", 0.0)
+                for name in solvers
+            }
+            return captchaservices.AdaptiveCaptchaSolverService(
+                solvers,
+                costs=costs,
+                cost_weight=user_settings.get_value("captcha_cost_weight"),
+            )
+
+        return captchaservices.RacingCaptchaSolverService(
+            list(solvers.values()),
+            min_confidence=user_settings.get_value("captcha_min_confidence"),
+            timeout=user_settings.get_value("captcha_race_timeout") or None,
+        )
 
+    return _create_captcha_solver(services, user_settings, image_store)
+
+
+def _create_captcha_solver(
+        service: str, user_settings: UserSettings, image_store: CaptchaImageStore = None):
     savepath = user_settings.get_setting("captcha_save_path").value
 
     if service in ["none"]:
@@ -144,6 +200,7 @@ def _get_captcha_solving_service(user_settings: UserSettings):
             api_key=captcha_settings["apiKey"],
             mode=captcha_settings["mode"],
             savepath=savepath,
+            image_store=image_store,
         )
     if service in ["rocapi", "ai"]:
         base_url = captcha_settings["base_url"]
@@ -151,6 +208,10 @@ def _get_captcha_solving_service(user_settings: UserSettings):
             solve_url=base_url + captcha_settings["solve_url"],
             report_url=base_url + captcha_settings["report_url"],
         )
+    if service in ["local"]:
+        return captchaservices.LocalCaptchaSolverService(
+            model_path=captcha_settings["model_path"],
+        )
   
            
 def _get_default_headers():
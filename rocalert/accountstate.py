@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+class AccountState:
+    """Latest known account details, updated from every page load.
+
+    Each field keeps the time it was last seen so callers can ask for a
+    value no older than `max_age` seconds and skip a request when the
+    handler already loaded a page carrying it.
+    """
+
+    GOLD = "gold"
+    RANK = "rank"
+    TURNS = "turns"
+    LOGGED_IN = "logged_in"
+    ON_COOLDOWN = "on_cooldown"
+    CAPTCHA_TYPE = "captcha_type"
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._fields: dict[str, tuple[object, float]] = {}
+
+    def update(self, field: str, value, timestamp: float = None) -> None:
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self._lock:
+            current = self._fields.get(field)
+            # Responses can finish out of order when shared between threads
+            if current is None or current[1] <= timestamp:
+                self._fields[field] = (value, timestamp)
+
+    def update_from_response(self, resp, timestamp: float = None) -> None:
+        """Record everything a page says about the account
+
+        Args:
+            resp (RocResponse): page that was loaded
+            timestamp (float, optional): time.monotonic() of the load.
+                Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+
+        logged_in = resp.logged_in
+        self.update(self.LOGGED_IN, logged_in, timestamp)
+        if not logged_in:
+            return
+
+        captcha_type = resp.captcha_type
+        self.update(self.CAPTCHA_TYPE, captcha_type, timestamp)
+        self.update(self.ON_COOLDOWN, resp.on_cooldown, timestamp)
+
+        for field, value in (
+            (self.GOLD, resp.gold),
+            (self.RANK, resp.rank),
+            (self.TURNS, resp.turns),
+        ):
+            if value is not None:
+                self.update(field, value, timestamp)
+
+    def get(self, field: str, max_age: float = None, default=None):
+        """Last value seen for a field
+
+        Args:
+            field (str): field name
+            max_age (float, optional): oldest acceptable value in seconds.
+                Defaults to any age.
+            default (optional): returned if the field is unknown or too old
+        """
+        with self._lock:
+            entry = self._fields.get(field)
+        if entry is None:
+            return default
+        value, timestamp = entry
+        if max_age is not None and time.monotonic() - timestamp > max_age:
+            return default
+        return value
+
+    def age(self, field: str) -> float:
+        """Seconds since the field was last seen, None if never seen"""
+        with self._lock:
+            entry = self._fields.get(field)
+        if entry is None:
+            return None
+        return time.monotonic() - entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fields.clear()
+
+    def gold(self, max_age: float = None) -> int:
+        return self.get(self.GOLD, max_age)
+
+    def rank(self, max_age: float = None) -> int:
+        return self.get(self.RANK, max_age)
+
+    def turns(self, max_age: float = None) -> int:
+        return self.get(self.TURNS, max_age)
+
+    def logged_in(self, max_age: float = None) -> bool:
+        return self.get(self.LOGGED_IN, max_age)
+
+    def on_cooldown(self, max_age: float = None) -> bool:
+        return self.get(self.ON_COOLDOWN, max_age)
@@ -0,0 +1,221 @@
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from rocalert.rocaccount import BattlefieldTarget
+
+_NO_ALLIANCE = -1
+
+
+class BattlefieldTable:
+    """Battlefield targets stored column by column.
+
+    Ids, ranks, tff and gold are kept in NumPy arrays while names, alliances
+    and tff types are interned into one string pool shared by every table
+    derived from the same scan. Predicates return boolean masks that can be
+    combined with `&`, `|` and `~` and passed to `filter`.
+    """
+
+    COLUMNS = ("id", "rank", "tff", "gold")
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        ranks: np.ndarray,
+        tffs: np.ndarray,
+        golds: np.ndarray,
+        names: np.ndarray,
+        alliances: np.ndarray,
+        tfftypes: np.ndarray,
+        strings: list[str],
+        string_codes: dict[str, int],
+    ) -> None:
+        self._ids = ids
+        self._ranks = ranks
+        self._tffs = tffs
+        self._golds = golds
+        self._names = names
+        self._alliances = alliances
+        self._tfftypes = tfftypes
+        self._strings = strings
+        self._string_codes = string_codes
+
+    @classmethod
+    def from_targets(cls, targets: Iterable[BattlefieldTarget]) -> "BattlefieldTable":
+        targets = list(targets)
+        strings = []
+        string_codes = {}
+
+        def intern(value: str) -> int:
+            code = string_codes.get(value)
+            if code is None:
+                code = len(strings)
+                string_codes[value] = code
+                strings.append(value)
+            return code
+
+        count = len(targets)
+        ids = np.empty(count, dtype=np.int64)
+        ranks = np.empty(count, dtype=np.int32)
+        tffs = np.empty(count, dtype=np.int64)
+        golds = np.empty(count, dtype=np.int64)
+        names = np.empty(count, dtype=np.int32)
+        alliances = np.empty(count, dtype=np.int32)
+        tfftypes = np.empty(count, dtype=np.int32)
+
+        for i, target in enumerate(targets):
+            ids[i] = int(target.id)
+            ranks[i] = target.rank
+            tffs[i] = target.tff
+            golds[i] = target.gold
+            names[i] = intern(target.name)
+            alliances[i] = _NO_ALLIANCE if target.alliance is None else intern(target.alliance)
+            tfftypes[i] = intern(target.tfftype)
+
+        return cls(ids, ranks, tffs, golds, names, alliances, tfftypes, strings, string_codes)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Columns and string pool as plain arrays, e.g. for np.savez"""
+        return {
+            "ids": self._ids,
+            "ranks": self._ranks,
+            "tffs": self._tffs,
+            "golds": self._golds,
+            "names": self._names,
+            "alliances": self._alliances,
+            "tfftypes": self._tfftypes,
+            "strings": np.array(self._strings, dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> "BattlefieldTable":
+        strings = [str(x) for x in arrays["strings"]]
+        string_codes = {x: i for i, x in enumerate(strings)}
+        return cls(
+            arrays["ids"], arrays["ranks"], arrays["tffs"], arrays["golds"],
+            arrays["names"], arrays["alliances"], arrays["tfftypes"],
+            strings, string_codes,
+        )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self) -> Iterator[BattlefieldTarget]:
+        for i in range(len(self)):
+            yield self._target(i)
+
+    def __getitem__(self, index: int) -> BattlefieldTarget:
+        return self._target(range(len(self))[index])
+
+    def _target(self, i: int) -> BattlefieldTarget:
+        alliance = self._alliances[i]
+        return BattlefieldTarget(
+            str(self._ids[i]),
+            int(self._ranks[i]),
+            self._strings[self._names[i]],
+            None if alliance == _NO_ALLIANCE else self._strings[alliance],
+            int(self._tffs[i]),
+            self._strings[self._tfftypes[i]],
+            int(self._golds[i]),
+        )
+
+    def to_targets(self) -> list[BattlefieldTarget]:
+        return list(self)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    @property
+    def ranks(self) -> np.ndarray:
+        return self._ranks
+
+    @property
+    def tffs(self) -> np.ndarray:
+        return self._tffs
+
+    @property
+    def golds(self) -> np.ndarray:
+        return self._golds
+
+    def _column(self, column: str) -> np.ndarray:
+        columns = {"id": self._ids, "rank": self._ranks, "tff": self._tffs, "gold": self._golds}
+        if column not in columns:
+            raise ValueError(f"Unknown column {column}, expected one of {self.COLUMNS}")
+        return columns[column]
+
+    def _take(self, index: np.ndarray) -> "BattlefieldTable":
+        return BattlefieldTable(
+            self._ids[index],
+            self._ranks[index],
+            self._tffs[index],
+            self._golds[index],
+            self._names[index],
+            self._alliances[index],
+            self._tfftypes[index],
+            self._strings,
+            self._string_codes,
+        )
+
+    def _alliance_codes(self, alliances: Iterable[str]) -> np.ndarray:
+        codes = [
+            _NO_ALLIANCE if alliance is None else self._string_codes.get(alliance)
+            for alliance in alliances
+        ]
+        return np.array([code for code in codes if code is not None], dtype=np.int32)
+
+    @staticmethod
+    def _int_array(values: Iterable) -> np.ndarray:
+        return np.array([int(x) for x in values], dtype=np.int64)
+
+    def gold_at_least(self, gold: int) -> np.ndarray:
+        return self._golds >= gold
+
+    def rank_between(self, lower: int = None, upper: int = None) -> np.ndarray:
+        """Mask of ranks within [lower, upper]. Missing bounds are open"""
+        mask = np.ones(len(self), dtype=bool)
+        if lower:
+            mask &= self._ranks >= lower
+        if upper:
+            mask &= self._ranks <= upper
+        return mask
+
+    def rank_in(self, ranks: Iterable[int]) -> np.ndarray:
+        return np.isin(self._ranks, self._int_array(ranks))
+
+    def rank_not_in(self, ranks: Iterable[int]) -> np.ndarray:
+        return ~self.rank_in(ranks)
+
+    def id_in(self, ids: Iterable) -> np.ndarray:
+        """Mask of ids in a collection of int or string ids"""
+        return np.isin(self._ids, self._int_array(ids))
+
+    def id_not_in(self, ids: Iterable) -> np.ndarray:
+        return ~self.id_in(ids)
+
+    def alliance_in(self, alliances: Iterable[str]) -> np.ndarray:
+        """Mask of alliance names in a collection. None matches no alliance"""
+        return np.isin(self._alliances, self._alliance_codes(alliances))
+
+    def alliance_not_in(self, alliances: Iterable[str]) -> np.ndarray:
+        return ~self.alliance_in(alliances)
+
+    def filter(self, mask: np.ndarray) -> "BattlefieldTable":
+        return self._take(np.flatnonzero(mask))
+
+    def sort_by(self, column: str, descending: bool = False) -> "BattlefieldTable":
+        values = self._column(column)
+        order = np.argsort(-values if descending else values, kind="stable")
+        return self._take(order)
+
+    def top_k(self, column: str, k: int) -> "BattlefieldTable":
+        """The k rows with the largest values of a column, largest first"""
+        values = self._column(column)
+        if k <= 0:
+            return self._take(np.empty(0, dtype=np.int64))
+        if k < len(self):
+            index = np.argpartition(-values, k - 1)[:k]
+        else:
+            index = np.arange(len(self))
+        index = index[np.argsort(-values[index], kind="stable")]
+        return self._take(index)
@@ -0,0 +1,285 @@
+import bisect
+import csv
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+_MAGIC = b"RCAI"
+_VERSION = 1
+# magic, version, record count, bytes of the answer log already indexed
+_HEADER = struct.Struct("<4sHxxQQ")
+_KEY_SIZE = 16
+_ANSWER_SIZE = 16
+_RECORD_SIZE = _KEY_SIZE + _ANSWER_SIZE
+
+
+def _key(captchahash: str) -> bytes:
+    return hashlib.blake2b(captchahash.encode("utf-8"), digest_size=_KEY_SIZE).digest()
+
+
+def parse_answer_line(line: str) -> tuple[str, str]:
+    """Hash and answer from a CaptchaLogger line, None if it is not a correct answer
+
+    Handles the optional "HH:MM:SS: " timestamp and ":correct" suffix, and
+    the "hash,answer,correct,time" lines of the csv format.
+    """
+    line = line.strip()
+    if ":" not in line and "," in line:
+        return _parse_csv_line(line)
+
+    parts = line.split(":")
+    if len(parts) >= 4 and all(x.strip().isdigit() for x in parts[:3]):
+        parts = [x.strip() for x in parts[3:]]
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        return None
+    if len(parts) >= 3 and parts[2] != "True":
+        return None
+    return parts[0], parts[1]
+
+
+def _parse_csv_line(line: str) -> tuple[str, str]:
+    parts = next(csv.reader([line]), [])
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        return None
+    if len(parts) >= 3 and parts[2] not in ("", "1"):
+        return None
+    return parts[0], parts[1]
+
+
+class _MappedKeys:
+    """Sequence view of the keys in the mapped records, for bisect"""
+
+    def __init__(self, data: mmap.mmap, count: int) -> None:
+        self._data = data
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = _HEADER.size + i * _RECORD_SIZE
+        return self._data[start: start + _KEY_SIZE]
+
+
+class CaptchaAnswerIndex:
+    """Local captcha hash to answer lookups.
+
+    Answers live in a compact file of fixed size records sorted by a digest
+    of the captcha hash, which is memory mapped and binary searched. Answers
+    added since the file was written are held in memory until `save`, and a
+    small LRU keeps recent lookups off the mapped file.
+
+    The file records how much of the correct answer log it has indexed, so
+    opening it only reads the lines CaptchaLogger appended since.
+    """
+
+    def __init__(
+            self,
+            indexpath: str,
+            answerlog: str = None,
+            lru_size: int = 1024) -> None:
+        self._indexpath = indexpath
+        self._answerlog = answerlog
+        self._lru_size = lru_size
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[str, str] = OrderedDict()
+        # Added or removed since the last save. None marks a removal
+        self._pending: dict[bytes, str] = {}
+        self._file = None
+        self._data: mmap.mmap = None
+        self._keys: _MappedKeys = None
+        self._count = 0
+        self._log_offset = 0
+        self._saved_log_offset = 0
+
+        self._hits = 0
+        self._misses = 0
+
+        self._open()
+        if self._answerlog is not None:
+            self._read_answerlog()
+
+    def lookup(self, captchahash: str) -> str:
+        """Known answer for a captcha hash, None if unknown"""
+        with self._lock:
+            answer = self._lru.get(captchahash)
+            if answer is not None:
+                self._lru.move_to_end(captchahash)
+                self._hits += 1
+                return answer
+
+            key = _key(captchahash)
+            if key in self._pending:
+                answer = self._pending[key]
+            else:
+                answer = self._lookup_mapped(key)
+
+            if answer is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._remember(captchahash, answer)
+            return answer
+
+    def add(self, captchahash: str, answer: str) -> None:
+        if not captchahash or not answer:
+            return
+        encoded = answer.encode("utf-8")
+        if len(encoded) > _ANSWER_SIZE:
+            raise ValueError(f"Answer {answer} is longer than {_ANSWER_SIZE} bytes")
+
+        with self._lock:
+            self._pending[_key(captchahash)] = answer
+            self._remember(captchahash, answer)
+
+    def discard(self, captchahash: str) -> None:
+        """Forget a hash, e.g. after its stored answer was wrong"""
+        with self._lock:
+            self._pending[_key(captchahash)] = None
+            self._lru.pop(captchahash, None)
+
+    def __contains__(self, captchahash: str) -> bool:
+        return self.lookup(captchahash) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            added = 0
+            for key, answer in self._pending.items():
+                mapped = self._lookup_mapped(key) is not None
+                if answer is None:
+                    added -= mapped
+                else:
+                    added += not mapped
+            return self._count + added
+
+    @property
+    def dirty(self) -> bool:
+        return len(self._pending) > 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "stored": self._count,
+                "pending": len(self._pending),
+            }
+
+    def save(self) -> None:
+        """Merge pending answers into the index file"""
+        with self._lock:
+            if not self._pending and self._saved_log_offset == self._log_offset \
+                    and os.path.exists(self._indexpath):
+                return
+
+            records = {}
+            for i in range(self._count):
+                start = _HEADER.size + i * _RECORD_SIZE
+                record = self._data[start: start + _RECORD_SIZE]
+                records[record[:_KEY_SIZE]] = record[_KEY_SIZE:]
+            for key, answer in self._pending.items():
+                if answer is None:
+                    records.pop(key, None)
+                else:
+                    records[key] = answer.encode("utf-8").ljust(_ANSWER_SIZE, b"\0")
+
+            dirname = os.path.dirname(self._indexpath)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+
+            tmppath = self._indexpath + ".tmp"
+            with open(tmppath, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, _VERSION, len(records), self._log_offset))
+                for key in sorted(records):
+                    f.write(key)
+                    f.write(records[key])
+
+            # The mapping has to be closed before the file can be replaced on Windows
+            self._close_mapping()
+            os.replace(tmppath, self._indexpath)
+            self._pending.clear()
+            self._open_mapping()
+            self._saved_log_offset = self._log_offset
+
+    def close(self) -> None:
+        self.save()
+        with self._lock:
+            self._close_mapping()
+
+    def _remember(self, captchahash: str, answer: str) -> None:
+        self._lru[captchahash] = answer
+        self._lru.move_to_end(captchahash)
+        while len(self._lru) > self._lru_size:
+            self._lru.popitem(last=False)
+
+    def _lookup_mapped(self, key: bytes) -> str:
+        if not self._count:
+            return None
+        i = bisect.bisect_left(self._keys, key)
+        if i == self._count or self._keys[i] != key:
+            return None
+        start = _HEADER.size + i * _RECORD_SIZE + _KEY_SIZE
+        return self._data[start: start + _ANSWER_SIZE].rstrip(b"\0").decode("utf-8")
+
+    def _open(self) -> None:
+        with self._lock:
+            self._open_mapping()
+
+    def _open_mapping(self) -> None:
+        self._count = 0
+        if not os.path.exists(self._indexpath):
+            return
+        if os.path.getsize(self._indexpath) < _HEADER.size:
+            print(f"Ignoring truncated captcha index {self._indexpath}")
+            return
+
+        self._file = open(self._indexpath, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, log_offset = _HEADER.unpack_from(self._data)
+        if magic != _MAGIC or version != _VERSION \
+                or len(self._data) != _HEADER.size + count * _RECORD_SIZE:
+            print(f"Ignoring unreadable captcha index {self._indexpath}")
+            self._close_mapping()
+            return
+
+        self._count = count
+        self._log_offset = log_offset
+        self._saved_log_offset = log_offset
+        self._keys = _MappedKeys(self._data, count)
+
+    def _close_mapping(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._keys = None
+        self._count = 0
+
+    def _read_answerlog(self) -> None:
+        if not os.path.exists(self._answerlog):
+            return
+
+        with self._lock:
+            # A shorter log was rotated or truncated, so read it from the start
+            if os.path.getsize(self._answerlog) < self._log_offset:
+                self._log_offset = 0
+
+            with open(self._answerlog, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+
+            # Leave a partly written last line for next time
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode("utf-8", errors="replace").splitlines():
+                parsed = parse_answer_line(line)
+                if parsed is None or len(parsed[1].encode("utf-8")) > _ANSWER_SIZE:
+                    continue
+                self._pending[_key(parsed[0])] = parsed[1]
+            self._log_offset += end
+
+        self.save()
@@ -1,22 +1,92 @@
 from rocalert.roc_web_handler import Captcha
+from rocalert.services.filelock import FileLock
 from datetime import datetime
+import atexit
+import csv
+import io
 import os
+import queue
+import threading
+import time
+
+# Queued by flush() to end the current batch straight away
+_FLUSH = object()
 
 
 class CaptchaLogger:
+    """Appends a line for every captcha answered.
+
+    By default each call opens the file and writes its line straight away.
+    With `batched`, lines go through a queue to one background writer that
+    appends them together once `batch_size` lines are waiting or
+    `flush_interval` seconds after the first, so busy threads never wait
+    on the disk. With `process_lock`, which follows `batched` unless
+    given, writes hold a `<savefile>.lock` file lock so several processes
+    can share a log. A logger handed to a child process starts its own
+    writer there.
+
+    The `text` format is the original `hash:answer[:correct]` line with an
+    optional `HH:MM:SS: ` prefix. The `csv` format writes
+    `hash,answer,correct,unix time` with 1/0 for correct and empty fields
+    for anything not logged.
+    """
+
+    TEXT = "text"
+    CSV = "csv"
+
     def __init__(
             self,
             savefile: str,
             timestamp: bool = False,
-            log_correctness: bool = True
+            log_correctness: bool = True,
+            batched: bool = False,
+            fmt: str = TEXT,
+            batch_size: int = 100,
+            flush_interval: float = 1.0,
+            queue_size: int = 10000,
+            process_lock: bool = None,
             ) -> None:
+        if fmt not in (self.TEXT, self.CSV):
+            raise ValueError(f"Unknown captcha log format: {fmt}")
+
         self._savefile = savefile
         self._timestamp = timestamp
         self._add_answer_correctness = log_correctness
+        self._batched = batched
+        self._fmt = fmt
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue_size = queue_size
+        self._process_lock = batched if process_lock is None else process_lock
 
         dirname = os.path.dirname(savefile)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname, exist_ok=True)
+
+        self._reset()
+
+    def _reset(self) -> None:
+        """Writer state, which belongs to a single process"""
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self._queue_size)
+        # Held while queueing so close() never queues its sentinel mid-put
+        self._lock = threading.Lock()
+        self._writelock = threading.Lock()
+        self._startlock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._dropped = 0
+        self._written = 0
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for name in ("_queue", "_lock", "_writelock", "_startlock", "_thread"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._reset()
 
     @property
     def set_savefile(self, savefile: str): self._savefile = savefile
@@ -24,6 +94,14 @@ class CaptchaLogger:
     @property
     def get_savefile(self): return self._savefile
 
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def written(self) -> int:
+        return self._written
+
     def set_timestamp(self, timestamp: bool):
         self._timestamp = timestamp
 
@@ -31,6 +109,9 @@ class CaptchaLogger:
         self._add_answer_correctness = log_correctness
 
     def __create_line(self, captcha: Captcha) -> str:
+        if self._fmt == self.CSV:
+            return self.__create_csv_line(captcha)
+
         msg = '{0}:{1}'.format(captcha.hash, captcha.ans)
         if self._add_answer_correctness:
             msg = '{0}:{1}'.format(msg, captcha.ans_correct)
@@ -41,7 +122,105 @@ class CaptchaLogger:
         else:
             return '{0}\n'.format(msg)
 
-    def log_captcha(self, captcha: Captcha) -> None:
+    def __create_csv_line(self, captcha: Captcha) -> str:
+        correct = ''
+        if self._add_answer_correctness:
+            correct = '1' if captcha.ans_correct else '0'
+        ts = str(int(time.time())) if self._timestamp else ''
+
+        out = io.StringIO()
+        csv.writer(out, lineterminator='\n').writerow(
+            [captcha.hash, captcha.ans, correct, ts])
+        return out.getvalue()
+
+    def log_captcha(self, captcha: Captcha) -> bool:
+        """Write, or with `batched` queue, a line for the captcha
+
+        Returns:
+            bool: False if the line was dropped because the queue was full
+        """
+        line = self.__create_line(captcha)
+        if not self._batched:
+            with self._writelock:
+                self._write_lines([line])
+            return True
+
+        if self._pid != os.getpid():
+            # Forked with the parent's queue and a writer thread that does
+            # not exist here
+            self._reset()
+        with self._lock:
+            if self._closed:
+                return False
+            self._start()
+            try:
+                self._queue.put_nowait(line)
+            except queue.Full:
+                self._dropped += 1
+                return False
+            return True
+
+    def flush(self) -> None:
+        """Block until every queued line has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_FLUSH)
+            self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            running = self._thread is not None and self._thread.is_alive()
+            if running:
+                self._queue.put(None)
+        if running:
+            self._thread.join()
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._startlock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="CaptchaLogger", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._flush_interval
+            while len(batch) < self._batch_size \
+                    and batch[-1] is not None and batch[-1] is not _FLUSH:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=max(remaining, 0)))
+                except queue.Empty:
+                    break
+
+            # None is the shutdown signal from close()
+            running = None not in batch
+            lines = [x for x in batch if x is not None and x is not _FLUSH]
+            try:
+                if lines:
+                    self._write_lines(lines)
+            except Exception as e:
+                print(f"Error writing captcha log {self._savefile}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_lines(self, lines: list[str]) -> None:
+        data = ''.join(lines)
+        if self._process_lock:
+            with FileLock(self._savefile):
+                self._append(data)
+        else:
+            self._append(data)
+        self._written += len(lines)
+
+    def _append(self, data: str) -> None:
         with open(self._savefile, 'a+', encoding="utf-8") as f:
-            message = self.__create_line(captcha)
-            f.write(message)
+            f.write(data)
@@ -1,4 +1,7 @@
 import asyncio
+import heapq
+import itertools
+import time
 from rocalert.roc_web_handler import Captcha
 
 from collections import defaultdict
@@ -16,16 +19,34 @@ class CaptchaExpirationQueueEvent(Enum):
 
 
 class CaptchaExpirationQueue:
+    """Captchas ordered by expiry, oldest first.
+
+    Captchas sit in a min-heap keyed by their expiry on the monotonic clock.
+    Removed captchas are only marked dead and are dropped once they reach
+    the top of the heap. A single timer is kept for the next expiry, which
+    clears expired captchas and fires the removal events.
+    """
+
     def __init__(self) -> None:
         self._captchalock = Lock()
         self._eventlistenerlock = Lock()
-        self._captchas: list[Captcha] = []
+        # [expires_at, seq, captcha]. captcha is None once removed
+        self._heap: list[list] = []
+        self._entries: dict[str, list[list]] = defaultdict(list)
+        self._count = 0
+        self._seq = itertools.count()
         self._timer: Timer = None
+        self._timer_due: float = None
 
         self._eventlisteners: dict[
             CaptchaExpirationQueueEvent, list[Awaitable]
         ] = defaultdict(list)
 
+    @staticmethod
+    def _expires_at(captcha: Captcha) -> float:
+        remaining = Captcha.EXPIRATION_AGE - captcha.age
+        return time.monotonic() + remaining.total_seconds()
+
     def add(self, captcha: Captcha) -> bool:
         """Attempt to add an element to the queue..
 
@@ -40,12 +61,14 @@ class CaptchaExpirationQueue:
         if captcha is None or captcha.is_expired:
             return False
 
-        self._captchalock.acquire()
-        self._captchas.append(captcha)
-        if len(self._captchas) == 1:
-            self._refresh_timer()
-        self._trigger_events(CaptchaExpirationQueueEvent.CaptchasAdded)
-        self._captchalock.release()
+        entry = [self._expires_at(captcha), next(self._seq), captcha]
+        with self._captchalock:
+            heapq.heappush(self._heap, entry)
+            self._entries[captcha.hash].append(entry)
+            self._count += 1
+            if self._timer_due is None or entry[0] < self._timer_due:
+                self._schedule_timer(entry[0])
+            self._trigger_events(CaptchaExpirationQueueEvent.CaptchasAdded)
         return True
 
     def pop(self) -> Captcha:
@@ -55,20 +78,14 @@ class CaptchaExpirationQueue:
         -------
             Captcha: oldest captcha, none if there are no captchas
         """
-        self._captchalock.acquire()
-        oldest_captcha = None
-
-        if any(x for x in self._captchas if not x.is_expired):
-            oldest_creation = min(
-                x.creation_date for x in self._captchas if not x.is_expired
-            )
-            oldest_captcha = next(
-                (x for x in self._captchas if x.creation_date == oldest_creation), None
-            )
-            if oldest_captcha is not None:
-                self._captchas.remove(oldest_captcha)
+        with self._captchalock:
+            expired = self._drop_expired(time.monotonic())
+            oldest_captcha = None
+            if self._heap:
+                oldest_captcha = heapq.heappop(self._heap)[2]
+                self._forget(oldest_captcha)
+            if expired or oldest_captcha is not None:
                 self._trigger_events(CaptchaExpirationQueueEvent.CaptchasRemoved)
-        self._captchalock.release()
 
         return oldest_captcha
 
@@ -84,57 +101,100 @@ class CaptchaExpirationQueue:
         -------
             bool: true if removed, false otherwise
         """
-        self._captchalock.acquire()
-        beforelen = len(self._captchas)
-        if captcha is not None:
-            self._captchas.remove(captcha)
-        else:
-            self._captchas = [x for x in self._captchas if x.hash != captchahash]
-        newlen = len(self._captchas)
-
-        if newlen < beforelen:
-            self._trigger_events(CaptchaExpirationQueueEvent.CaptchasRemoved)
-        if newlen == 0:
-            self._cancel_timer()
-            self._trigger_events(CaptchaExpirationQueueEvent.NoCaptchas)
-
-        self._captchalock.release()
-        return newlen < beforelen
+        with self._captchalock:
+            if captcha is not None:
+                entries = [x for x in self._entries.get(captcha.hash, []) if x[2] is captcha]
+            else:
+                entries = list(self._entries.get(captchahash, []))
+
+            for entry in entries:
+                self._kill(entry)
+            self._drop_dead()
+
+            if entries:
+                self._trigger_events(CaptchaExpirationQueueEvent.CaptchasRemoved)
+            if self._count == 0:
+                self._cancel_timer()
+                self._trigger_events(CaptchaExpirationQueueEvent.NoCaptchas)
+
+        return len(entries) > 0
+
+    def oldest_expires_in(self) -> float:
+        """Seconds until the oldest captcha expires, None if the queue is empty"""
+        with self._captchalock:
+            self._drop_dead()
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - time.monotonic())
 
     def listen(self, event: CaptchaExpirationQueueEvent, method: Awaitable) -> None:
         self._eventlistenerlock.acquire()
         self._eventlisteners[event].append(method)
         self._eventlistenerlock.release()
 
-    def _clear_expired_captchas(self) -> None:
-        self._captchalock.acquire()
-        anyexpired = any(x.is_expired for x in self._captchas)
-        if anyexpired:
-            self._captchas = [x for x in self._captchas if not x.is_expired]
-            self._trigger_events(CaptchaExpirationQueueEvent.CaptchasRemoved)
+    def _kill(self, entry: list) -> None:
+        entries = self._entries[entry[2].hash]
+        entries.remove(entry)
+        if not entries:
+            del self._entries[entry[2].hash]
+        entry[2] = None
+        self._count -= 1
+
+    def _forget(self, captcha: Captcha) -> None:
+        entries = self._entries[captcha.hash]
+        for i, entry in enumerate(entries):
+            if entry[2] is captcha:
+                del entries[i]
+                break
+        if not entries:
+            del self._entries[captcha.hash]
+        self._count -= 1
+
+    def _drop_dead(self) -> None:
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+        # Rebuild once dead entries outnumber live ones
+        if len(self._heap) > 2 * self._count + 16:
+            self._heap = [x for x in self._heap if x[2] is not None]
+            heapq.heapify(self._heap)
+
+    def _drop_expired(self, now: float) -> bool:
+        expired = False
+        self._drop_dead()
+        while self._heap and self._heap[0][0] <= now:
+            self._kill(heapq.heappop(self._heap))
+            expired = True
+            self._drop_dead()
+        return expired
 
-        if any(self._captchas):
-            self._refresh_timer()
-        else:
-            self._trigger_events(CaptchaExpirationQueueEvent.NoCaptchas)
-            self._cancel_timer()
+    def _clear_expired_captchas(self) -> None:
+        with self._captchalock:
+            self._timer = None
+            self._timer_due = None
+            if self._drop_expired(time.monotonic()):
+                self._trigger_events(CaptchaExpirationQueueEvent.CaptchasRemoved)
 
-        self._captchalock.release()
+            if self._heap:
+                self._schedule_timer(self._heap[0][0])
+            else:
+                self._trigger_events(CaptchaExpirationQueueEvent.NoCaptchas)
 
-    def _refresh_timer(self) -> None:
+    def _schedule_timer(self, due: float) -> None:
         self._cancel_timer()
-        self._timer = Timer(5, self._clear_expired_captchas).start()
+        self._timer_due = due
+        self._timer = Timer(max(0, due - time.monotonic()), self._clear_expired_captchas)
+        self._timer.daemon = True
+        self._timer.start()
 
     def _cancel_timer(self) -> None:
         if self._timer is not None:
             self._timer.cancel()
             self._timer = None
+        self._timer_due = None
 
     def __len__(self):
-        self._captchalock.acquire()
-        length = len(self._captchas)
-        self._captchalock.release()
-        return length
+        with self._captchalock:
+            return self._count
 
     def _trigger_events(self, event: CaptchaExpirationQueueEvent):
         global _eventloop
@@ -1,53 +1,175 @@
 from rocalert.captcha.captchaexpirationqueue import CaptchaExpirationQueue, CaptchaExpirationQueueEvent
 from rocalert.roc_web_handler import Captcha
 
-from threading import Lock
+import time
+from threading import Condition, Thread
 from typing import Callable
 
 
 class CaptchaProvider:
-    def __init__(self, captchaprovider: Callable[[], Captcha], cachesize: int = 5) -> None:
+    """Keeps up to `cachesize` solved captchas ready for consumers.
+
+    `fillers` background threads call the captcha provider whenever the
+    cache plus the solves in flight fall short of `cachesize`. Consumers
+    block on a condition variable until a captcha arrives or their timeout
+    or deadline passes. Solving happens outside the lock, so a slow solve
+    never holds up consumers taking captchas that are already cached.
+    """
+
+    def __init__(
+            self,
+            captchaprovider: Callable[[], Captcha],
+            cachesize: int = 5,
+            fillers: int = 1,
+            error_delay: float = 1) -> None:
         self._cachesize = cachesize
-        self._cachelock = Lock()
+        self._fillercount = max(1, min(fillers, cachesize))
+        self._error_delay = error_delay
+        self._cond = Condition()
         self._cache = CaptchaExpirationQueue()
         self._captchaprovider = captchaprovider
         self._captcharemovedlistener = None
 
+        self._running = False
+        self._fillers: list[Thread] = []
+        self._pending = 0
+
+        self._waiting = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._last_wait_seconds = 0.0
+        self._provided = 0
+        self._provider_errors = 0
+
     def clear(self) -> None:
-        self._cachelock.acquire()
-        while self._cache.pop() is not None:
-            continue
-        self._cachelock.release()
-
-    def get_solved_captcha(self) -> Captcha:
-        captcha = None
-        while captcha is None:
-            self._cachelock.acquire()
-            captcha = self._cache.pop()
-            self._cachelock.release()
+        with self._cond:
+            while self._cache.pop() is not None:
+                continue
+            self._cond.notify_all()
+
+    def get_solved_captcha(self, timeout: float = None, deadline: float = None) -> Captcha:
+        """Take the oldest solved captcha, waiting for one if none are ready
+
+        Args:
+            timeout (float, optional): longest wait in seconds.
+                Defaults to waiting forever.
+            deadline (float, optional): time.monotonic() to give up at.
+                The earlier of timeout and deadline applies.
+
+        Returns:
+            Captcha: oldest cached captcha, None if the wait ran out
+        """
+        start = time.monotonic()
+        if timeout is not None:
+            deadline = start + timeout if deadline is None else min(deadline, start + timeout)
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                captcha = self._cache.pop()
+                while captcha is None:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    captcha = self._cache.pop()
+            finally:
+                self._waiting -= 1
+
+            waited = time.monotonic() - start
+            self._waits += 1
+            self._wait_seconds += waited
+            self._last_wait_seconds = waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            if captcha is None:
+                self._timeouts += 1
+            # Wake a filler to replace the captcha
+            self._cond.notify_all()
+
         return captcha
 
     def __len__(self) -> int:
-        self._cachelock.acquire()
-        length = len(self._cache)
-        self._cachelock.release()
-        return length
+        return len(self._cache)
+
+    def stats(self) -> dict:
+        """Gauges for the cache and the consumers waiting on it"""
+        with self._cond:
+            return {
+                "cached": len(self._cache),
+                "pending": self._pending,
+                "oldest_expires_in": self._cache.oldest_expires_in(),
+                "waiting": self._waiting,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "mean_wait_seconds": self._wait_seconds / self._waits if self._waits else 0.0,
+                "max_wait_seconds": self._max_wait_seconds,
+                "last_wait_seconds": self._last_wait_seconds,
+                "provided": self._provided,
+                "provider_errors": self._provider_errors,
+            }
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
 
-    def _on_captcha_removed(self) -> None:
-        self._cachelock.acquire()
+    def _needs_captcha(self) -> bool:
+        return len(self._cache) + self._pending < self._cachesize
 
-        while len(self._cache) < self._cachesize:
-            captcha = self._captchaprovider()
-            self._cache.add(captcha)
+    def _fill(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._needs_captcha():
+                    # Expiry removes captchas without a consumer, so also wake
+                    # when the oldest one is due
+                    expires_in = self._cache.oldest_expires_in()
+                    self._cond.wait(None if expires_in is None else expires_in + 0.05)
+                if not self._running:
+                    return
+                self._pending += 1
 
-        self._cachelock.release()
+            captcha = None
+            try:
+                captcha = self._captchaprovider()
+            except Exception as e:
+                print(f"Error getting captcha for cache: {e}")
+
+            with self._cond:
+                self._pending -= 1
+                if captcha is None:
+                    self._provider_errors += 1
+                elif self._cache.add(captcha):
+                    self._provided += 1
+                    self._cond.notify_all()
+
+            if captcha is None:
+                time.sleep(self._error_delay)
 
     def start(self) -> None:
+        if self._running:
+            return
+
         async def on_captcharemoved():
-            self._on_captcha_removed()
+            self._wake()
 
         self._captcharemovedlistener = on_captcharemoved
         self._cache.listen(
             CaptchaExpirationQueueEvent.CaptchasRemoved, on_captcharemoved)
 
-        self._on_captcha_removed()
+        self._running = True
+        self._fillers = [
+            Thread(target=self._fill, daemon=True, name=f"captcha-filler-{i}")
+            for i in range(self._fillercount)
+        ]
+        for filler in self._fillers:
+            filler.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop the fillers once their current solves finish"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for filler in self._fillers:
+            filler.join(timeout)
+        self._fillers = []
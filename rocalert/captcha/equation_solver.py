@@ -1,35 +1,63 @@
-from sympy import sympify, solve  # py -m pip install sympy
+import ast
+import functools
+from fractions import Fraction
+
+_BINOPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+}
+_UNARYOPS = {
+    ast.UAdd: lambda a: a,
+    ast.USub: lambda a: -a,
+}
 
 
 class EquationSolver():
-    ops = ['*', '/', '-', '+']
-
-    def __rsolve(eq1: str,  eq2: str, op) -> int:
-        eq1 = eq1.strip()
-        if eq1 == '':
-            v1 = 0
-        else:
-            req1 = EquationSolver.solve_equation(eq1)
-            v1 = int(req1)
-        v2 = int(EquationSolver.solve_equation(eq2))
-        print(f'Got {v1} {op} {v2}')
-        if op == '*':
-            return v1 * v2
-        if op == '/':
-            return v1 / v2
-        if op == '-':
-            return v1 - v2
-        if op == '+':
-            return v1 + v2
+    """Answers the arithmetic shown in equation captchas.
+
+    Integer `+ - * /` expressions are evaluated exactly from their syntax
+    tree, so a result is an integer or a fraction like sympy gives. Anything
+    else falls back to sympy, which is only imported the first time it is
+    needed (py -m pip install sympy). Answers are memoized by equation.
+    """
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def solve_equation(eq: str) -> str:
+        value = EquationSolver.evaluate(eq)
+        if value is not None:
+            return str(value)
+        return EquationSolver._solve_sympy(eq)
+
+    @staticmethod
+    def evaluate(eq: str) -> Fraction:
+        """Exact value of an integer + - * / expression, None if it is anything else"""
+        try:
+            tree = ast.parse(eq.strip(), mode="eval")
+            return EquationSolver._eval_node(tree.body)
+        except (SyntaxError, ValueError, ZeroDivisionError, RecursionError):
+            return None
+
+    @staticmethod
+    def _eval_node(node: ast.AST) -> Fraction:
+        if isinstance(node, ast.Constant):
+            if type(node.value) is not int:
+                raise ValueError(f"Unsupported constant {node.value!r}")
+            return Fraction(node.value)
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            return _BINOPS[type(node.op)](
+                EquationSolver._eval_node(node.left),
+                EquationSolver._eval_node(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARYOPS:
+            return _UNARYOPS[type(node.op)](EquationSolver._eval_node(node.operand))
+        raise ValueError(f"Unsupported expression {type(node).__name__}")
+
+    @staticmethod
+    def _solve_sympy(eq: str) -> str:
+        from sympy import sympify, solve
+
         sym_eq = sympify(f'Eq(x,{eq})')
         res = solve(sym_eq)
         return str(res[0])
-
-        # eq = eq.strip()
-        # for op in EquationSolver.ops:
-        #     if op in eq:
-        #         l, r = eq.split(op, 1)
-        #         return str(EquationSolver.__rsolve(l,r,op))
-        # return eq
@@ -0,0 +1,285 @@
+import io
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import PIL.Image
+
+from rocalert.captcha.answerindex import parse_answer_line
+from rocalert.captcha.imagestore import CaptchaImageStore
+
+HASH_BITS = 64
+_HASH_SIZE = 8
+
+# Set bits in every byte value, for popcounts over uint64 arrays
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(imgbytes: bytes) -> int:
+    """64 bit difference hash of an image
+
+    The image is shrunk to 9x8 greyscale and each bit records whether a
+    pixel is brighter than its right neighbour, so re-encoding, slight noise
+    and brightness shifts leave most bits unchanged.
+    """
+    with PIL.Image.open(io.BytesIO(imgbytes)) as img:
+        small = img.convert("L").resize(
+            (_HASH_SIZE + 1, _HASH_SIZE), PIL.Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Hamming distance from value to every hash in a uint64 array"""
+    diff = np.bitwise_xor(hashes, np.uint64(value))
+    return _POPCOUNT[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def load_answer_log(path: str) -> dict[str, str]:
+    """Captcha hash to answer for every correct answer in a CaptchaLogger file"""
+    answers = {}
+    if not os.path.exists(path):
+        return answers
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            parsed = parse_answer_line(line)
+            if parsed is not None:
+                answers[parsed[0]] = parsed[1]
+    return answers
+
+
+class ImageHashMatch:
+    def __init__(self, answer: str, distance: int, confidence: float, captchahash: str) -> None:
+        self.answer = answer
+        self.distance = distance
+        self.confidence = confidence
+        self.captchahash = captchahash
+
+    def __repr__(self) -> str:
+        return f"ImageHashMatch({self.answer}, distance={self.distance}, " \
+            + f"confidence={self.confidence:.2f})"
+
+
+class ImageHashIndex:
+    """Finds answers for captcha images that look like ones already solved.
+
+    The server hands out the same digit images under different hashes, so
+    the hash lookup alone misses repeats. Each solved image is reduced to a
+    64 bit dHash and a lookup compares a new image against all of them at
+    once by Hamming distance.
+
+    Every known image within `max_distance` bits votes for its answer,
+    weighted by how close it is. The winning answer's confidence is its
+    share of the vote scaled down by the distance of its closest image.
+    Matches under `min_confidence` are not returned.
+    """
+
+    def __init__(self, max_distance: int = 4, min_confidence: float = 0.6) -> None:
+        self.max_distance = max_distance
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        # Grown by doubling. Only the first len(self._answers) are used
+        self._hashes = np.empty(64, dtype=np.uint64)
+        self._answers: list[str] = []
+        self._captchahashes: list[str] = []
+        self._known: set[str] = set()
+
+        self._lookups = 0
+        self._hits = 0
+        self._lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._answers)
+
+    def add(self, imgbytes: bytes, answer: str, captchahash: str = None) -> bool:
+        """Remember a solved image. Returns false for unreadable or already known images"""
+        if not imgbytes or not answer:
+            return False
+        if self.knows(captchahash):
+            return False
+        try:
+            value = dhash(imgbytes)
+        except Exception as e:
+            print(f"Error hashing captcha image {captchahash}: {e}")
+            return False
+        return self.add_hash(value, answer, captchahash)
+
+    def knows(self, captchahash: str) -> bool:
+        """True if an image is indexed under this captcha hash"""
+        if captchahash is None:
+            return False
+        with self._lock:
+            return captchahash in self._known
+
+    def add_hash(self, value: int, answer: str, captchahash: str = None) -> bool:
+        """Remember an image's dhash. Returns false if the captcha hash is already known"""
+        with self._lock:
+            if captchahash is not None and captchahash in self._known:
+                return False
+            size = len(self._answers)
+            if size == len(self._hashes):
+                self._hashes = np.resize(self._hashes, 2 * size)
+            self._hashes[size] = value
+            self._answers.append(answer)
+            self._captchahashes.append(captchahash)
+            if captchahash is not None:
+                self._known.add(captchahash)
+            return True
+
+    def lookup(self, imgbytes: bytes) -> ImageHashMatch:
+        """Best known answer for an image, None if nothing close enough is known"""
+        start = time.perf_counter()
+        try:
+            value = dhash(imgbytes)
+        except Exception:
+            value = None
+
+        match = None if value is None else self.lookup_hash(value)
+        with self._lock:
+            self._lookups += 1
+            self._lookup_seconds += time.perf_counter() - start
+            if match is not None:
+                self._hits += 1
+        return match
+
+    def lookup_hash(self, value: int) -> ImageHashMatch:
+        with self._lock:
+            if not self._answers:
+                return None
+            distances = hamming_distances(self._hashes[:len(self._answers)], value)
+            close = np.flatnonzero(distances <= self.max_distance)
+            if len(close) == 0:
+                return None
+
+            votes = defaultdict(float)
+            nearest = {}
+            for i in close:
+                answer = self._answers[i]
+                votes[answer] += self.max_distance + 1 - distances[i]
+                if answer not in nearest or distances[i] < distances[nearest[answer]]:
+                    nearest[answer] = i
+
+            answer = max(votes, key=votes.get)
+            best = nearest[answer]
+            share = votes[answer] / sum(votes.values())
+            confidence = share * (1 - distances[best] / (self.max_distance + 1))
+            captchahash = self._captchahashes[best]
+
+        if confidence < self.min_confidence:
+            return None
+        return ImageHashMatch(answer, int(distances[best]), float(confidence), captchahash)
+
+    def reject(self, imgbytes: bytes, answer: str) -> int:
+        """Drop images near this one that gave a wrong answer. Returns the number dropped"""
+        try:
+            value = dhash(imgbytes)
+        except Exception:
+            return 0
+        with self._lock:
+            if not self._answers:
+                return 0
+            distances = hamming_distances(self._hashes[:len(self._answers)], value)
+            drop = (distances <= self.max_distance) \
+                & (np.array(self._answers, dtype=object) == answer)
+            if not drop.any():
+                return 0
+            keep = np.flatnonzero(~drop)
+            # A dropped hash may be added again once its correct answer is known
+            self._known.difference_update(
+                self._captchahashes[i] for i in np.flatnonzero(drop))
+            self._hashes = np.resize(self._hashes[keep], max(64, len(keep)))
+            self._answers = [self._answers[i] for i in keep]
+            self._captchahashes = [self._captchahashes[i] for i in keep]
+            return int(drop.sum())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._answers),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+                "mean_lookup_ms": 1000 * self._lookup_seconds / self._lookups
+                if self._lookups else 0.0,
+            }
+
+    def load_directory(
+            self,
+            imgdir: str,
+            answers: dict[str, str],
+            cachepath: str = None) -> int:
+        """Index saved captcha images that have a known answer
+
+        Args:
+            imgdir (str): CaptchaImageStore directory
+            answers (dict[str, str]): captcha hash to correct answer
+            cachepath (str, optional): .npz file of hashes from an earlier
+                load, so only new images are decoded. Updated afterwards.
+
+        Returns:
+            int: number of images added
+        """
+        cached = self._read_cache(cachepath)
+        store = CaptchaImageStore(imgdir)
+        added = 0
+        for captchahash in store.hashes():
+            answer = answers.get(captchahash)
+            if answer is None or self.knows(captchahash):
+                continue
+            if captchahash in cached:
+                if self.add_hash(cached[captchahash], answer, captchahash):
+                    added += 1
+                continue
+            imgbytes = store.get(captchahash)
+            if imgbytes is not None and self.add(imgbytes, answer, captchahash):
+                added += 1
+
+        if cachepath is not None:
+            self.save_cache(cachepath)
+        return added
+
+    def save_cache(self, cachepath: str) -> None:
+        with self._lock:
+            known = [
+                (h, v) for h, v in zip(self._captchahashes, self._hashes[:len(self._answers)])
+                if h is not None]
+        dirname = os.path.dirname(cachepath)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmppath = cachepath + ".tmp.npz"
+        np.savez(
+            tmppath,
+            captchahashes=np.array([h for h, _ in known], dtype=str),
+            hashes=np.array([v for _, v in known], dtype=np.uint64),
+        )
+        os.replace(tmppath, cachepath)
+
+    @staticmethod
+    def _read_cache(cachepath: str) -> dict[str, int]:
+        if cachepath is None or not os.path.exists(cachepath):
+            return {}
+        try:
+            with np.load(cachepath) as data:
+                return {
+                    str(h): int(v)
+                    for h, v in zip(data["captchahashes"], data["hashes"])
+                }
+        except Exception as e:
+            print(f"Ignoring unreadable image hash cache {cachepath}: {e}")
+            return {}
+
+    @classmethod
+    def from_logs(
+            cls,
+            imgdir: str,
+            answerlog: str,
+            cachepath: str = None,
+            **kwargs) -> "ImageHashIndex":
+        """Index the saved images of every correct answer in a CaptchaLogger file"""
+        index = cls(**kwargs)
+        index.load_directory(imgdir, load_answer_log(answerlog), cachepath)
+        return index
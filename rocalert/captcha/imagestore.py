@@ -0,0 +1,231 @@
+import atexit
+import hashlib
+import os
+import queue
+import threading
+from typing import Iterator
+
+from rocalert.services.filelock import FileLock
+
+_INDEX_FILE = "index.log"
+_PACK_FILE = "images.pack"
+_OBJECTS_DIR = "objects"
+
+
+def image_digest(imgbytes: bytes) -> str:
+    return hashlib.blake2b(imgbytes, digest_size=16).hexdigest()
+
+
+class CaptchaImageStore:
+    """Saves captcha images from a background thread, keyed by their content.
+
+    `save` only queues the raw PNG bytes from img.php, so nothing is decoded
+    or re-encoded while a captcha is being solved. Each distinct image is
+    written once under its digest, either as a loose file in
+    `objects/<2 hex>/<digest>.png` or, with `pack`, appended to a single
+    `images.pack` file. `index.log` is an append-only list mapping captcha
+    hashes to digests (and pack offsets), so the same image served under
+    many hashes is stored once.
+
+    Appends to the pack and index happen under a file lock on the index,
+    so several stores and processes can share one root.
+
+    Images saved the old way as `<captcha hash>.png` in the root are still
+    found by `get` and `hashes`.
+    """
+
+    def __init__(self, root: str, pack: bool = False, queue_size: int = 1000) -> None:
+        self._root = root
+        self._pack = pack
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._startlock = threading.Lock()
+        self._filelock = FileLock(os.path.join(root, _INDEX_FILE))
+        self._thread = None
+        self._closed = False
+        self._dropped = 0
+        self._written = 0
+
+        self._digests: dict[str, str] = {}
+        self._packed: dict[str, tuple[int, int]] = {}
+        # Queued but not yet written, so they can be read back straight away
+        self._unwritten: dict[str, bytes] = {}
+        self._load_index()
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    def save(self, captchahash: str, imgbytes: bytes) -> bool:
+        """Queue an image for writing.
+
+        Returns:
+            bool: True if queued or already stored, False if dropped
+        """
+        if self._closed or not captchahash or not imgbytes:
+            return False
+        with self._lock:
+            if captchahash in self._digests or captchahash in self._unwritten:
+                return True
+            self._unwritten[captchahash] = imgbytes
+
+        self._start()
+        try:
+            self._queue.put_nowait((captchahash, imgbytes))
+        except queue.Full:
+            with self._lock:
+                self._unwritten.pop(captchahash, None)
+            self._dropped += 1
+            return False
+        return True
+
+    def get(self, captchahash: str) -> bytes:
+        """Image saved for a captcha hash, None if there is none"""
+        with self._lock:
+            imgbytes = self._unwritten.get(captchahash)
+            digest = self._digests.get(captchahash)
+            location = self._packed.get(digest)
+        if imgbytes is not None:
+            return imgbytes
+
+        try:
+            if location is not None:
+                with open(os.path.join(self._root, _PACK_FILE), "rb") as f:
+                    f.seek(location[0])
+                    return f.read(location[1])
+            if digest is not None:
+                path = self._object_path(digest)
+            else:
+                path = os.path.join(self._root, captchahash + ".png")
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __contains__(self, captchahash: str) -> bool:
+        with self._lock:
+            if captchahash in self._digests or captchahash in self._unwritten:
+                return True
+        return os.path.isfile(os.path.join(self._root, captchahash + ".png"))
+
+    def hashes(self) -> Iterator[str]:
+        """Every captcha hash with a saved image"""
+        with self._lock:
+            known = set(self._digests) | set(self._unwritten)
+        yield from sorted(known)
+
+        if os.path.isdir(self._root):
+            legacy = []
+            for entry in os.scandir(self._root):
+                name, ext = os.path.splitext(entry.name)
+                if ext.lower() == ".png" and name not in known and entry.is_file():
+                    legacy.append(name)
+            yield from sorted(legacy)
+
+    def images(self) -> Iterator[tuple[str, bytes]]:
+        """(captcha hash, image bytes) for every saved image"""
+        for captchahash in self.hashes():
+            imgbytes = self.get(captchahash)
+            if imgbytes is not None:
+                yield captchahash, imgbytes
+
+    def flush(self) -> None:
+        """Block until every queued image has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._root, _OBJECTS_DIR, digest[:2], digest + ".png")
+
+    def _load_index(self) -> None:
+        path = os.path.join(self._root, _INDEX_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 4:
+                    self._packed[parts[1]] = (int(parts[2]), int(parts[3]))
+                elif len(parts) != 2:
+                    continue
+                self._digests[parts[0]] = parts[1]
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._startlock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="CaptchaImageStore", daemon=True)
+                self._thread.start()
+                # Write out anything still queued when the process exits
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                # None is the shutdown signal from close()
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                print(f"Error saving captcha image {item[0]}: {e}")
+                # Forget it so the bytes are freed and a later save retries
+                with self._lock:
+                    self._unwritten.pop(item[0], None)
+                    self._dropped += 1
+            finally:
+                self._queue.task_done()
+
+    def _write(self, captchahash: str, imgbytes: bytes) -> None:
+        digest = image_digest(imgbytes)
+        os.makedirs(self._root, exist_ok=True)
+
+        with self._lock:
+            location = self._packed.get(digest)
+        if not self._pack:
+            path = self._object_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmppath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmppath, "wb") as f:
+                    f.write(imgbytes)
+                os.replace(tmppath, path)
+
+        with self._filelock:
+            if self._pack and location is None:
+                with open(os.path.join(self._root, _PACK_FILE), "ab") as f:
+                    # Other stores may have appended since this one last
+                    # wrote, so the end of the file is the only safe offset
+                    location = (os.fstat(f.fileno()).st_size, len(imgbytes))
+                    f.write(imgbytes)
+
+            entry = f"{captchahash} {digest}"
+            if location is not None:
+                entry += f" {location[0]} {location[1]}"
+            with open(os.path.join(self._root, _INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(entry + "\n")
+
+        with self._lock:
+            self._digests[captchahash] = digest
+            if location is not None:
+                self._packed[digest] = location
+            self._unwritten.pop(captchahash, None)
+        self._written += 1
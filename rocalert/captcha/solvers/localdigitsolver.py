@@ -0,0 +1,228 @@
+"""Offline digit classifier for image captchas.
+
+Train and evaluate from the repository root against the saved captchas:
+    python -m rocalert.captcha.solvers.localdigitsolver train
+    python -m rocalert.captcha.solvers.localdigitsolver eval
+"""
+import argparse
+import io
+import os
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+import PIL.Image
+
+from rocalert.captcha.imagehashindex import load_answer_log
+from rocalert.captcha.imagestore import CaptchaImageStore, image_digest
+
+DEFAULT_MODEL_PATH = "models/digit_classifier.npz"
+_IMAGE_SIZE = 20
+
+
+def image_features(imgbytes: bytes, size: int = _IMAGE_SIZE) -> np.ndarray:
+    """Greyscale pixels of an image shrunk to size x size, scaled to zero mean and unit variance"""
+    with PIL.Image.open(io.BytesIO(imgbytes)) as img:
+        small = img.convert("L").resize((size, size), PIL.Image.Resampling.BILINEAR)
+    pixels = np.asarray(small, dtype=np.float32).reshape(-1)
+    pixels -= pixels.mean()
+    std = pixels.std()
+    return pixels / std if std > 0 else pixels
+
+
+def labelled_images(imgdir: str, answers: dict[str, str]) -> Iterable[Tuple[str, bytes, str]]:
+    """(captcha hash, image bytes, answer) for every saved image with a known answer"""
+    store = CaptchaImageStore(imgdir)
+    for captchahash in sorted(store.hashes()):
+        if captchahash not in answers:
+            continue
+        imgbytes = store.get(captchahash)
+        if imgbytes is not None:
+            yield captchahash, imgbytes, answers[captchahash]
+
+
+def load_corpus(imgdir: str, answerlog: str) -> Tuple[list[bytes], list[str]]:
+    images, labels = [], []
+    for _, imgbytes, answer in labelled_images(imgdir, load_answer_log(answerlog)):
+        images.append(imgbytes)
+        labels.append(answer)
+    return images, labels
+
+
+class LocalDigitClassifier:
+    """Small two layer network that names the digit in a captcha image.
+
+    Runs on the CPU with NumPy only. One image takes well under a millisecond,
+    most of it decoding the PNG, and `predict_batch` shares the matrix
+    products across many images.
+    """
+
+    def __init__(self, hidden: int = 64, size: int = _IMAGE_SIZE, seed: int = 0) -> None:
+        self.hidden = hidden
+        self.size = size
+        self._rng = np.random.default_rng(seed)
+        self.classes: np.ndarray = None
+        self._w1 = self._b1 = self._w2 = self._b2 = None
+
+    @property
+    def trained(self) -> bool:
+        return self.classes is not None
+
+    def features(self, images: Sequence[bytes]) -> np.ndarray:
+        return np.stack([image_features(x, self.size) for x in images])
+
+    def fit(
+            self,
+            images: Sequence[bytes],
+            labels: Sequence[str],
+            epochs: int = 40,
+            learning_rate: float = 0.05,
+            batch_size: int = 32,
+            l2: float = 1e-4) -> "LocalDigitClassifier":
+        """Train from scratch with minibatch gradient descent"""
+        if len(images) == 0:
+            raise ValueError("No labelled images to train on")
+        x = self.features(images)
+        self.classes, y = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+
+        inputs = x.shape[1]
+        self._w1 = (self._rng.standard_normal((inputs, self.hidden)) * np.sqrt(2 / inputs)).astype(np.float32)
+        self._b1 = np.zeros(self.hidden, dtype=np.float32)
+        self._w2 = (self._rng.standard_normal((self.hidden, len(self.classes)))
+                    * np.sqrt(1 / self.hidden)).astype(np.float32)
+        self._b2 = np.zeros(len(self.classes), dtype=np.float32)
+
+        onehot = np.eye(len(self.classes), dtype=np.float32)[y]
+        for _ in range(epochs):
+            order = self._rng.permutation(len(x))
+            for start in range(0, len(x), batch_size):
+                batch = order[start: start + batch_size]
+                self._step(x[batch], onehot[batch], learning_rate, l2)
+        return self
+
+    def _forward(self, x: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        hidden = np.maximum(x @ self._w1 + self._b1, 0)
+        logits = hidden @ self._w2 + self._b2
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        return hidden, probs
+
+    def _step(self, x: np.ndarray, onehot: np.ndarray, learning_rate: float, l2: float) -> None:
+        hidden, probs = self._forward(x)
+        dlogits = (probs - onehot) / len(x)
+        dw2 = hidden.T @ dlogits + l2 * self._w2
+        dhidden = (dlogits @ self._w2.T) * (hidden > 0)
+        dw1 = x.T @ dhidden + l2 * self._w1
+
+        self._w2 -= learning_rate * dw2
+        self._b2 -= learning_rate * dlogits.sum(axis=0)
+        self._w1 -= learning_rate * dw1
+        self._b1 -= learning_rate * dhidden.sum(axis=0)
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        if not self.trained:
+            raise ValueError("Classifier has not been trained")
+        return self._forward(x)[1]
+
+    def predict_batch(self, images: Sequence[bytes]) -> list[Tuple[str, float]]:
+        """(answer, confidence) for each image"""
+        if len(images) == 0:
+            return []
+        probs = self.predict_proba(self.features(images))
+        best = probs.argmax(axis=1)
+        return [(str(self.classes[i]), float(probs[row, i])) for row, i in enumerate(best)]
+
+    def predict(self, imgbytes: bytes) -> Tuple[str, float]:
+        return self.predict_batch([imgbytes])[0]
+
+    def accuracy(self, images: Sequence[bytes], labels: Sequence[str]) -> float:
+        if len(images) == 0:
+            return 0.0
+        predictions = self.predict_batch(images)
+        return sum(p[0] == label for p, label in zip(predictions, labels)) / len(images)
+
+    def save(self, path: str) -> None:
+        if not self.trained:
+            raise ValueError("Classifier has not been trained")
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmppath = path + ".tmp.npz"
+        np.savez(
+            tmppath, w1=self._w1, b1=self._b1, w2=self._w2, b2=self._b2,
+            classes=self.classes, size=np.int32(self.size))
+        os.replace(tmppath, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalDigitClassifier":
+        with np.load(path) as data:
+            model = cls(hidden=data["w1"].shape[1], size=int(data["size"]))
+            model._w1, model._b1 = data["w1"], data["b1"]
+            model._w2, model._b2 = data["w2"], data["b2"]
+            model.classes = data["classes"].astype(str)
+        return model
+
+
+def holdout_bucket(imgbytes: bytes) -> int:
+    """Bucket 0-99 of an image, fixed by its content"""
+    return int(image_digest(imgbytes)[:8], 16) % 100
+
+
+def split_corpus(
+        images: Sequence[bytes],
+        labels: Sequence[str],
+        holdout: float) -> Tuple[list, list, list, list]:
+    """Split into train and holdout sets by each image's content, so an image
+    stays on the same side however the corpus grows"""
+    cut = int(holdout * 100)
+    train_x, train_y, test_x, test_y = [], [], [], []
+    for img, label in zip(images, labels):
+        if holdout_bucket(img) < cut:
+            test_x.append(img)
+            test_y.append(label)
+        else:
+            train_x.append(img)
+            train_y.append(label)
+    return train_x, train_y, test_x, test_y
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train or evaluate the local captcha digit classifier")
+    parser.add_argument("command", choices=["train", "eval"])
+    parser.add_argument("--images", default="captcha_img/", help="directory of saved captcha images")
+    parser.add_argument("--answers", default="logs/correct_ans.log", help="log of correct answers")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2,
+                        help="share of images kept back for evaluation, the same split for train and eval")
+    parser.add_argument("--all", action="store_true",
+                        help="evaluate on every image, including those the model was trained on")
+    parser.add_argument("--epochs", type=int, default=40)
+    args = parser.parse_args()
+
+    images, labels = load_corpus(args.images, args.answers)
+    print(f"Loaded {len(images)} labelled captchas")
+    if not images:
+        return
+
+    if args.command == "train":
+        train_x, train_y, test_x, test_y = split_corpus(images, labels, args.holdout)
+        model = LocalDigitClassifier().fit(train_x, train_y, epochs=args.epochs)
+        print(f"Training accuracy: {model.accuracy(train_x, train_y):.1%}")
+        if test_x:
+            print(f"Holdout accuracy:  {model.accuracy(test_x, test_y):.1%} on {len(test_x)} captchas")
+        model.save(args.model)
+        print(f"Saved model to {args.model}")
+    else:
+        model = LocalDigitClassifier.load(args.model)
+        if args.all:
+            print(f"Accuracy: {model.accuracy(images, labels):.1%} on all {len(images)} captchas")
+            return
+        _, _, test_x, test_y = split_corpus(images, labels, args.holdout)
+        if not test_x:
+            print("No holdout captchas to evaluate. Use --all to score every captcha")
+            return
+        print(f"Holdout accuracy: {model.accuracy(test_x, test_y):.1%} on {len(test_x)} captchas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+from http.cookiejar import Cookie, CookieJar
+from typing import Optional
+
+from requests.cookies import RequestsCookieJar, create_cookie
+
+from rocalert.services.filelock import FileLock
+
+_VERSION = 1
+
+
+def _cookie_to_dict(cookie: Cookie) -> dict:
+    return {
+        "name": cookie.name,
+        "value": cookie.value,
+        "domain": cookie.domain,
+        "path": cookie.path,
+        "secure": cookie.secure,
+        "expires": cookie.expires,
+        "port": cookie.port,
+        "discard": cookie.discard,
+        "rest": dict(cookie._rest),
+    }
+
+
+def _jar_to_list(cookiejar: CookieJar) -> list[dict]:
+    cookies = [_cookie_to_dict(x) for x in cookiejar]
+    cookies.sort(key=lambda x: (x["domain"], x["path"], x["name"]))
+    return cookies
+
+
+def _list_to_jar(cookies: list[dict]) -> RequestsCookieJar:
+    jar = RequestsCookieJar()
+    for cookie in cookies:
+        jar.set_cookie(create_cookie(**cookie))
+    return jar
+
+
+class CookieStore:
+    """Every session's cookie jar in one JSON file.
+
+    The file is read once, on first use. `update` only marks a jar dirty
+    when its cookies actually changed, and `save` writes nothing unless a
+    jar is dirty. Saving takes a file lock, merges the dirty jars into
+    what is on disk, so jars saved by other processes are kept, and moves
+    a temp file over the store.
+    """
+
+    def __init__(self, path: str, lock_timeout: Optional[float] = 30) -> None:
+        self._path = path
+        self._filelock = FileLock(path, timeout=lock_timeout)
+        self._lock = threading.Lock()
+        self._jars: Optional[dict[str, list[dict]]] = None
+        self._dirty: set[str] = set()
+        self.writes = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def dirty(self) -> bool:
+        with self._lock:
+            return len(self._dirty) > 0
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return list(self._loaded())
+
+    def load(self, name: str) -> Optional[RequestsCookieJar]:
+        """Cookie jar saved under name, None if there is none"""
+        with self._lock:
+            cookies = self._loaded().get(name)
+        return None if cookies is None else _list_to_jar(cookies)
+
+    def update(self, name: str, cookiejar: CookieJar) -> bool:
+        """Store a jar under name. Returns True if its cookies changed"""
+        cookies = _jar_to_list(cookiejar)
+        with self._lock:
+            jars = self._loaded()
+            if jars.get(name) == cookies:
+                return False
+            jars[name] = cookies
+            self._dirty.add(name)
+            return True
+
+    def save(self) -> int:
+        """Write the dirty jars to disk
+
+        Returns:
+            int: the number of jars written
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+            with self._filelock:
+                ondisk = self._read()
+                for name in self._dirty:
+                    ondisk[name] = self._jars[name]
+                self._write(ondisk)
+                written = len(self._dirty)
+                self._jars = ondisk
+                self._dirty.clear()
+                self.writes += 1
+                return written
+
+    def reload(self) -> None:
+        """Drop jars cached in memory, keeping unsaved ones"""
+        with self._lock:
+            ondisk = self._read()
+            for name in self._dirty:
+                ondisk[name] = self._jars[name]
+            self._jars = ondisk
+
+    def _loaded(self) -> dict[str, list[dict]]:
+        if self._jars is None:
+            self._jars = self._read()
+        return self._jars
+
+    def _read(self) -> dict[str, list[dict]]:
+        if not os.path.exists(self._path):
+            return {}
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cookie store {self._path}: {e}")
+            return {}
+        if data.get("version") != _VERSION:
+            print(f"Ignoring cookie store {self._path} from another version")
+            return {}
+        return data.get("jars", {})
+
+    def _write(self, jars: dict[str, list[dict]]) -> None:
+        dirname = os.path.dirname(self._path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        tmppath = self._path + ".tmp"
+        with open(tmppath, "w", encoding="utf-8") as f:
+            json.dump({"version": _VERSION, "jars": jars}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmppath, self._path)
@@ -1,9 +1,7 @@
 from collections import defaultdict, deque
-import io
 import random
 import time
 import numpy as np
-import PIL.Image
 import requests
 from typing import Callable, Deque, Iterable, List
 from threading import Thread, Lock, Event
@@ -11,6 +9,8 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from rocalert.captcha.captcha_logger import CaptchaLogger
 
 from rocalert.captcha.equation_solver import EquationSolver
+from rocalert.captcha.imagehashindex import ImageHashIndex
+from rocalert.captcha.imagestore import CaptchaImageStore
 from rocalert.roc_web_handler import Captcha, RocWebHandler
 from rocalert.rocaccount import BattlefieldTarget
 from rocalert.captcha.solvers.multicaptchaguisolver import MulticaptchaGUI
@@ -46,10 +46,11 @@ class SpyEvent:
             roc: RocWebHandler,
             userfilter: Callable,
             reversedorder: bool = True,
-            captcha_save_path: str = None,
+            image_store: CaptchaImageStore = None,
             captchalogger: CaptchaLogger = None,
             captcha_method: str = "manual",
-            solver: CaptchaSolverServiceABC = None
+            solver: CaptchaSolverServiceABC = None,
+            image_index: ImageHashIndex = None
             ) -> None:
         """_summary_
 
@@ -64,7 +65,7 @@ class SpyEvent:
                 parameter is not None or an empty list
         """
         self._captchalogger = captchalogger
-        self._captcha_save_path = captcha_save_path
+        self._image_store = image_store
         self._roc = roc
         self._targetfilter = userfilter
         self._reversedorder = reversedorder
@@ -73,6 +74,7 @@ class SpyEvent:
         self._battlefield = None
         self._captcha_method = captcha_method
         self._solver = solver
+        self._image_index = image_index
         
         self._updatecaptchaslock = Lock()
         self._captchaslock = Lock()
@@ -85,12 +87,9 @@ class SpyEvent:
         self._urlgenerator = ROCDecryptUrlGenerator()
 
     def _save_captcha(self, captcha: Captcha) -> None:
-        if self._captcha_save_path is None:
+        if self._image_store is None:
             return
-
-        img = PIL.Image.open(io.BytesIO(captcha.img))
-        path = self._captcha_save_path + captcha.hash + '.png'
-        img.save(path)
+        self._image_store.save(captcha.hash, captcha.img)
 
     def _log_captcha(self, captcha: Captcha) -> None:
         if self._captchalogger is None:
@@ -230,12 +229,11 @@ class SpyEvent:
             'submit': 'Recon'
         }
 
-        self._roclock.acquire()
-        valid_captcha = self._roc.submit_captcha_url(
+        resp = self._roc.submit_page(
             captcha, targeturl, payload, RocWebHandler.Pages.SPY)
 
-        text = self._roc.r.text
-        self._roclock.release()
+        valid_captcha = resp.captcha_correct
+        text = resp.text
 
         if self._captcha_method != "none":
             captcha.ans_correct = valid_captcha
@@ -299,7 +297,20 @@ class SpyEvent:
         print(f'Purged {count} captcha{"" if count == 1 else "s"}')
     
     def _solve_captcha(self, captcha: Captcha) -> None:
+        if self._image_index is not None:
+            match = self._image_index.lookup(captcha.img)
+            if match is not None:
+                captcha.ans = match.answer
+                return captcha.ans
         return self._solver.solve_captcha(captcha).ans
+
+    def _learn_captcha(self, captcha: Captcha) -> None:
+        if self._image_index is None or captcha.img is None:
+            return
+        if captcha.ans_correct:
+            self._image_index.add(captcha.img, captcha.ans, captcha.hash)
+        else:
+            self._image_index.reject(captcha.img, captcha.ans)
     
     def _handle_spying(self) -> None:
         last_user_skipped = False
@@ -348,6 +359,7 @@ class SpyEvent:
                         
                         if self._captcha_method != "none" and captcha:
                             self._log_captcha(captcha)
+                            self._learn_captcha(captcha)
                         
                         if spyres == 'success':
                             success_count += 1
@@ -374,6 +386,10 @@ class SpyEvent:
                     break
 
         print('Battlefield has been cleared')
+        if self._image_index is not None:
+            stats = self._image_index.stats()
+            print(f"Image index: {stats['hit_rate']:.0%} hit rate over "
+                  + f"{stats['lookups']} lookups, {stats['mean_lookup_ms']:.2f}ms each")
 
     def start_event(self) -> None:
         if not self._roc.is_logged_in():
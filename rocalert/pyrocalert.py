@@ -7,13 +7,14 @@ from .roc_settings import UserSettings
 from .roc_web_handler import RocWebHandler
 from .roc_web_handler import Captcha
 from .captcha.captcha_logger import CaptchaLogger
-from .cookiehelper import save_cookies_to_path, \
-    load_cookies_from_path, load_cookies_from_browser
+from .captcha.answerindex import CaptchaAnswerIndex
+from .captcha.imagehashindex import ImageHashIndex
+from .captcha.imagestore import CaptchaImageStore
+from .cookiehelper import load_cookies_from_path, load_cookies_from_browser
+from .cookiestore import CookieStore
 
 import rocalert.pages as pages
 import bs4
-import io
-import PIL.Image
 import time
 import datetime
 import random
@@ -21,6 +22,9 @@ from os.path import exists
 
 
 class RocAlert:
+    # Name of this account's jar in the cookie store
+    COOKIE_JAR = 'rocalert'
+
     def __init__(self,
                  rochandler: RocWebHandler = None,
                  usersettings: UserSettings = None,
@@ -30,6 +34,10 @@ class RocAlert:
                  generalLog: CaptchaLogger = None,
                  remoteCaptcha: RemoteCaptcha = None,
                  capsolver: CaptchaSolverServiceABC = None,
+                 answerIndex: CaptchaAnswerIndex = None,
+                 imageIndex: ImageHashIndex = None,
+                 imageStore: CaptchaImageStore = None,
+                 cookieStore: CookieStore = None,
                  ) -> None:
         if rochandler is None:
             raise Exception("An existing ROC Handler must be passed!")
@@ -49,10 +57,23 @@ class RocAlert:
         self.__failure_timeout = False
         self.__cooldown = False
         self._capsolver = capsolver
+        # Seconds a value read from an earlier page is trusted for
+        self.state_max_age = 5
 
+        # Pickled cookies from older versions, read if the store has none
         self.cookie_filename = 'cookies'
+        if cookieStore is None:
+            cookieStore = CookieStore('cookies.json')
+        self.cookie_store = cookieStore
         self.__useRemoteCatcha = True
         self.__remoteCaptcha = remoteCaptcha
+        self.__answerIndex = answerIndex
+        self.__imageIndex = imageIndex
+        if imageStore is None:
+            imageStore = CaptchaImageStore(
+                self.user_settings['captcha_save_path'],
+                pack=self.user_settings['pack_captcha_images'])
+        self.__imageStore = imageStore
 
     def __log(self, message: str, end=None, timestamp=True) -> None:
         if timestamp:
@@ -79,6 +100,23 @@ class RocAlert:
     def __get_img_captcha_ans(self, captcha: Captcha) -> str:
         self.__save_captcha(captcha)
 
+        if self.__answerIndex is not None:
+            ans = self.__answerIndex.lookup(captcha.hash)
+            if ans is not None:
+                self.__log(f'Found answer in local index: {ans}')
+                captcha.ans = ans
+                captcha.from_lookup = True
+                return captcha.ans
+
+        if self.__imageIndex is not None:
+            match = self.__imageIndex.lookup(captcha.img)
+            if match is not None:
+                self.__log('Found answer from similar image: {} ({:.0%} confidence)'.format(
+                    match.answer, match.confidence))
+                captcha.ans = match.answer
+                captcha.from_lookup = True
+                return captcha.ans
+
         if self.__useRemoteCatcha:
             res = self.__remoteCaptcha.lookup_remote(captcha)
             if res is not None and len(res) > 0:
@@ -86,6 +124,7 @@ class RocAlert:
                 res = res.split(':', 1)
                 if len(res) == 2:
                     captcha.ans = res[1]
+                    captcha.from_lookup = True
                     return captcha.ans
         try:
             self._capsolver.solve_captcha(captcha)
@@ -96,10 +135,7 @@ class RocAlert:
         return captcha.ans
 
     def __save_captcha(self, captcha: Captcha):
-        img = PIL.Image.open(io.BytesIO(captcha.img))
-        path = self.user_settings['captcha_save_path'] + captcha.hash + '.png'
-        img.save(path)
-        return path
+        self.__imageStore.save(captcha.hash, captcha.img)
 
     def __log_general(self, captcha: Captcha):
         if self.general_log is not None:
@@ -133,7 +169,9 @@ class RocAlert:
 
     def __sleep(self) -> None:
         waitTime = self.__get_waittime()
-        save_cookies_to_path(self.roc.get_cookies(), self.cookie_filename)
+        self.__save_cookies()
+        self.__log_stats()
+        self.__save_answer_index()
         endtime = datetime.datetime.now() + datetime.timedelta(0, waitTime)
         self.__log('Taking a nap. Waking up at {}.'.format(
             endtime.strftime('%H:%M:%S')))
@@ -143,6 +181,51 @@ class RocAlert:
             self.__log("Sleep interrupted by user. Exiting...")
             raise
 
+    def __log_stats(self) -> None:
+        self.__log_cache_stats()
+        self.__log_solver_stats()
+        self.__log_image_index_stats()
+
+    def __log_cache_stats(self) -> None:
+        if not hasattr(self.roc, 'cache_stats'):
+            return
+        stats = self.roc.cache_stats()
+        if stats['hits'] or stats['misses']:
+            self.__log('Page cache: {} hits, {} misses'.format(
+                stats['hits'], stats['misses']))
+
+    def __log_solver_stats(self) -> None:
+        if not hasattr(self._capsolver, 'stats'):
+            return
+        for name, solver in self._capsolver.stats().items():
+            self.__log('Solver {}: p50 {:.0f}ms, {:.0%} accurate, {:.0%} errors, {} solves'.format(
+                name, solver['p50_ms'], solver['accuracy'], solver['error_rate'],
+                solver['solves']))
+
+    def __log_image_index_stats(self) -> None:
+        if self.__imageIndex is None:
+            return
+        stats = self.__imageIndex.stats()
+        if stats['lookups']:
+            self.__log('Image index: {:.0%} hit rate over {} lookups, {:.2f}ms each'.format(
+                stats['hit_rate'], stats['lookups'], stats['mean_lookup_ms']))
+
+    def __save_cookies(self) -> None:
+        # Nothing is written unless the cookies changed since the last save
+        self.cookie_store.update(self.COOKIE_JAR, self.roc.get_cookies())
+        try:
+            self.cookie_store.save()
+        except (OSError, TimeoutError) as e:
+            self.__log(f'Error saving cookies: {e}')
+
+    def __save_answer_index(self) -> None:
+        if self.__answerIndex is None or not self.__answerIndex.dirty:
+            return
+        try:
+            self.__answerIndex.save()
+        except OSError as e:
+            self.__log(f'Error saving captcha answer index: {e}')
+
     def __attempt_login(self) -> bool:
         self.__log('Session timed out. ', end='')
         if self.__load_browser_cookies() and self.roc.is_logged_in():
@@ -170,7 +253,7 @@ class RocAlert:
         if res:
             self.consecutive_login_failures = 0
             self.__log("Login success.", timestamp=False)
-            save_cookies_to_path(self.roc.get_cookies(), self.cookie_filename)
+            self.__save_cookies()
         else:
             self.consecutive_login_failures += 1
             self.__log("Login failure.", timestamp=False)
@@ -180,7 +263,8 @@ class RocAlert:
         if captcha is None or captcha.img is None:
             return
 
-        if 'ERROR' not in captcha.ans:
+        # Only the solver's own answers can be reported back to it
+        if 'ERROR' not in captcha.ans and not captcha.from_lookup:
             try:
                 self._capsolver.report_captcha(captcha)
             except CaptchaReportException as e:
@@ -188,6 +272,16 @@ class RocAlert:
 
         if captcha.ans_correct:
             self.__log_correct(captcha)
+        if self.__answerIndex is not None:
+            if captcha.ans_correct:
+                self.__answerIndex.add(captcha.hash, captcha.ans)
+            else:
+                self.__answerIndex.discard(captcha.hash)
+        if self.__imageIndex is not None:
+            if captcha.ans_correct:
+                self.__imageIndex.add(captcha.img, captcha.ans, captcha.hash)
+            else:
+                self.__imageIndex.reject(captcha.img, captcha.ans)
         if captcha.ans_correct and self.__useRemoteCatcha:
             self.__remoteCaptcha.add_remote(captcha)
 
@@ -309,12 +403,14 @@ class RocAlert:
             failures.append(failure_msg)
         if self.consecutive_purchase_attempts >= max_fpa:
             self.consecutive_purchase_attempts = 0
-            failure_msg = f"Too many failed purchase attempts ({self.consecutive_purchase_attempts}/{max_fpa})! No longer attempting to purchase."
+            failure_msg = "Too many failed purchase attempts " \
+                + f"({self.consecutive_purchase_attempts}/{max_fpa})! No longer attempting to purchase."
             self.__log(f'Error: {failure_msg}')
             self.__purchase_error = True
         if self.consecutive_training_attempts >= max_fta:
             self.consecutive_training_attempts = 0
-            failure_msg = f"Too many failed training attempts ({self.consecutive_training_attempts}/{max_fta})! No longer attempting to train."
+            failure_msg = "Too many failed training attempts " \
+                + f"({self.consecutive_training_attempts}/{max_fta})! No longer attempting to train."
             self.__log(f'Error: {failure_msg}')
             self.__training_error = True
         if self.consecutive_cooldowns >= max_cdclears:
@@ -348,6 +444,13 @@ class RocAlert:
     def on_cooldown(self) -> bool:
         return self.__cooldown or self.roc.on_cooldown()
 
+    def __is_logged_in(self) -> bool:
+        # The cooldown check has usually just loaded a page that tells us
+        logged_in = self.roc.account_state.logged_in(self.state_max_age)
+        if logged_in is None:
+            logged_in = self.roc.is_logged_in()
+        return logged_in
+
     def handlecooldown(self) -> bool:
         if not self.on_cooldown():
             self.consecutive_cooldowns = 0
@@ -531,8 +634,8 @@ class RocAlert:
             return
 
         url = self.roc.url_generator.get_home() + '/base.php'
-        self.roc.go_to_page(url)
-        soup = bs4.BeautifulSoup(self.roc.r.text, 'lxml')
+        resp = self.roc.go_to_page(url)
+        soup = bs4.BeautifulSoup(resp.text, 'lxml')
         base = pages.RocBasePage(soup)
 
         self.__log('-------------Event Status--------------')
@@ -590,7 +693,7 @@ class RocAlert:
                 continue
 
             # if not logged in and login attempt fails, retry after a bit
-            if not self.roc.is_logged_in():
+            if not self.__is_logged_in():
                 self.__attempt_login()
                 continue
 
@@ -620,11 +723,12 @@ class RocAlert:
         return False
 
     def __load_cookies_file(self) -> bool:
-        if exists(self.cookie_filename):
-            self.__log("Loading saved cookies")
+        cookies = self.cookie_store.load(self.COOKIE_JAR)
+        if cookies is None and exists(self.cookie_filename):
             cookies = load_cookies_from_path(self.cookie_filename)
-            if cookies is not None:
-                self.roc.add_cookies(cookies)
-                time.sleep(0.25)
-                return True
+        if cookies is not None:
+            self.__log("Loading saved cookies")
+            self.roc.add_cookies(cookies)
+            time.sleep(0.25)
+            return True
         return False
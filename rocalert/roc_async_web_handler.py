@@ -0,0 +1,161 @@
+import httpx
+from bs4 import BeautifulSoup
+
+import rocalert.pages as pages
+from rocalert.roc_web_handler import (
+    _BS_PARSER,
+    _DEFAULT_HEADERS,
+    Captcha,
+    RocResponse,
+    RocWebHandler,
+)
+from rocalert.services.requestlogger import RequestLogWriter, get_default_writer
+from rocalert.services.urlgenerator import ROCUrlGenerator
+
+
+class AsyncRocWebHandler:
+    """asyncio counterpart of RocWebHandler.
+
+    Requests share one pooled httpx client, so a single event loop can keep
+    many requests in flight. Like the reentrant RocWebHandler, every method
+    works from its own response and no "last page" is kept.
+    """
+
+    Pages = RocWebHandler.Pages
+
+    def __init__(
+        self,
+        urlgenerator: ROCUrlGenerator,
+        default_headers: dict[str, str] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        timeout: float = 30,
+        transport: httpx.AsyncBaseTransport = None,
+        request_logger: RequestLogWriter = None,
+    ) -> None:
+        """
+        Args:
+            urlgenerator (ROCUrlGenerator): url generator for the ROC site
+            default_headers (dict[str, str], optional): request headers.
+                Defaults to a desktop chrome browser.
+            max_connections (int, optional): connection pool size.
+                Requests beyond this wait for a free connection.
+            max_keepalive_connections (int, optional): idle connections
+                kept open for reuse.
+            timeout (float, optional): per request timeout in seconds.
+            transport (httpx.AsyncBaseTransport, optional): transport override.
+                Defaults to an HTTP transport that retries failed connects.
+            request_logger (RequestLogWriter, optional): writer for submitted
+                requests. Defaults to the writer shared by the process.
+        """
+        self.headers = default_headers if default_headers else dict(_DEFAULT_HEADERS)
+        self._urlgenerator = urlgenerator
+        self._request_logger = request_logger
+
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(
+                retries=10,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                ),
+            )
+
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            timeout=timeout,
+            follow_redirects=True,
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncRocWebHandler":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    @staticmethod
+    def _to_rocresponse(resp: httpx.Response) -> RocResponse:
+        return RocResponse(str(resp.url), resp.status_code, resp.text)
+
+    async def go_to_page(self, url: str) -> RocResponse:
+        resp = await self.client.get(url)
+        return self._to_rocresponse(resp)
+
+    async def _post(self, url: str, payload: dict) -> RocResponse:
+        resp = await self.client.post(url, data=payload)
+        return self._to_rocresponse(resp)
+
+    async def get_imgcap_from_hash(self, hash: str) -> bytes:
+        imgurl = self._urlgenerator.get_home() + "/img.php?hash=" + hash
+        resp = await self.client.get(imgurl)
+        return resp.content
+
+    async def get_url_img_captcha(self, url: str) -> Captcha:
+        if url is None:
+            return None
+
+        resp = await self.go_to_page(url)
+        hash = resp.captcha_hash
+
+        if hash is None:
+            return None
+
+        img = await self.get_imgcap_from_hash(hash)
+        return Captcha(hash, img, captype=resp.captcha_type)
+
+    async def get_img_captcha(self, page: str) -> Captcha:
+        if page is None:
+            return None
+
+        return await self.get_url_img_captcha(self._urlgenerator.get_page_url(page))
+
+    async def is_logged_in(self) -> bool:
+        resp = await self.go_to_page(self._urlgenerator.get_home())
+        return resp.logged_in
+
+    async def login(self, email: str, password: str) -> bool:
+        payload = {"email": email, "password": password}
+        resp = await self._post(self._urlgenerator.get_login(), payload)
+        return "<form action=\"login.php\" method=\"post\">" not in resp.text
+
+    def add_cookies(self, cookies) -> None:
+        for cookie in cookies:
+            self.client.cookies.jar.set_cookie(cookie)
+
+    def get_cookies(self):
+        return self.client.cookies.jar
+
+    async def submit_page(
+        self, captcha: Captcha | None, url: str, payload: dict = None, manual_page: str = None
+    ) -> RocResponse:
+        ans = None if captcha is None else captcha.ans
+        payload = RocWebHandler._create_captcha_payload(captcha, ans, manual_page, payload)
+
+        self._log_request(url, payload, self.headers)
+
+        return await self._post(url, payload)
+
+    async def submit_captcha_url(
+        self, captcha: Captcha | None, url: str, payload: dict = None, manual_page: str = None
+    ) -> bool:
+        resp = await self.submit_page(captcha, url, payload, manual_page)
+        return resp.captcha_correct
+
+    async def get_attack_page(self, target_id) -> pages.RocAttackPage:
+        resp = await self.go_to_page(self._urlgenerator.get_attack(target_id))
+        soup = BeautifulSoup(resp.text, _BS_PARSER)
+        return pages.RocAttackPage(soup)
+
+    @property
+    def url_generator(self) -> ROCUrlGenerator:
+        return self._urlgenerator
+
+    def _log_request(self, url: str, payload: dict, headers: dict):
+        logger = self._request_logger
+        if logger is None:
+            logger = get_default_writer()
+        logger.log_request(url, payload, headers)
@@ -9,12 +9,18 @@ from ._settings import (
     time_conv,
 )
 
-VALID_CAPTCHA_SERVICES = {"none", "twocaptcha", "2captcha", "true captcha", "truecaptcha", "rocapi", "ai"}
+VALID_CAPTCHA_SERVICES = {"none", "twocaptcha", "2captcha", "true captcha", "truecaptcha", "rocapi", "ai", "local"}
 
 
 def is_valid_captcha_service(service: str) -> bool:
     cleaned_service = service.lower().strip()
 
+    if "," in cleaned_service:
+        return all(
+            x.strip() in VALID_CAPTCHA_SERVICES and x.strip() != "none"
+            for x in cleaned_service.split(",")
+        )
+
     return service in VALID_CAPTCHA_SERVICES or is_negative_string(cleaned_service)
 
 
@@ -174,6 +180,61 @@ class UserSettings(Settings):
             int,
             "Number of minutes to wait before retrying after an unhandled exception",
         ),
+        "page_cache_ttl_secs": Setting(
+            "Page cache lifetime (seconds)",
+            "page_cache_ttl_secs",
+            0,
+            float,
+            "Seconds to reuse a loaded page instead of fetching it again. 0 to disable",
+        ),
+        "pack_captcha_images": Setting(
+            "Pack captcha images",
+            "pack_captcha_images",
+            False,
+            bool,
+            "Append saved captcha images to one pack file instead of a file each",
+        ),
+        "captcha_log_format": Setting(
+            "Captcha log format",
+            "captcha_log_format",
+            "text",
+            str,
+            "Format of the captcha answer logs: text or csv",
+            "text",
+            lambda x: x.lower().strip() in ("text", "csv"),
+        ),
+        "captcha_min_confidence": Setting(
+            "Captcha answer confidence",
+            "captcha_min_confidence",
+            0.9,
+            float,
+            "Confidence an answer needs before other solvers stop being waited on",
+        ),
+        "captcha_race_timeout": Setting(
+            "Captcha race timeout",
+            "captcha_race_timeout",
+            0.0,
+            float,
+            "Seconds to wait for a confident captcha answer. 0 waits for every solver",
+            0.0,
+            lambda x: x >= 0,
+        ),
+        "captcha_solver_strategy": Setting(
+            "Captcha solver strategy",
+            "captcha_solver_strategy",
+            "race",
+            str,
+            "How to use several captcha services: race or adaptive",
+            "race",
+            lambda x: x.lower().strip() in ("race", "adaptive"),
+        ),
+        "captcha_cost_weight": Setting(
+            "Captcha cost weight",
+            "captcha_cost_weight",
+            0.0,
+            float,
+            "Seconds of solve time worth one unit of solver cost when routing adaptively",
+        ),
     }
 
     def __init__(self, name: str = None, filepath=None) -> None:
@@ -1,23 +1,53 @@
+import dataclasses
 import datetime
 from http.client import RemoteDisconnected
-import json
+import threading
+import time
 
 import requests
 from bs4 import BeautifulSoup
 from urllib3 import Retry
 
 import rocalert.pages as pages
+import rocalert.services.requestlogger as requestlogger
+from rocalert.accountstate import AccountState
 from rocalert.services.urlgenerator import ROCUrlGenerator
 
 from .captcha.pyroccaptchaselector import ROCCaptchaSelector
 
 _BS_PARSER = "lxml"
 
+_MAX_CACHED_PAGES = 256
+
+_DEFAULT_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml"
+    + ";q=0.9,image/avif,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Connection": "keep-alive",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "same-origin",
+    "Sec-Fetch-User": "?1",
+    "TE": "trailers",
+    "Upgrade-Insecure-Requests": "1",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    + "AppleWebKit/537.36 (KHTML, like Gecko) "
+    + "Chrome/114.0.0.0 Safari/537.36",
+}
+
 
 def __generate_useragent():
     pass
 
 
+def _find_between(text: str, start: str, end: str, maxlen: int = 100) -> str:
+    index = text.find(start)
+    if index == -1:
+        return None
+    endIndex = text.find(end, index, index + maxlen)
+    return text[index + len(start) : endIndex]
+
+
 class Captcha:
     class CaptchaType:
         TEXT = "text"
@@ -40,6 +70,11 @@ class Captcha:
         self._ans = ans
         self._ans_correct = correct
         self._type = captype
+        # Solver's confidence in ans from 0 to 1, None if it gave none
+        self._confidence = None
+        # True if ans was looked up instead of coming from a solver, so
+        # there is nothing to report back to the solver
+        self._from_lookup = False
 
         if creation_date is None:
             self._creationdate = datetime.datetime.now()
@@ -62,6 +97,22 @@ class Captcha:
     def ans(self, value: str):
         self._ans = value
 
+    @property
+    def confidence(self) -> float:
+        return self._confidence
+
+    @confidence.setter
+    def confidence(self, value: float):
+        self._confidence = value
+
+    @property
+    def from_lookup(self) -> bool:
+        return self._from_lookup
+
+    @from_lookup.setter
+    def from_lookup(self, value: bool):
+        self._from_lookup = value
+
     @property
     def ans_correct(self):
         return self._ans_correct
@@ -87,6 +138,79 @@ class Captcha:
         return self.age >= Captcha.EXPIRATION_AGE
 
 
+@dataclasses.dataclass(frozen=True)
+class RocResponse:
+    """Snapshot of a single page load.
+
+    Every property is derived from this response alone, so a response can be
+    handed between threads without depending on the handler's last page.
+    """
+
+    url: str
+    status_code: int
+    text: str
+
+    @classmethod
+    def from_response(cls, resp: requests.Response) -> "RocResponse":
+        return cls(resp.url, resp.status_code, resp.text)
+
+    @property
+    def captcha_type(self) -> str:
+        if "cooldown" in self.url:
+            return Captcha.CaptchaType.TEXT
+        if "[click the correct number to proceed]" in self.text:
+            return Captcha.CaptchaType.IMAGE
+        if "<h1>What is" in self.text:
+            return Captcha.CaptchaType.EQUATION
+        return None
+
+    @property
+    def captcha_hash(self) -> str:
+        return _find_between(self.text, "img.php?hash=", '"')
+
+    @property
+    def equation(self) -> str:
+        equation = _find_between(self.text, "<h1>What is", "</h1>")
+        if equation is None:
+            return None
+        return equation.strip()[:-1]
+
+    @property
+    def on_cooldown(self) -> bool:
+        return self.captcha_type == Captcha.CaptchaType.TEXT
+
+    def _clock_bar_value(self, spanid: str) -> int:
+        valuestr = _find_between(self.text, f'<span id="{spanid}">', r"</span>")
+        if valuestr is None:
+            return None
+        return int(valuestr.strip().replace(",", ""))
+
+    @property
+    def gold(self) -> int:
+        return self._clock_bar_value("s_gold")
+
+    @property
+    def rank(self) -> int:
+        return self._clock_bar_value("s_rank")
+
+    @property
+    def turns(self) -> int:
+        return self._clock_bar_value("s_turns")
+
+    @property
+    def captcha_correct(self) -> bool:
+        return not (
+            "Wrong number" in self.text
+            or "wrong number" in self.text
+            or "You hit the wrong number. " in self.text
+        )
+
+    @property
+    def logged_in(self) -> bool:
+        bad_strings = [r"login.php", r"<form action=\"login.php\" method=\"post\">"]
+        return not any(bad_string in self.text for bad_string in bad_strings)
+
+
 class RocWebHandler:
     class Pages:
         TRAINER = "roc_training"
@@ -103,78 +227,195 @@ class RocWebHandler:
         self,
         urlgenerator: ROCUrlGenerator,
         default_headers: dict[str, str] = None,
+        reentrant: bool = False,
+        request_logger: requestlogger.RequestLogWriter = None,
+        cache_ttl: float = 0,
+        account_state: AccountState = None,
     ) -> None:
+        """
+        Args:
+            urlgenerator (ROCUrlGenerator): url generator for the ROC site
+            default_headers (dict[str, str], optional): request headers.
+                Defaults to a desktop chrome browser.
+            reentrant (bool, optional): share this handler between threads.
+                The last response (`r`) is tracked per thread instead of
+                per handler. Defaults to False.
+            request_logger (RequestLogWriter, optional): writer for submitted
+                requests. Defaults to the writer shared by the process.
+            cache_ttl (float, optional): seconds a loaded page is reused for
+                repeat GETs of the same url. Any POST clears the cache and
+                captcha images are never cached. Defaults to 0 (disabled).
+            account_state (AccountState, optional): state updated from every
+                page loaded. Defaults to a new AccountState.
+        """
         if default_headers:
             self.headers = default_headers
         else:
-            self.headers = {
-                "Accept": "text/html,application/xhtml+xml,application/xml"
-                + ";q=0.9,image/avif,image/webp,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.5",
-                "Connection": "keep-alive",
-                "Sec-Fetch-Dest": "document",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-Site": "same-origin",
-                "Sec-Fetch-User": "?1",
-                "TE": "trailers",
-                "Upgrade-Insecure-Requests": "1",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                + "AppleWebKit/537.36 (KHTML, like Gecko) "
-                + "Chrome/114.0.0.0 Safari/537.36",
-            }
+            self.headers = dict(_DEFAULT_HEADERS)
 
         self._urlgenerator = urlgenerator
-        self.session = requests.Session()
-
+        self._request_logger = request_logger
+        self._reentrant = reentrant
+        self._local = threading.local()
+        self._sessionlock = threading.Lock()
+        self._r = None
+        self.session = self._create_session()
+
+        self._cache_ttl = cache_ttl
+        self._cache: dict[str, tuple[float, requests.Response]] = {}
+        self._cachelock = threading.Lock()
+        # Bumped by clear_cache, so GETs that were in flight across a POST
+        # do not cache or read state from a page loaded before it
+        self._cache_generation = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        self.account_state = account_state if account_state else AccountState()
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
         retry = Retry(connect=10, backoff_factor=0.5)
         adapter = requests.adapters.HTTPAdapter(max_retries=retry)
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-        self.r = None
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
-    def __check_for_bad_captcha(self):
-        return "cooldown" in self.r.url
+    @property
+    def reentrant(self) -> bool:
+        return self._reentrant
 
-    def go_to_page(self, url):
-        return self.__go_to_page(url)
+    @property
+    def r(self) -> requests.Response:
+        """Last response received. In reentrant mode this is the last
+        response received by the calling thread."""
+        if self._reentrant:
+            return getattr(self._local, "r", None)
+        return self._r
+
+    @r.setter
+    def r(self, resp: requests.Response) -> None:
+        if self._reentrant:
+            self._local.r = resp
+        else:
+            self._r = resp
+
+    def _reconnect(self, failed_session: requests.Session) -> None:
+        with self._sessionlock:
+            if self.session is not failed_session:
+                return
+            cookies = failed_session.cookies
+            session = self._create_session()
+            session.cookies.update(cookies)
+            self.session = session
+
+    def cache_stats(self) -> dict[str, int]:
+        with self._cachelock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "size": len(self._cache),
+            }
 
-    def __go_to_page(self, url) -> requests.Response:
+    def clear_cache(self) -> None:
+        with self._cachelock:
+            self._cache.clear()
+            self._cache_generation += 1
+
+    def _cache_lookup(self, url: str) -> requests.Response:
+        with self._cachelock:
+            entry = self._cache.get(url)
+            if entry is not None and time.monotonic() - entry[0] < self._cache_ttl:
+                self._cache_hits += 1
+                return entry[1]
+            self._cache.pop(url, None)
+            self._cache_misses += 1
+            return None
+
+    def _cache_store(self, url: str, resp: requests.Response, generation: int) -> None:
+        now = time.monotonic()
+        with self._cachelock:
+            if generation != self._cache_generation:
+                return
+            # Entries stay in the order they were stored, oldest first
+            self._cache.pop(url, None)
+            if len(self._cache) >= _MAX_CACHED_PAGES:
+                self._cache = {
+                    k: v for k, v in self._cache.items()
+                    if now - v[0] < self._cache_ttl
+                }
+            while len(self._cache) >= _MAX_CACHED_PAGES:
+                del self._cache[next(iter(self._cache))]
+            self._cache[url] = (now, resp)
+
+    def _get(self, url: str, bypass_cache: bool = False) -> requests.Response:
+        use_cache = self._cache_ttl > 0 and not bypass_cache
+        if use_cache:
+            resp = self._cache_lookup(url)
+            if resp is not None:
+                return resp
+
+        generation = self._cache_generation
+        resp = self._get_uncached(url)
+        if generation != self._cache_generation:
+            # Loaded before a POST that finished meanwhile
+            return resp
+        self._update_account_state(resp)
+        if use_cache and resp.status_code == 200:
+            self._cache_store(url, resp, generation)
+        return resp
+
+    def _get_uncached(self, url: str) -> requests.Response:
+        session = self.session
         try:
-            self.r = self.session.get(url, headers=self.headers, allow_redirects=True)
+            return session.get(url, headers=self.headers, allow_redirects=True)
         except RemoteDisconnected:
             print("Error: Session disconnected! Attempting to reconnect...")
-            cookies = self.session.cookies
-            self.session = requests.Session()
-            self.session.cookies.update(cookies)
-            self.r = self.session.get(url, headers=self.headers)
+            self._reconnect(session)
+            resp = self.session.get(url, headers=self.headers)
             print("Success!")
+            return resp
 
-        return self.r
+    def _update_account_state(self, resp: requests.Response) -> None:
+        if "img.php" in resp.url or resp.status_code != 200:
+            return
+        try:
+            self.account_state.update_from_response(RocResponse.from_response(resp))
+        except ValueError as e:
+            print(f"Error reading account state from {resp.url}: {e}")
 
-    def __page_captcha_type(self) -> str:
-        if self.__check_for_bad_captcha():
-            return Captcha.CaptchaType.TEXT
-        if "[click the correct number to proceed]" in self.r.text:
-            return Captcha.CaptchaType.IMAGE
-        if "<h1>What is" in self.r.text:
-            return Captcha.CaptchaType.EQUATION
-        return None
+    def _post(self, url: str, payload: dict) -> requests.Response:
+        resp = self.session.post(url, payload, headers=self.headers)
+        # Any submit can change what every page shows
+        self.clear_cache()
+        self._update_account_state(resp)
+        return resp
 
-    def __get_imagehash(self) -> str:
-        index = self.r.text.find("img.php?hash=")
-        if index == -1:
-            return None
-        endIndex = self.r.text.find('"', index, index + 100)
-        imghash = self.r.text[index + len("img.php?hash=") : endIndex]
-        return imghash
+    def go_to_page(self, url, bypass_cache: bool = False):
+        return self.__go_to_page(url, bypass_cache)
+
+    def __go_to_page(self, url, bypass_cache: bool = False) -> requests.Response:
+        resp = self._get(url, bypass_cache)
+        self.r = resp
+        return resp
+
+    def fetch_page(self, url: str, bypass_cache: bool = False) -> RocResponse:
+        """Load a page without touching the handler's last response"""
+        return RocResponse.from_response(self._get(url, bypass_cache))
+
+    def __page_captcha_type(self, resp: requests.Response) -> str:
+        return RocResponse.from_response(resp).captcha_type
+
+    def __get_imagehash(self, resp: requests.Response) -> str:
+        return _find_between(resp.text, "img.php?hash=", '"')
 
     def get_url_img_captcha(self, url: str) -> Captcha:
         if url is None:
             return None
 
-        self.__go_to_page(url)
-        cap_type = self.__page_captcha_type()
-        hash = self.__get_imagehash()
+        # The captcha shown is only valid for the latest load of the page
+        resp = self.__go_to_page(url, bypass_cache=True)
+        cap_type = self.__page_captcha_type(resp)
+        hash = self.__get_imagehash(resp)
 
         if hash is None:
             return None
@@ -186,60 +427,46 @@ class RocWebHandler:
         if page is None:
             return None
 
-        self.__go_to_page(self._urlgenerator.get_page_url(page))
-        cap_type = self.__page_captcha_type()
-        hash = self.__get_imagehash()
+        return self.get_url_img_captcha(self._urlgenerator.get_page_url(page))
 
-        if hash is None:
+    def get_equation_captcha(self, resp: RocResponse = None) -> Captcha:
+        if resp is None:
+            resp = RocResponse.from_response(self.r)
+        equation = resp.equation
+        if equation is None:
             return None
-
-        img = self.__get_captcha_image(hash)
-
-        return Captcha(hash, img, captype=cap_type)
-
-    def get_equation_captcha(self) -> Captcha:
-        index = self.r.text.find("<h1>What is")
-        if index == -1:
-            return None
-        endIndex = self.r.text.find("</h1>", index, index + 100)
-        equation = self.r.text[index + len("<h1>What is") : endIndex]
-        equation = equation.strip()[:-1]
         return Captcha(equation, None, captype=Captcha.CaptchaType.EQUATION)
 
     def __get_captcha_image(self, hash):
         imgurl = self._urlgenerator.get_home() + "/img.php?hash=" + hash
 
-        img = self.__go_to_page(imgurl).content
+        img = self.__go_to_page(imgurl, bypass_cache=True).content
         return img
 
     def is_logged_in(self) -> bool:
-        self.__go_to_page(self._urlgenerator.get_home())
-        text = self.r.text
-        
-        bad_strings = [r"login.php", r"<form action=\"login.php\" method=\"post\">"]
-        
-        return not any(bad_string in text for bad_string in bad_strings)
+        resp = self.__go_to_page(self._urlgenerator.get_home())
+        return RocResponse.from_response(resp).logged_in
 
     def login(self, email: str, password: str) -> bool:
         payload = {"email": email, "password": password}
-        self.r = self.session.post(
-            self._urlgenerator.get_login(), payload, headers=self.headers
-        )
-        return "<form action=\"login.php\" method=\"post\">" not in self.r.text
+        resp = self._post(self._urlgenerator.get_login(), payload)
+        self.r = resp
+        return "<form action=\"login.php\" method=\"post\">" not in resp.text
 
     def detailed_login(self, email: str, password: str) -> bool:
         payload = {"email": email, "password": password}
-        self.r = self.session.post(
-            self._urlgenerator.get_login(), payload, headers=self.headers
-        )
-        if r"Incorrect login" in self.r.text:
+        resp = self._post(self._urlgenerator.get_login(), payload)
+        self.r = resp
+        if r"Incorrect login" in resp.text:
             return "incorrect_login"
-        if r"email@address.com" in self.r.text:
+        if r"email@address.com" in resp.text:
             return "general_failure"
         return "success"
 
     def add_cookies(self, cookies) -> None:
         self.session.cookies.update(cookies)
+        # Pages cached under the old cookies may show a logged out session
+        self.clear_cache()
 
     def get_cookies(self):
         return self.session.cookies
@@ -249,47 +476,64 @@ class RocWebHandler:
 
     def submit_equation(self, captcha: Captcha, page: str = "roc_recruit") -> bool:
         payload = {"flagInput": str(captcha.ans), "flagSubmit": "Submit"}
-        self.r = self.session.post(
-            self._urlgenerator.get_page_url(page),
-            payload,
-            headers=self.headers,
-        )
+        resp = self._post(self._urlgenerator.get_page_url(page), payload)
+        self.r = resp
 
-        return self.__page_captcha_type() == Captcha.CaptchaType.IMAGE
+        return self.__page_captcha_type(resp) == Captcha.CaptchaType.IMAGE
 
-    def _check_incorrect_captcha(self) -> bool:
-        return not (
-            "Wrong number" in self.r.text
-            or "wrong number" in self.r.text
-            or "You hit the wrong number. " in self.r.text
-        )
+    def _check_incorrect_captcha(self, resp: requests.Response = None) -> bool:
+        if resp is None:
+            resp = self.r
+        return RocResponse.from_response(resp).captcha_correct
 
-    def submit_captcha_url(
-        self, captcha: Captcha | None, url: str, payload: dict = None, manual_page: str = None
-    ) -> bool:
+    @staticmethod
+    def _create_captcha_payload(
+        captcha: Captcha | None, ans: str, page: str, payload: dict = None
+    ) -> dict:
         if payload is None:
             payload = {}
 
         if captcha is not None:
-            payload["captcha"] = captcha.hash
-            if manual_page:
-                x, y = ROCCaptchaSelector().get_xy_static(captcha.ans, manual_page)
+            if page:
+                x, y = ROCCaptchaSelector().get_xy_static(ans, page)
             else:
                 x, y = 0, 0
+            payload["captcha"] = captcha.hash
             payload["coordinates[x]"] = x
             payload["coordinates[y]"] = y
-        # payload["manualcaptcha"] = captcha.ans if not manual_page else ""
-        # if manual_page:
-        #     payload["num"] = captcha.ans
-            payload["num"] = captcha.ans
+            payload["num"] = ans
         else:
-            extra_payload = RocWebHandler.get_page_submit(manual_page)
+            extra_payload = RocWebHandler.get_page_submit(page)
             payload = {**payload, **extra_payload}
-            
+
+        return payload
+
+    def submit_page(
+        self, captcha: Captcha | None, url: str, payload: dict = None, manual_page: str = None
+    ) -> RocResponse:
+        """Submit a captcha to a url and return the resulting page.
+
+        Unlike `submit_captcha_url` the handler's last response is left
+        untouched, so the result is safe to use from any thread.
+        """
+        ans = None if captcha is None else captcha.ans
+        payload = self._create_captcha_payload(captcha, ans, manual_page, payload)
+
+        self._log_request(url, payload, self.headers)
+
+        return RocResponse.from_response(self._post(url, payload))
+
+    def submit_captcha_url(
+        self, captcha: Captcha | None, url: str, payload: dict = None, manual_page: str = None
+    ) -> bool:
+        ans = None if captcha is None else captcha.ans
+        payload = self._create_captcha_payload(captcha, ans, manual_page, payload)
+
         self._log_request(url, payload, self.headers)
 
-        self.r = self.session.post(url, payload, headers=self.headers)
-        return self._check_incorrect_captcha()
+        resp = self._post(url, payload)
+        self.r = resp
+        return self._check_incorrect_captcha(resp)
 
     def get_page_submit(page: str) -> str:
         if page == "roc_training":
@@ -313,72 +557,60 @@ class RocWebHandler:
     def submit_captcha(
         self, captcha: Captcha | None, ans: str, page: str, payload: dict = None, get_page: bool = False
     ) -> bool:
-        if captcha is not None:
-            cs = ROCCaptchaSelector()
-            x, y = cs.get_xy_static(ans, page)
-            if payload is None:
-                payload = {}
-
-            payload["captcha"] = captcha.hash
-            payload["coordinates[x]"] = x
-            payload["coordinates[y]"] = y
-            # payload["manualcaptcha"] = ""
-            payload["num"] = ans
-        else:
-            extra_payload = RocWebHandler.get_page_submit(page)
-            payload = {**payload, **extra_payload}
+        payload = self._create_captcha_payload(captcha, ans, page, payload)
 
         url = self._urlgenerator.get_page_url(page)
-        
+
         self._log_request(url, payload, self.headers)
 
-        self.r = self.session.post(
-            url, payload, headers=self.headers
-        )
+        resp = self._post(url, payload)
+        self.r = resp
 
         if get_page:
-            return self.r.text
+            return resp.text
 
-        return self._check_incorrect_captcha()
+        return self._check_incorrect_captcha(resp)
 
     def get_imgcap_from_hash(self, hash: str) -> bytes:
         return self.__get_captcha_image(hash)
 
     def recruit_has_captcha(self) -> str:
-        self.__go_to_page(self._urlgenerator.get_recruit())
-        return self.__page_captcha_type()
+        resp = self.__go_to_page(self._urlgenerator.get_recruit())
+        return self.__page_captcha_type(resp)
 
     def get_recruit_page(self, raw_text: bool = False) -> pages.RocRecruitPage | str:
-        self.__go_to_page(self._urlgenerator.get_recruit())
+        resp = self.__go_to_page(self._urlgenerator.get_recruit())
         if raw_text:
-            return self.r.text
+            return resp.text
 
-        soup = BeautifulSoup(self.r.text, _BS_PARSER)
+        soup = BeautifulSoup(resp.text, _BS_PARSER)
         return pages.RocRecruitPage(soup)
 
-    def current_gold(self) -> int:
+    def current_gold(self, resp: requests.Response = None) -> int:
+        if resp is None:
+            resp = self.r
         try:
-            searchitem = r'<span id="s_gold">'
-            index = self.r.text.index(searchitem)
-            endIndex = self.r.text.find(r"</span>", index, index + 100)
-            goldstr = self.r.text[index + len(searchitem) : endIndex]
-            return int(goldstr.strip().replace(",", ""))
+            gold = RocResponse.from_response(resp).gold
+            if gold is None:
+                raise ValueError("Gold not found on page")
+            return gold
         except Exception as e:
             print(f"Error: {e}")
-            # save self.r.text to a file, wite timestamp
+            # save the page text to a file, wite timestamp
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
             with open(f"error_{timestamp}.html", "w") as f:
                 print(f"Saving error to file: error_{timestamp}.html")
-                f.write(self.r.text)
+                f.write(resp.text)
             raise e
 
     def reset_cooldown(self) -> None:
         addition = r"/cooldown.php?delete=strike"
-        self.__go_to_page(self._urlgenerator.get_home() + addition)
+        self.__go_to_page(self._urlgenerator.get_home() + addition, bypass_cache=True)
+        self.clear_cache()
 
     def on_cooldown(self) -> bool:
-        self.go_to_armory()
-        return self.__page_captcha_type() == Captcha.CaptchaType.TEXT
+        resp = self.__go_to_page(self._urlgenerator.get_armory())
+        return self.__page_captcha_type(resp) == Captcha.CaptchaType.TEXT
 
     def go_to_armory(self) -> None:
         self.__go_to_page(self._urlgenerator.get_armory())
@@ -392,31 +624,31 @@ class RocWebHandler:
     def get_response(self) -> requests.Response:
         return self.r
 
-    def get_page_captcha_type(self, url) -> str:
-        self.__go_to_page(url)
-        return self.__page_captcha_type()
+    def get_page_captcha_type(self, url, bypass_cache: bool = False) -> str:
+        resp = self.__go_to_page(url, bypass_cache)
+        return self.__page_captcha_type(resp)
 
     def send_armory_order(self, payload: dict):
         pass
 
     def get_training_page(self) -> pages.RocTrainingPage:
-        self.go_to_training()
-        soup = BeautifulSoup(self.r.text, _BS_PARSER)
+        resp = self.__go_to_page(self._urlgenerator.get_training())
+        soup = BeautifulSoup(resp.text, _BS_PARSER)
         return pages.RocTrainingPage(soup)
 
     def get_armory_page(self) -> pages.RocArmoryPage:
-        self.go_to_armory()
-        soup = BeautifulSoup(self.r.text, _BS_PARSER)
+        resp = self.__go_to_page(self._urlgenerator.get_armory())
+        soup = BeautifulSoup(resp.text, _BS_PARSER)
         return pages.RocArmoryPage(soup)
 
     def get_keep_page(self) -> pages.RocKeepPage:
-        self.go_to_keep()
-        soup = BeautifulSoup(self.r.text, _BS_PARSER)
+        resp = self.__go_to_page(self._urlgenerator.get_keep())
+        soup = BeautifulSoup(resp.text, _BS_PARSER)
         return pages.RocKeepPage(soup)
 
     def get_attack_page(self, target_id) -> pages.RocAttackPage:
-        self.__go_to_page(self._urlgenerator.get_attack(target_id))
-        soup = BeautifulSoup(self.r.text, _BS_PARSER)
+        resp = self.__go_to_page(self._urlgenerator.get_attack(target_id))
+        soup = BeautifulSoup(resp.text, _BS_PARSER)
         return pages.RocAttackPage(soup)
 
     def start_key_repair(self) -> None:
@@ -426,10 +658,8 @@ class RocWebHandler:
     def url_generator(self) -> ROCUrlGenerator:
         return self._urlgenerator
 
-    def _log_request(self, url: str, payload: dict, headers: dict): 
-        current_day_timestamp = datetime.datetime.now().strftime("%Y-%m-%d")
-        current_timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        with open(f"logs/requests_{current_day_timestamp}.json", "a") as f:
-            f.write(json.dumps({"timestamp": current_timestamp, "url": url, "payload": payload, "headers": headers}, indent=2))
-            f.write("\n")
-            f.write("-" * 50)
\ No newline at end of file
+    def _log_request(self, url: str, payload: dict, headers: dict):
+        logger = self._request_logger
+        if logger is None:
+            logger = requestlogger.get_default_writer()
+        logger.log_request(url, payload, headers)
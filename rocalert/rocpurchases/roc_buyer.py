@@ -34,13 +34,22 @@ class ROCBuyer():
     def __init__(
             self,
             roc_handler: RocWebHandler,
-            buyersettings: BuyerSettings
+            buyersettings: BuyerSettings,
+            gold_max_age: float = 10,
             ) -> None:
         if roc_handler is None:
             raise Exception("Parameter roc_handler must not be None")
 
         self.roc = roc_handler
         self.buyersettings = buyersettings
+        self.gold_max_age = gold_max_age
+
+    def _current_gold(self) -> int:
+        # Gold from any recent page load is as good as re-reading the last
+        gold = self.roc.account_state.gold(self.gold_max_age)
+        if gold is None:
+            gold = self.roc.current_gold()
+        return gold
 
     def check_purchase_required(self, in_nightmode: bool = False) -> bool:
         if not self.buyersettings.buying_enabled():
@@ -49,7 +58,7 @@ class ROCBuyer():
         if in_nightmode:
             return True
 
-        gold = self.roc.current_gold()
+        gold = self._current_gold()
         return gold >= self.buyersettings.min_gold_to_buy()
 
     def __make_armory_order(self, gold) -> dict:
@@ -76,7 +85,7 @@ class ROCBuyer():
         return items
 
     def create_order_payload(self) -> dict:
-        gold = self.roc.current_gold()
+        gold = self._current_gold()
         order = self.__make_armory_order(gold)
 
         payload = BASE_ARMORY_PAYLOAD.copy()
@@ -1,5 +1,6 @@
 import abc
 
+from ..accountstate import AccountState
 from ..roc_settings import TrainerSettings
 from rocalert.rocpurchases.models import TrainingPurchaseModel
 import rocalert.pages as pages
@@ -267,9 +268,19 @@ class SimpleRocTrainer(ROCTrainerABC):
     def __init__(
             self,
             tsettings: TrainerSettings,
+            account_state: AccountState = None,
+            gold_max_age: float = 10,
             ) -> None:
         self._tsettings = tsettings
         self._converter = None
+        self._account_state = account_state
+        self._gold_max_age = gold_max_age
+
+    def _available_gold(self, tpage: pages.RocTrainingPage) -> int:
+        # The training page was just loaded, so its gold is the freshest
+        if tpage.gold is not None or self._account_state is None:
+            return tpage.gold
+        return self._account_state.gold(self._gold_max_age)
 
     def is_training_required(
             self,
@@ -279,7 +290,8 @@ class SimpleRocTrainer(ROCTrainerABC):
         if tpage is None or not self._tsettings.training_enabled:
             return False
 
-        if tpage.gold <= 0 or tpage.untrained_soldiers.count == 0:
+        if self._available_gold(tpage) <= 0 \
+                or tpage.untrained_soldiers.count == 0:
             return False
 
         if self._tsettings.min_training_size > tpage.untrained_soldiers.count:
@@ -296,11 +308,13 @@ class SimpleRocTrainer(ROCTrainerABC):
             ) -> TrainingPurchaseModel:
         pmod = TrainingPurchaseModel()
 
-        if tpage is None or tpage.gold == 0 \
-                or tpage.untrained_soldiers.count == 0:
+        if tpage is None:
+            return pmod
+
+        gold = self._available_gold(tpage)
+        if gold == 0 or tpage.untrained_soldiers.count == 0:
             return pmod
 
-        gold = tpage.gold
         if self._tsettings.match_soldiers_to_weapons:
             pmod = ROCTrainingWeaponMatchPurchaseCreator.create_purchase(
                 self._tsettings,
@@ -0,0 +1,104 @@
+import datetime
+from typing import List, Tuple
+
+import lxml.html
+
+from rocalert.rocaccount import BattlefieldTarget
+
+_PLAYERS_XPATH = (
+    ".//ul[contains(concat(' ', normalize-space(@class), ' '), ' players ')]"
+)
+
+
+def _cleanstr_to_int(num: str) -> int:
+    return int(num.strip().replace(",", ""))
+
+
+def _node_text(node) -> str:
+    if isinstance(node, str):
+        return node
+    return node.text_content()
+
+
+def _child_nodes(element) -> list:
+    """Children of an element including text, in document order"""
+    nodes = []
+    if element.text:
+        nodes.append(element.text)
+    for child in element:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+    return nodes
+
+
+class BattlefieldExtractor:
+    """Reads a battlefield page with lxml.
+
+    Builds BattlefieldTargets straight from XPath lookups on the player
+    list, giving the same results as walking a BeautifulSoup tree at a
+    fraction of the cost.
+    """
+
+    def __init__(self, pagetext: str) -> None:
+        root = lxml.html.fromstring(pagetext)
+        content = root.xpath(".//div[@id='content']")
+        if not content:
+            raise ValueError("Battlefield content not found")
+        self._content = content[0]
+
+    def _pagerange_text(self) -> str:
+        # Second node of the second node of the content, counting text
+        header = _child_nodes(self._content)[1]
+        return _node_text(_child_nodes(header)[1])
+
+    def page_range(self) -> Tuple[int, int]:
+        pairs = self._pagerange_text().strip().split(" of ")
+        lower = int(pairs[0].strip().split(" ")[1])
+        upper = int(pairs[1].strip().split(" ")[0])
+        return (lower, upper)
+
+    def user_count(self) -> int:
+        text = self._pagerange_text()
+        return _cleanstr_to_int(text[text.index("(") + 1: text.index(")")])
+
+    def page_count(self) -> int:
+        usercount = self.user_count()
+        return usercount // 50 if usercount % 50 == 0 else 1 + usercount // 50
+
+    def targets(self) -> List[BattlefieldTarget]:
+        players = self._content.xpath(_PLAYERS_XPATH)
+        if not players:
+            raise ValueError("Battlefield player list not found")
+
+        return [self._get_bftarget(player) for player in players[0].xpath("./*")]
+
+    @classmethod
+    def _get_bftarget(cls, player) -> BattlefieldTarget:
+        id = player.get("id").split("_")[1]
+
+        children = player.xpath("./div")
+
+        rank = _cleanstr_to_int(children[0].get("id").split("_")[1])
+        name_alli = children[1].xpath(".//a")
+        name = name_alli[0].text_content()
+        alliance = None if len(name_alli) <= 1 else name_alli[1].text_content()
+
+        tff_gold = children[2].xpath("./div")
+        tfftext = tff_gold[0].text_content().strip().split(" ")
+
+        tff = _cleanstr_to_int(tfftext[0])
+        tfftype = tfftext[1]
+
+        goldtext = tff_gold[1].text_content()
+        try:
+            gold = -1 if "?" in goldtext else _cleanstr_to_int(goldtext.strip().split()[0])
+        except Exception as e:
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            print(f"Error getting gold. saving html to error_{timestamp}.html: {e}")
+
+            with open(f"logs/error_{timestamp}.html", "w") as f:
+                f.write(lxml.html.tostring(player, encoding="unicode", pretty_print=True))
+            raise e
+
+        return BattlefieldTarget(id, rank, name, alliance, tff, tfftype, gold)
@@ -0,0 +1,480 @@
+import dataclasses
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from rocalert.roc_web_handler import RocWebHandler
+from rocalert.rocaccount import BattlefieldTarget
+from rocalert.services.rocwebservices import BattlefieldPageService
+
+# (id, rank, name, alliance, tff, tfftype, gold)
+TargetRecord = Tuple[str, int, str, str, int, str, int]
+
+
+def _to_record(target: BattlefieldTarget) -> TargetRecord:
+    return (
+        target.id, target.rank, target.name, target.alliance,
+        target.tff, target.tfftype, target.gold,
+    )
+
+
+def parse_page_records(pagetext: str, pagenum: int) -> Tuple[dict, float]:
+    """Parse a battlefield page into target records.
+
+    Runs in the parse pool, so it returns plain tuples that pickle cheaply
+    along with the seconds spent parsing.
+    """
+    start = time.perf_counter()
+    result = BattlefieldPageService.parse_page(pagetext, pagenum)
+    if result["response"] == "success":
+        result["result"] = [_to_record(x) for x in result["result"]]
+    return result, time.perf_counter() - start
+
+
+@dataclasses.dataclass
+class ScanStats:
+    pages: int = 0
+    errors: int = 0
+    retries: int = 0
+    steals: int = 0
+    # Summed over workers
+    fetch_seconds: float = 0
+    parse_seconds: float = 0
+    # Elapsed from the start of the scan
+    fetch_wall_seconds: float = 0
+    wall_seconds: float = 0
+    # From the first fetch worker running out of pages to the last download
+    tail_seconds: float = 0
+    page_latencies: List[float] = dataclasses.field(default_factory=list, repr=False)
+
+    def latency_percentile(self, percent: float) -> float:
+        if not self.page_latencies:
+            return 0
+        latencies = sorted(self.page_latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percent / 100))
+        return latencies[index]
+
+    def __str__(self) -> str:
+        return (
+            f"{self.pages} pages ({self.errors} errors, {self.retries} retries, "
+            f"{self.steals} steals) in {self.wall_seconds:.2f}s | "
+            f"fetch {self.fetch_seconds:.2f}s busy, done at {self.fetch_wall_seconds:.2f}s, "
+            f"tail {self.tail_seconds:.2f}s | "
+            f"page p50 {self.latency_percentile(50):.2f}s "
+            f"p95 {self.latency_percentile(95):.2f}s "
+            f"max {self.latency_percentile(100):.2f}s | "
+            f"parse {self.parse_seconds:.2f}s busy"
+        )
+
+
+@dataclasses.dataclass
+class _PageTask:
+    pagenum: int
+    attempt: int = 0
+    failed_sessions: frozenset = frozenset()
+
+
+class WorkStealingPageQueue:
+    """Page queue with one deque per fetch worker.
+
+    Workers take pages from the front of their own deque. A worker that
+    runs dry steals from the back of the longest deque. Failed pages are
+    handed to a worker on a session that has not failed them yet.
+    """
+
+    def __init__(self, pages: Iterable[int], worker_sessions: List[int]) -> None:
+        """
+        Args:
+            pages (Iterable[int]): page numbers to fetch
+            worker_sessions (List[int]): session index used by each worker
+        """
+        pages = list(pages)
+        self._worker_sessions = worker_sessions
+        self._session_count = len(set(worker_sessions))
+        self._queues = [deque() for _ in worker_sessions]
+        self._cond = threading.Condition()
+        self._pending = len(pages)
+        self.steals = 0
+
+        # Contiguous blocks, so steals take pages far from the owner's
+        blocksize = -(-len(pages) // len(self._queues)) if self._queues else 0
+        for i, pagenum in enumerate(pages):
+            self._queues[i // blocksize].append(_PageTask(pagenum))
+
+    def _eligible(self, task: _PageTask, worker: int) -> bool:
+        return self._worker_sessions[worker] not in task.failed_sessions \
+            or len(task.failed_sessions) >= self._session_count
+
+    def _steal(self, worker: int) -> _PageTask:
+        for victim in sorted(range(len(self._queues)), key=lambda x: -len(self._queues[x])):
+            queue = self._queues[victim]
+            for i in range(len(queue) - 1, -1, -1):
+                if self._eligible(queue[i], worker):
+                    task = queue[i]
+                    del queue[i]
+                    self.steals += 1
+                    return task
+        return None
+
+    def get(self, worker: int) -> _PageTask:
+        """Next page for a worker, None once every page is finished"""
+        with self._cond:
+            while True:
+                if self._queues[worker]:
+                    return self._queues[worker].popleft()
+                task = self._steal(worker)
+                if task is not None:
+                    return task
+                if self._pending == 0:
+                    return None
+                self._cond.wait()
+
+    def done(self) -> None:
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def retry(self, task: _PageTask, worker: int) -> None:
+        task = _PageTask(
+            task.pagenum,
+            task.attempt + 1,
+            task.failed_sessions | {self._worker_sessions[worker]},
+        )
+        with self._cond:
+            workers = [x for x in range(len(self._queues)) if self._eligible(task, x)]
+            target = min(workers, key=lambda x: len(self._queues[x]))
+            self._queues[target].append(task)
+            self._cond.notify_all()
+
+
+class StagedBattlefieldScanner:
+    """Scans battlefield pages in two stages.
+
+    Threads download the raw pages and hand the text to a process pool for
+    parsing, so parsing is not limited by the GIL. Each stage has its own
+    worker count and the time spent in each is kept in `stats`.
+
+    Every fetch worker sticks to one session, spreading workers evenly over
+    the sessions, and pages are scheduled through a WorkStealingPageQueue
+    so no worker idles while another still has a backlog.
+    """
+
+    def __init__(
+        self,
+        sessions: List[RocWebHandler],
+        fetch_workers: int = 10,
+        parse_workers: int = None,
+        parse_executor: Executor = None,
+        max_retries: int = 2,
+    ) -> None:
+        """
+        Args:
+            sessions (List[RocWebHandler]): logged in sessions to download with
+            fetch_workers (int, optional): download threads. Defaults to 10.
+            parse_workers (int, optional): parse processes.
+                Defaults to the number of CPUs.
+            parse_executor (Executor, optional): executor to parse with
+                instead of a new process pool. It is not shut down by close().
+            max_retries (int, optional): times a failed download is retried,
+                on another session when there is one. Defaults to 2.
+        """
+        self._sessions = list(sessions)
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.max_retries = max_retries
+        self._parse_executor = parse_executor
+        self._owns_executor = parse_executor is None
+        self._statslock = threading.Lock()
+        self.stats = ScanStats()
+
+    def __enter__(self) -> "StagedBattlefieldScanner":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._owns_executor and self._parse_executor is not None:
+            self._parse_executor.shutdown()
+            self._parse_executor = None
+
+    def _get_parse_executor(self) -> Executor:
+        if self._parse_executor is None:
+            self._parse_executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+        return self._parse_executor
+
+    def _fetch(self, session: RocWebHandler, pagenum: int) -> str:
+        resp = session.fetch_page(BattlefieldPageService.page_url(session, pagenum))
+        if resp.status_code != 200:
+            raise RuntimeError(f"Status code {resp.status_code}")
+        return resp.text
+
+    def _fetch_worker(
+        self,
+        worker: int,
+        session: RocWebHandler,
+        queue: WorkStealingPageQueue,
+        on_page: Callable[[int, str], None],
+        scan_start: float,
+    ) -> float:
+        """Fetch pages until the queue is finished. Returns when it went idle"""
+        stats = self.stats
+        while True:
+            task = queue.get(worker)
+            if task is None:
+                return time.perf_counter() - scan_start
+
+            start = time.perf_counter()
+            try:
+                text = self._fetch(session, task.pagenum)
+            except Exception as e:
+                retry = task.attempt < self.max_retries
+                with self._statslock:
+                    stats.fetch_seconds += time.perf_counter() - start
+                    if retry:
+                        stats.retries += 1
+                    else:
+                        stats.errors += 1
+                if retry:
+                    queue.retry(task, worker)
+                else:
+                    print(f"Exception loading page {task.pagenum}: {e}")
+                    queue.done()
+                continue
+
+            seconds = time.perf_counter() - start
+            with self._statslock:
+                stats.fetch_seconds += seconds
+                stats.page_latencies.append(seconds)
+            try:
+                on_page(task.pagenum, text)
+            except Exception as e:
+                print(f"Exception queueing page {task.pagenum} for parsing: {e}")
+                with self._statslock:
+                    stats.errors += 1
+            finally:
+                # Other workers wait in get() until every page is done
+                queue.done()
+
+    def scan(self, lower: int, upper: int) -> List[BattlefieldTarget]:
+        """Scan pages lower through upper, returning targets in page order"""
+        self.stats = stats = ScanStats()
+        scan_start = time.perf_counter()
+        parse_executor = self._get_parse_executor()
+        records = {}
+        parses = {}
+
+        def on_page(pagenum: int, text: str) -> None:
+            future = parse_executor.submit(parse_page_records, text, pagenum)
+            with self._statslock:
+                parses[future] = pagenum
+
+        pages = range(lower, upper + 1)
+        if not self._sessions:
+            print("No sessions available for battlefield scanning")
+            stats.errors = len(pages)
+            return []
+
+        workers = max(1, min(self.fetch_workers, len(pages)))
+        worker_sessions = [i % len(self._sessions) for i in range(workers)]
+        queue = WorkStealingPageQueue(pages, worker_sessions)
+
+        with ThreadPoolExecutor(max_workers=workers) as fetchpool:
+            idle_times = list(fetchpool.map(
+                lambda w: self._fetch_worker(
+                    w, self._sessions[worker_sessions[w]], queue, on_page, scan_start),
+                range(workers),
+            ))
+        stats.fetch_wall_seconds = time.perf_counter() - scan_start
+        stats.tail_seconds = stats.fetch_wall_seconds - min(idle_times)
+        stats.steals = queue.steals
+
+        for future in as_completed(parses):
+            pagenum = parses[future]
+            try:
+                result, seconds = future.result()
+            except Exception as e:
+                print(f"Exception parsing page {pagenum}: {e}")
+                stats.errors += 1
+                continue
+            stats.parse_seconds += seconds
+            if result["response"] == "success":
+                records[pagenum] = result["result"]
+                stats.pages += 1
+            else:
+                print(f'Error loading page {pagenum}: {result.get("error", "Unknown error")}')
+                stats.errors += 1
+
+        stats.wall_seconds = time.perf_counter() - scan_start
+
+        return [
+            BattlefieldTarget(*record)
+            for pagenum in sorted(records)
+            for record in records[pagenum]
+        ]
+
+
+def page_fingerprint(pagetext: str) -> bytes:
+    """Hash of the raw player list of a battlefield page"""
+    start = pagetext.find('<ul class="players"')
+    end = pagetext.find("</ul>", start) if start != -1 else -1
+    if start != -1 and end != -1:
+        pagetext = pagetext[start:end]
+    return hashlib.blake2b(pagetext.encode(), digest_size=16).digest()
+
+
+@dataclasses.dataclass(frozen=True)
+class PlayerDelta:
+    NEW = "new"
+    VANISHED = "vanished"
+    GOLD_UP = "gold_up"
+    GOLD_DOWN = "gold_down"
+    RANK_CHANGE = "rank_change"
+
+    kind: str
+    id: str
+    old: BattlefieldTarget | None
+    new: BattlefieldTarget | None
+
+    @property
+    def target(self) -> BattlefieldTarget:
+        return self.new if self.new is not None else self.old
+
+
+@dataclasses.dataclass
+class IncrementalScanStats:
+    pages_fetched: int = 0
+    pages_parsed: int = 0
+    pages_unchanged: int = 0
+    errors: int = 0
+
+
+class IncrementalBattlefieldScanner:
+    """Rescans the battlefield, parsing only pages that changed.
+
+    The player list of every page is fingerprinted. A page whose
+    fingerprint matches the last sweep is skipped, otherwise it is parsed
+    and compared player by player against the last known battlefield,
+    producing PlayerDeltas. Players that were last seen on a page in the
+    swept range and were not found again are reported as vanished once
+    the sweep finishes. A page that fails to load or parse keeps its last
+    snapshot, so its players are not reported as vanished.
+    """
+
+    def __init__(self, get_session: Callable[[], RocWebHandler] = None) -> None:
+        self._get_session = get_session
+        self._pages: dict[int, Tuple[bytes, List[str]]] = {}
+        self._players: dict[str, BattlefieldTarget] = {}
+        self._player_pages: dict[str, int] = {}
+        self._seen: set[str] = set()
+        self._swept_pages: set[int] = set()
+        self.stats = IncrementalScanStats()
+
+    @property
+    def targets(self) -> List[BattlefieldTarget]:
+        """Last known battlefield in rank order"""
+        return sorted(self._players.values(), key=lambda x: x.rank)
+
+    def page_targets(self, pagenum: int) -> List[BattlefieldTarget]:
+        """Players last seen on a page, in page order"""
+        page = self._pages.get(pagenum)
+        if page is None:
+            return []
+        return [self._players[id] for id in page[1] if id in self._players]
+
+    def begin_sweep(self) -> None:
+        self._seen = set()
+        self._swept_pages = set()
+        self.stats = IncrementalScanStats()
+
+    def keep_page(self, pagenum: int) -> None:
+        """Treat a page that could not be read as unchanged, so its players
+        are not reported as vanished"""
+        previous = self._pages.get(pagenum)
+        if previous is not None:
+            self._seen.update(previous[1])
+        self._swept_pages.add(pagenum)
+
+    def update_page(self, pagenum: int, pagetext: str) -> List[PlayerDelta]:
+        """Compare a freshly loaded page against the last snapshot"""
+        self.stats.pages_fetched += 1
+        fingerprint = page_fingerprint(pagetext)
+        previous = self._pages.get(pagenum)
+        if previous is not None and previous[0] == fingerprint:
+            self.stats.pages_unchanged += 1
+            self._seen.update(previous[1])
+            self._swept_pages.add(pagenum)
+            return []
+
+        try:
+            result = BattlefieldPageService.parse_page(pagetext, pagenum)
+        except Exception as e:
+            result = {"response": "error", "error": str(e)}
+        if result["response"] != "success":
+            self.stats.errors += 1
+            self.keep_page(pagenum)
+            return []
+        self.stats.pages_parsed += 1
+
+        deltas = []
+        for target in result["result"]:
+            old = self._players.get(target.id)
+            deltas.extend(self._compare(old, target))
+            self._players[target.id] = target
+            self._player_pages[target.id] = pagenum
+            self._seen.add(target.id)
+
+        self._pages[pagenum] = (fingerprint, [x.id for x in result["result"]])
+        self._swept_pages.add(pagenum)
+        return deltas
+
+    @staticmethod
+    def _compare(old: BattlefieldTarget, new: BattlefieldTarget) -> List[PlayerDelta]:
+        if old is None:
+            return [PlayerDelta(PlayerDelta.NEW, new.id, None, new)]
+
+        deltas = []
+        if new.gold > old.gold:
+            deltas.append(PlayerDelta(PlayerDelta.GOLD_UP, new.id, old, new))
+        elif new.gold < old.gold:
+            deltas.append(PlayerDelta(PlayerDelta.GOLD_DOWN, new.id, old, new))
+        if new.rank != old.rank:
+            deltas.append(PlayerDelta(PlayerDelta.RANK_CHANGE, new.id, old, new))
+        return deltas
+
+    def end_sweep(self, lower: int, upper: int) -> List[PlayerDelta]:
+        """Report players from pages lower through upper that were not seen"""
+        deltas = []
+        for id, pagenum in list(self._player_pages.items()):
+            if id in self._seen or not lower <= pagenum <= upper:
+                continue
+            deltas.append(PlayerDelta(PlayerDelta.VANISHED, id, self._players.pop(id), None))
+            del self._player_pages[id]
+        for pagenum in list(self._pages):
+            if lower <= pagenum <= upper and pagenum not in self._swept_pages:
+                del self._pages[pagenum]
+        return deltas
+
+    def sweep(self, lower: int, upper: int) -> Iterator[PlayerDelta]:
+        """Load pages lower through upper in order, yielding deltas as each
+        page is read so callers can react before the sweep finishes"""
+        self.begin_sweep()
+        for pagenum in range(lower, upper + 1):
+            session = self._get_session()
+            try:
+                resp = session.fetch_page(BattlefieldPageService.page_url(session, pagenum))
+            except Exception as e:
+                print(f"Exception loading page {pagenum}: {e}")
+                self.stats.errors += 1
+                self.keep_page(pagenum)
+                continue
+            yield from self.update_page(pagenum, resp.text)
+        yield from self.end_sweep(lower, upper)
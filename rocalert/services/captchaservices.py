@@ -1,16 +1,23 @@
 import abc
-import io
 import json
 import os
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Optional
 
-import PIL.Image
+import numpy as np
+
 from requests import Response
 
+from rocalert.captcha.imagestore import CaptchaImageStore
 from rocalert.captcha.solvers.rocapicaptchasolver import RocApiCaptchaSolver
 from rocalert.roc_web_handler import Captcha, RocWebHandler
 
 from ..captcha.solvers import TrueCaptchaSolver, TwoCaptchaSolver, manual_captcha_solve
+from ..captcha.solvers.localdigitsolver import DEFAULT_MODEL_PATH, LocalDigitClassifier
 
 
 class CaptchaSolveException(Exception):
@@ -115,6 +122,8 @@ def get_captcha_settings(captchaservice: str) -> Optional[dict]:
         filename = "truecaptcha_settings.json"
     elif captchaservice in ["rocapi", "ai"]:
         filename = "rocapi_settings.json"
+    elif captchaservice in ["local"]:
+        filename = "localsolver_settings.json"
     else:
         return None
 
@@ -146,6 +155,11 @@ def create_captcha_settings_file(captchaservice: str) -> None:
             "solve_url": "/api/v1/solve",
             "report_url": "/api/v1/feedback"
         }
+    elif captchaservice in ["local"]:
+        filename = "localsolver_settings.json"
+        settings = {
+            "model_path": DEFAULT_MODEL_PATH,
+        }
 
     with open(filename, "w") as f:
         f.write(json.dumps(settings, indent=4))
@@ -204,16 +218,17 @@ class TwocaptchaSolverService(CaptchaSolverServiceABC):
 
 class TrueCaptchaSolverService(CaptchaSolverServiceABC):
     def __init__(
-        self, userid: str, api_key: str, savepath="captchas/", mode="default"
+        self, userid: str, api_key: str, savepath="captchas/", mode="default",
+        image_store: CaptchaImageStore = None,
     ) -> None:
-        self._savepath = savepath
+        if image_store is None:
+            image_store = CaptchaImageStore(savepath)
+        self._image_store = image_store
         self._truecap = TrueCaptchaSolver(userid, api_key, mode=mode)
 
     def solve_captcha(self, captcha: Captcha) -> Captcha:
         try:
-            img = PIL.Image.open(io.BytesIO(captcha.img))
-            path = f"{self._savepath}/{captcha.hash}.png"
-            img.save(path)
+            self._image_store.save(captcha.hash, captcha.img)
 
             solver_result = self._truecap.solve(captcha)
             captcha.ans = solver_result["result"]
@@ -237,8 +252,350 @@ class RemoteCaptchaSolverService(CaptchaSolverServiceABC):
     def solve_captcha(self, captcha: Captcha) -> Captcha:
         res = self._rocapisolver.solve(captcha)
         captcha.ans = res[0]
+        captcha.confidence = res[1]
         return captcha
 
     def report_captcha(self, captcha: Captcha) -> None:
         self._rocapisolver.report(captcha.hash, captcha.ans_correct)
 
+
+class LocalCaptchaSolverService(CaptchaSolverServiceABC):
+    def __init__(self, model_path: str = DEFAULT_MODEL_PATH) -> None:
+        if not os.path.isfile(model_path):
+            raise CaptchaSolveException(
+                f"No local captcha model at {model_path}. Train one with "
+                + "python -m rocalert.captcha.solvers.localdigitsolver train")
+        self._model = LocalDigitClassifier.load(model_path)
+        self.reported = 0
+        self.reported_correct = 0
+
+    def solve_captcha(self, captcha: Captcha) -> Captcha:
+        if captcha is None or captcha.img is None:
+            raise CaptchaSolveException("Captcha has no image")
+        try:
+            captcha.ans, captcha.confidence = self._model.predict(captcha.img)
+        except Exception as e:
+            raise CaptchaSolveException(f"Error: {e}") from e
+        return captcha
+
+    def solve_batch(self, captchas: list[Captcha]) -> list[Captcha]:
+        """Solve several captchas in one pass through the model"""
+        if any(c is None or c.img is None for c in captchas):
+            raise CaptchaSolveException("Captcha has no image")
+        try:
+            predictions = self._model.predict_batch([c.img for c in captchas])
+        except Exception as e:
+            raise CaptchaSolveException(f"Error: {e}") from e
+        for captcha, (ans, confidence) in zip(captchas, predictions):
+            captcha.ans, captcha.confidence = ans, confidence
+        return captchas
+
+    def report_captcha(self, captcha: Captcha) -> None:
+        self.reported += 1
+        if captcha.ans_correct:
+            self.reported_correct += 1
+
+
+class RacingCaptchaSolverService(CaptchaSolverServiceABC):
+    """Sends each captcha to several solvers at once and keeps the first good answer.
+
+    An answer is good once its confidence reaches `min_confidence`. Solvers
+    that give no confidence count as `unrated_confidence`. If every solver
+    finishes without a good answer, the most confident valid one is used.
+    Slower solvers are left to finish in the background and their answers
+    are ignored. Only the solver whose answer was used hears the report.
+    """
+
+    _MAX_TRACKED = 1024
+
+    def __init__(
+            self,
+            solvers: list[CaptchaSolverServiceABC],
+            min_confidence: float = 0.9,
+            unrated_confidence: float = 1.0,
+            timeout: float = None) -> None:
+        if not solvers:
+            raise ValueError("At least one solver is required")
+        self._solvers = solvers
+        self._min_confidence = min_confidence
+        self._unrated_confidence = unrated_confidence
+        self._timeout = timeout
+        # Room for stragglers from earlier captchas still running
+        self._executor = ThreadPoolExecutor(
+            max_workers=4 * len(solvers), thread_name_prefix="captcha-race")
+        self._lock = threading.Lock()
+        self._winners: OrderedDict[str, CaptchaSolverServiceABC] = OrderedDict()
+        self._wins = defaultdict(int)
+
+    @staticmethod
+    def _solver_name(solver: CaptchaSolverServiceABC) -> str:
+        return type(solver).__name__
+
+    @staticmethod
+    def _valid_answer(captcha: Captcha) -> bool:
+        return captcha.ans is not None and captcha.ans not in ("", "-1")
+
+    def _confidence(self, captcha: Captcha) -> float:
+        if captcha.confidence is None:
+            return self._unrated_confidence
+        return captcha.confidence
+
+    @staticmethod
+    def _solve_copy(solver: CaptchaSolverServiceABC, captcha: Captcha) -> Captcha:
+        # Each solver writes its answer into its own copy
+        copy = Captcha(captcha.hash, captcha.img, captype=captcha.type,
+                       creation_date=captcha.creation_date)
+        solver.solve_captcha(copy)
+        return copy
+
+    def solve_captcha(self, captcha: Captcha) -> Captcha:
+        if captcha is None or captcha.img is None:
+            raise CaptchaSolveException("Captcha has no image")
+
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        pending = {
+            self._executor.submit(self._solve_copy, solver, captcha): solver
+            for solver in self._solvers
+        }
+        best, best_solver, errors = None, None, []
+
+        while pending:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                solver = pending.pop(future)
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    errors.append(f"{self._solver_name(solver)}: {e}")
+                    continue
+                if not self._valid_answer(answer):
+                    continue
+                if best is None or self._confidence(answer) > self._confidence(best):
+                    best, best_solver = answer, solver
+            if best is not None and self._confidence(best) >= self._min_confidence:
+                break
+
+        for future in pending:
+            future.cancel()
+
+        if best is None:
+            reason = "; ".join(errors) if errors else "no answer in time"
+            raise CaptchaSolveException(f"No solver answered: {reason}")
+
+        captcha.ans = best.ans
+        captcha.confidence = best.confidence
+        with self._lock:
+            self._winners[captcha.hash] = best_solver
+            while len(self._winners) > self._MAX_TRACKED:
+                self._winners.popitem(last=False)
+            self._wins[self._solver_name(best_solver)] += 1
+        return captcha
+
+    def report_captcha(self, captcha: Captcha) -> None:
+        with self._lock:
+            solver = self._winners.pop(captcha.hash, None)
+        if solver is not None:
+            solver.report_captcha(captcha)
+
+    def wins(self) -> dict[str, int]:
+        """Number of answers used from each solver"""
+        with self._lock:
+            return dict(self._wins)
+
+
+class SolverStats:
+    """Recent performance of one solver.
+
+    Latency percentiles come from the last `window` solves. Accuracy and
+    error rate are exponentially decayed so older results fade by `decay`
+    with each new one, starting from a weak optimistic prior.
+    """
+
+    def __init__(self, cost: float = 0.0, window: int = 200, decay: float = 0.95) -> None:
+        self.cost = cost
+        self._decay = decay
+        self._latencies = deque(maxlen=window)
+        # Decayed counts, seeded with one good result as the prior
+        self._correct = 1.0
+        self._reported = 1.0
+        self._errors = 0.0
+        self._attempts = 1.0
+
+        self.solves = 0
+        self.errors = 0
+        self.reports = 0
+        self.total_cost = 0.0
+        self.consecutive_errors = 0
+        self.backoff_until = 0.0
+
+    def record_solve(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+        self._errors *= self._decay
+        self._attempts = self._attempts * self._decay + 1
+        self.solves += 1
+        self.total_cost += self.cost
+        self.consecutive_errors = 0
+
+    def record_error(self, seconds: float, now: float, base_backoff: float, max_backoff: float) -> None:
+        self._latencies.append(seconds)
+        self._errors = self._errors * self._decay + 1
+        self._attempts = self._attempts * self._decay + 1
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.backoff_until = now + min(
+            base_backoff * 2 ** (self.consecutive_errors - 1), max_backoff)
+
+    def record_report(self, correct: bool) -> None:
+        self._correct = self._correct * self._decay + (1 if correct else 0)
+        self._reported = self._reported * self._decay + 1
+        self.reports += 1
+
+    @property
+    def accuracy(self) -> float:
+        return self._correct / self._reported
+
+    @property
+    def error_rate(self) -> float:
+        return self._errors / self._attempts
+
+    def latency(self, percentile: float = 50) -> float:
+        """Latency percentile in seconds, 0 before the first solve"""
+        if not self._latencies:
+            return 0.0
+        return float(np.percentile(self._latencies, percentile))
+
+    def expected_seconds(self, failure_penalty: float = 0.0) -> float:
+        """Expected seconds until a correct answer, retrying on failure
+
+        Args:
+            failure_penalty (float, optional): seconds lost to each failed
+                attempt on top of the solve, e.g. fetching a new captcha
+        """
+        success = max((1 - self.error_rate) * self.accuracy, 1e-3)
+        return self.latency(50) / success + failure_penalty * (1 - success) / success
+
+    def expected_cost(self) -> float:
+        success = (1 - self.error_rate) * self.accuracy
+        return self.cost / max(success, 1e-3)
+
+    def to_dict(self, now: float, failure_penalty: float = 0.0) -> dict:
+        return {
+            "p50_ms": 1000 * self.latency(50),
+            "p90_ms": 1000 * self.latency(90),
+            "p99_ms": 1000 * self.latency(99),
+            "accuracy": self.accuracy,
+            "error_rate": self.error_rate,
+            "solves": self.solves,
+            "errors": self.errors,
+            "reports": self.reports,
+            "total_cost": self.total_cost,
+            "expected_seconds": self.expected_seconds(failure_penalty),
+            "backoff_seconds": max(0.0, self.backoff_until - now),
+        }
+
+
+class AdaptiveCaptchaSolverService(CaptchaSolverServiceABC):
+    """Sends each captcha to the solver expected to get it right soonest.
+
+    A solver's score is its expected time to a correct answer: median
+    latency over its chance of success, plus `failure_penalty` seconds for
+    each expected failure. `cost_weight` adds seconds per unit of expected
+    cost.
+    Solvers that fail are backed off exponentially and skipped until the
+    backoff ends, and the next best solver is tried in the same call.
+    Untried solvers have no latency yet, so each is tried early on, and
+    `explore` is the chance of picking a random available solver instead.
+    """
+
+    _MAX_TRACKED = 1024
+
+    def __init__(
+            self,
+            solvers: dict[str, CaptchaSolverServiceABC],
+            costs: dict[str, float] = None,
+            cost_weight: float = 0.0,
+            failure_penalty: float = 2.0,
+            explore: float = 0.05,
+            base_backoff: float = 5,
+            max_backoff: float = 300,
+            decay: float = 0.95,
+            rng: random.Random = None) -> None:
+        if not solvers:
+            raise ValueError("At least one solver is required")
+        costs = costs or {}
+        self._solvers = solvers
+        self._stats = {
+            name: SolverStats(costs.get(name, 0.0), decay=decay) for name in solvers
+        }
+        self._cost_weight = cost_weight
+        self._failure_penalty = failure_penalty
+        self._explore = explore
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._answered_by: OrderedDict[str, str] = OrderedDict()
+
+    def _score(self, name: str) -> float:
+        stats = self._stats[name]
+        return stats.expected_seconds(self._failure_penalty) \
+            + self._cost_weight * stats.expected_cost()
+
+    def _ranked(self) -> list[str]:
+        """Solvers in the order to try them"""
+        now = time.monotonic()
+        with self._lock:
+            available = [x for x in self._solvers if self._stats[x].backoff_until <= now]
+            if not available:
+                # Everything is backing off, try whoever recovers first
+                return [min(self._solvers, key=lambda x: self._stats[x].backoff_until)]
+            ranked = sorted(available, key=self._score)
+            if len(ranked) > 1 and self._rng.random() < self._explore:
+                ranked.insert(0, ranked.pop(self._rng.randrange(1, len(ranked))))
+        return ranked
+
+    def solve_captcha(self, captcha: Captcha) -> Captcha:
+        errors = []
+        for name in self._ranked():
+            start = time.monotonic()
+            try:
+                self._solvers[name].solve_captcha(captcha)
+                failure = None if captcha.ans not in (None, "", "-1") else "no answer"
+            except CaptchaSolveException as e:
+                failure = str(e)
+            except Exception as e:
+                failure = f"Error: {e}"
+
+            end = time.monotonic()
+            with self._lock:
+                if failure is None:
+                    self._stats[name].record_solve(end - start)
+                    self._answered_by[captcha.hash] = name
+                    while len(self._answered_by) > self._MAX_TRACKED:
+                        self._answered_by.popitem(last=False)
+                    return captcha
+                self._stats[name].record_error(
+                    end - start, end, self._base_backoff, self._max_backoff)
+            errors.append(f"{name}: {failure}")
+
+        raise CaptchaSolveException("All solvers failed: " + "; ".join(errors))
+
+    def report_captcha(self, captcha: Captcha) -> None:
+        with self._lock:
+            name = self._answered_by.pop(captcha.hash, None)
+            if name is None:
+                return
+            self._stats[name].record_report(bool(captcha.ans_correct))
+        self._solvers[name].report_captcha(captcha)
+
+    def stats(self) -> dict[str, dict]:
+        """Per solver latency, accuracy, error and cost figures"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: stats.to_dict(now, self._failure_penalty)
+                for name, stats in self._stats.items()
+            }
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock shared between processes through a `<path>.lock` file.
+
+    Threads sharing one instance wait on a thread lock first, so only the
+    holder ever touches the open lock file. Use it as a context manager
+    around reads and writes of `path`.
+    """
+
+    def __init__(self, path: str, timeout: float = None, poll: float = 0.01) -> None:
+        self._lockpath = path + ".lock"
+        self._timeout = timeout
+        self._poll = poll
+        self._file = None
+        self._threadlock = threading.Lock()
+
+    @property
+    def lockpath(self) -> str:
+        return self._lockpath
+
+    @property
+    def locked(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> None:
+        """Wait for the lock. Raises TimeoutError once timeout seconds pass"""
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        if not self._threadlock.acquire(timeout=-1 if deadline is None else self._timeout):
+            raise TimeoutError(f"Timed out waiting for lock {self._lockpath}")
+
+        try:
+            dirname = os.path.dirname(self._lockpath)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+
+            f = open(self._lockpath, "a+b")
+        except BaseException:
+            self._threadlock.release()
+            raise
+        # msvcrt can only wait 10 seconds at a time, so Windows always polls
+        block = deadline is None and fcntl is not None
+        try:
+            while not self._try_lock(f, block):
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for lock {self._lockpath}")
+                time.sleep(self._poll)
+        except BaseException:
+            f.close()
+            self._threadlock.release()
+            raise
+        self._file = f
+
+    def release(self) -> None:
+        f, self._file = self._file, None
+        if f is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            f.close()
+            self._threadlock.release()
+
+    @staticmethod
+    def _try_lock(f, block: bool) -> bool:
+        try:
+            if fcntl is not None:
+                flags = fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(f.fileno(), flags)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -0,0 +1,238 @@
+import atexit
+import datetime
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+
+class RequestLogWriter:
+    """Writes request logs from a background thread.
+
+    Records are queued by the caller and written as compact JSON lines
+    (one record per line) in batches. Files are named
+    `<prefix>_<day>.jsonl` and rotate on a new day or once they grow past
+    `max_bytes`. When the queue is full records are dropped, or with the
+    `block` policy the caller waits at most `block_timeout` seconds before
+    the record is dropped, so a slow disk never stalls a request.
+    """
+
+    DROP = "drop"
+    BLOCK = "block"
+
+    def __init__(
+        self,
+        logdir: str = "logs",
+        prefix: str = "requests",
+        max_bytes: int = 50 * 1024 * 1024,
+        compress: bool = False,
+        queue_size: int = 10000,
+        overflow: str = DROP,
+        block_timeout: float = 0.05,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+    ) -> None:
+        if overflow not in (self.DROP, self.BLOCK):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self._logdir = logdir
+        self._prefix = prefix
+        self._max_bytes = max_bytes
+        self._compress = compress
+        self._overflow = overflow
+        self._block_timeout = block_timeout
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        # close() waits on _idle until no caller is mid-put, so nothing is
+        # queued behind its sentinel
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._putting = 0
+        self._startlock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._dropped = 0
+        self._written = 0
+
+        self._file = None
+        self._filepath = None
+        self._fileday = None
+        self._filepart = 0
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    @property
+    def current_file(self) -> str:
+        return self._filepath
+
+    def log_request(self, url: str, payload: dict, headers: dict) -> bool:
+        return self.log({"time": time.time(), "url": url, "payload": payload, "headers": headers})
+
+    def log(self, record: dict) -> bool:
+        """Queue a record for writing.
+
+        Returns:
+            bool: True if queued, False if the record was dropped
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            self._start()
+            self._putting += 1
+
+        queued = True
+        try:
+            if self._overflow == self.BLOCK:
+                self._queue.put(record, timeout=self._block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            queued = False
+        finally:
+            with self._lock:
+                self._putting -= 1
+                if not queued:
+                    self._dropped += 1
+                if self._putting == 0:
+                    self._idle.notify_all()
+        return queued
+
+    def flush(self) -> None:
+        """Block until every queued record has been written"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            while self._putting:
+                self._idle.wait()
+            running = self._thread is not None and self._thread.is_alive()
+            if running:
+                self._queue.put(None)
+        if running:
+            self._thread.join()
+        self._close_file()
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._startlock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="RequestLogWriter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            try:
+                record = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = [record]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # None is the shutdown signal from close()
+            running = None not in batch
+
+            try:
+                self._write_batch([x for x in batch if x is not None])
+            except Exception as e:
+                print(f"Error writing request log: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _format(self, record: dict) -> str:
+        if "time" in record:
+            record = dict(record)
+            ts = datetime.datetime.fromtimestamp(record.pop("time"))
+            record["timestamp"] = ts.strftime("%Y-%m-%d_%H-%M-%S")
+        return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+    def _write_batch(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        data = "".join(self._format(x) for x in batch)
+        self._rotate_if_needed()
+        self._file.write(data)
+        self._file.flush()
+        self._written += len(batch)
+
+    def _rotate_if_needed(self) -> None:
+        day = datetime.date.today().strftime("%Y-%m-%d")
+        if self._file is not None:
+            if day == self._fileday and self._file.tell() < self._max_bytes:
+                return
+            self._close_file()
+
+        if day != self._fileday:
+            self._fileday = day
+            self._filepart = 0
+
+        os.makedirs(self._logdir, exist_ok=True)
+        while True:
+            self._filepath = self._make_filepath(day, self._filepart)
+            if os.path.exists(self._filepath + ".gz"):
+                self._filepart += 1
+                continue
+            if not os.path.exists(self._filepath) \
+                    or os.path.getsize(self._filepath) < self._max_bytes:
+                break
+            self._filepart += 1
+
+        self._file = open(self._filepath, "a", encoding="utf-8")
+
+    def _make_filepath(self, day: str, part: int) -> str:
+        suffix = "" if part == 0 else f".{part}"
+        return os.path.join(self._logdir, f"{self._prefix}_{day}{suffix}.jsonl")
+
+    def _close_file(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if self._compress:
+            self._compress_file(self._filepath)
+
+    def _compress_file(self, path: str) -> None:
+        try:
+            with open(path, "rb") as src, gzip.open(path + ".gz", "ab") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+        except OSError as e:
+            print(f"Error compressing {path}: {e}")
+
+
+_default_writer: RequestLogWriter = None
+_default_writer_lock = threading.Lock()
+
+
+def get_default_writer() -> RequestLogWriter:
+    """Request log writer shared by every handler in the process"""
+    global _default_writer
+    if _default_writer is None:
+        with _default_writer_lock:
+            if _default_writer is None:
+                _default_writer = RequestLogWriter()
+                atexit.register(_default_writer.close)
+    return _default_writer
@@ -1,12 +1,14 @@
 import abc
+import asyncio
 from collections import deque
 import datetime
 from typing import Iterable, List, Tuple
 from bs4 import BeautifulSoup
-from requests import Response
 
-from rocalert.roc_web_handler import Captcha, RocWebHandler
+from rocalert.roc_async_web_handler import AsyncRocWebHandler
+from rocalert.roc_web_handler import Captcha, RocResponse, RocWebHandler
 from rocalert.rocaccount import BattlefieldTarget
+from rocalert.services.bfextractor import BattlefieldExtractor
 from rocalert.services.captchaservices import (
     CaptchaSolverServiceABC,
     CaptchaSolveException,
@@ -29,15 +31,39 @@ class BFPageServiceABC(abc.ABC):
     def get_page_range(cls, roc: RocWebHandler) -> Tuple[int, int]:
         raise NotImplementedError
 
+    @classmethod
+    @abc.abstractclassmethod
+    def fetch_page_text(cls, roc: RocWebHandler, pagenum: int) -> str:
+        raise NotImplementedError
+
 
 class BattlefieldPageService(BFPageServiceABC):
+    @staticmethod
+    def page_url(roc: RocWebHandler | AsyncRocWebHandler, pagenum: int) -> str:
+        return roc.url_generator.get_home() + f"battlefield.php?p={pagenum}"
+
     @classmethod
     def run_service(cls, roc: RocWebHandler, pagenum: int) -> dict:
-        pageurl = roc.url_generator.get_home() + f"battlefield.php?p={pagenum}"
+        return cls.parse_page(cls.fetch_page_text(roc, pagenum), pagenum)
+
+    @classmethod
+    def fetch_page_text(cls, roc: RocWebHandler, pagenum: int) -> str:
+        """Raw html of a battlefield page, e.g. to fingerprint before parsing"""
+        return roc.fetch_page(BattlefieldPageService.page_url(roc, pagenum)).text
+
+    @classmethod
+    def parse_page(cls, pagetext: str, pagenum: int) -> dict:
+        page = BattlefieldExtractor(pagetext)
+
+        if not 1 <= pagenum <= page.page_count():
+            return {"response": "error", "error": f"Invalid page number {pagenum}"}
 
-        roc.go_to_page(pageurl)
+        return {"response": "success", "result": page.targets()}
 
-        soup = BeautifulSoup(roc.r.text, "html.parser")
+    @classmethod
+    def parse_page_soup(cls, pagetext: str, pagenum: int) -> dict:
+        """parse_page using BeautifulSoup, kept as the reference parser"""
+        soup = BeautifulSoup(pagetext, "html.parser")
         content = soup.find("div", id="content")
 
         if not cls._checkvalidpage(content, pagenum):
@@ -51,10 +77,19 @@ class BattlefieldPageService(BFPageServiceABC):
 
     @classmethod
     def get_page_range(cls, roc: RocWebHandler) -> Tuple[int, int]:
-        pageurl = roc.url_generator.get_home() + f"battlefield.php?p={1}"
+        pageurl = BattlefieldPageService.page_url(roc, 1)
+
+        resp = roc.fetch_page(pageurl)
+        return cls.parse_page_range(resp.text)
 
-        roc.go_to_page(pageurl)
-        soup = BeautifulSoup(roc.r.text, "html.parser")
+    @classmethod
+    def parse_page_range(cls, pagetext: str) -> Tuple[int, int]:
+        return BattlefieldExtractor(pagetext).page_range()
+
+    @classmethod
+    def parse_page_range_soup(cls, pagetext: str) -> Tuple[int, int]:
+        """parse_page_range using BeautifulSoup, kept as the reference parser"""
+        soup = BeautifulSoup(pagetext, "html.parser")
         content = soup.find("div", id="content")
         pagerangetext = content.contents[1].contents[1].text.strip()
 
@@ -120,6 +155,25 @@ class BattlefieldPageService(BFPageServiceABC):
         return BattlefieldTarget(id, rank, name, alliance, tff, tfftype, gold)
 
 
+class AsyncBattlefieldPageService:
+    """BattlefieldPageService for an AsyncRocWebHandler"""
+
+    @classmethod
+    async def run_service(cls, roc: AsyncRocWebHandler, pagenum: int) -> dict:
+        pageurl = BattlefieldPageService.page_url(roc, pagenum)
+
+        resp = await roc.go_to_page(pageurl)
+
+        return BattlefieldPageService.parse_page(resp.text, pagenum)
+
+    @classmethod
+    async def get_page_range(cls, roc: AsyncRocWebHandler) -> Tuple[int, int]:
+        pageurl = BattlefieldPageService.page_url(roc, 1)
+
+        resp = await roc.go_to_page(pageurl)
+        return BattlefieldPageService.parse_page_range(resp.text)
+
+
 class AttackServiceABC(abc.ABC):
     @abc.abstractclassmethod
     def run_service(cls, roc: RocWebHandler, target: BattlefieldTarget):
@@ -147,14 +201,35 @@ class SpyResult:
     FAILURE = 1
     WRONG_CAPTCHA = 2
     ADMIN = 3
+    # The target cannot be spied on again yet
+    LIMIT = 4
     UNKNOWN = -1
     ERROR = -2
 
-    def __init__(self, result: int, resp: Response = None, error: str = None) -> None:
+    def __init__(self, result: int, resp: RocResponse = None, error: str = None) -> None:
         self.result = result
         self.response = resp
         self.error = error
 
+    @classmethod
+    def from_response(cls, resp: RocResponse) -> "SpyResult":
+        """Outcome of a submitted recon from the page it returned"""
+        text = resp.text
+
+        if not resp.captcha_correct:
+            return cls(cls.WRONG_CAPTCHA, resp)
+        if "report_id" in resp.url:
+            if "has been alerted" in text:
+                return cls(cls.FAILURE, resp)
+            elif "spy enters undetected" in text:
+                return cls(cls.SUCCESS, resp)
+        if "non-player Administrator account" in text:
+            return cls(cls.ADMIN, resp)
+        if "You cannot recon this person" in text:
+            return cls(cls.LIMIT, resp)
+
+        return cls(cls.UNKNOWN, resp)
+
 
 class SpyService:
     def __init__(
@@ -169,41 +244,37 @@ class SpyService:
             + f"attack.php?id={user.id}&mission_type=recon"
         )
 
-    def _get_result(self, resp: Response) -> SpyResult:
-        text = resp.text
-
-        if "report_id" in resp.url:
-            if "has been alerted" in text:
-                return SpyResult(SpyResult.FAILURE, resp)
-            elif "spy enters undetected" in text:
-                return SpyResult(SpyResult.SUCCESS, resp)
-        if "non-player Administrator account" in text:
-            return SpyResult(SpyResult.ADMIN, resp)
-
-        return SpyResult(SpyResult.UNKNOWN, resp)
-
-    def _spy_user(self, targetcap: Tuple[BattlefieldTarget, Captcha]) -> SpyResult:
-        target, captcha = targetcap
+    def _get_result(self, resp: RocResponse) -> SpyResult:
+        return SpyResult.from_response(resp)
 
+    def _check_target(self, target: BattlefieldTarget, captcha: Captcha) -> SpyResult:
         if captcha.hash is None:
             return SpyResult(SpyResult.ERROR, error="Captcha has no hash")
         if captcha.ans is None:
             return SpyResult(SpyResult.ERROR, error="No answer provided")
         if target.id is None:
             return SpyResult(SpyResult.ERROR, error="Target has no ID")
+        return None
+
+    def _spy_user(self, targetcap: Tuple[BattlefieldTarget, Captcha]) -> SpyResult:
+        target, captcha = targetcap
+
+        error = self._check_target(target, captcha)
+        if error is not None:
+            return error
 
         targeturl = self._get_spy_url(target)
 
         payload = {"defender_id": target.id, "mission_type": "recon", "reconspies": 1}
 
-        valid_captcha = self._roc.submit_captcha_url(
+        resp = self._roc.submit_page(
             captcha, targeturl, payload, RocWebHandler.Pages.SPY
         )
 
-        if not valid_captcha:
-            return SpyResult(SpyResult.WRONG_CAPTCHA, resp=self._roc.r)
+        if not resp.captcha_correct:
+            return SpyResult(SpyResult.WRONG_CAPTCHA, resp=resp)
 
-        return self._get_result(self._roc.r)
+        return self._get_result(resp)
 
     def add_targets(self, targets: List[Tuple[BattlefieldTarget, Captcha]]):
         self._targets.append(targets)
@@ -215,3 +286,49 @@ class SpyService:
 
         targetcap = deque()
         return res
+
+
+class AsyncSpyService(SpyService):
+    """SpyService that submits every queued target concurrently"""
+
+    def __init__(
+        self,
+        roc: AsyncRocWebHandler,
+        targets: list[Tuple[BattlefieldTarget, Captcha]] = None,
+        max_concurrent: int = 10,
+    ) -> None:
+        super().__init__(roc, targets if targets else [])
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def spy(self, target: BattlefieldTarget, captcha: Captcha) -> SpyResult:
+        """Submit one recon with an answered captcha"""
+        return await self._spy_user((target, captcha))
+
+    async def _spy_user(self, targetcap: Tuple[BattlefieldTarget, Captcha]) -> SpyResult:
+        target, captcha = targetcap
+
+        error = self._check_target(target, captcha)
+        if error is not None:
+            return error
+
+        targeturl = self._get_spy_url(target)
+
+        payload = {"defender_id": target.id, "mission_type": "recon", "reconspies": 1}
+
+        async with self._semaphore:
+            resp = await self._roc.submit_page(
+                captcha, targeturl, payload, RocWebHandler.Pages.SPY
+            )
+
+        if not resp.captcha_correct:
+            return SpyResult(SpyResult.WRONG_CAPTCHA, resp=resp)
+
+        return self._get_result(resp)
+
+    def add_targets(self, targets: List[Tuple[BattlefieldTarget, Captcha]]):
+        self._targets.extend(targets)
+
+    async def run_service(self) -> List[SpyResult]:
+        targets = list(self._targets)
+        self._targets.clear()
+        return list(await asyncio.gather(*(self._spy_user(x) for x in targets)))
@@ -0,0 +1,339 @@
+import contextlib
+import dataclasses
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Generic, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclasses.dataclass
+class PooledSession(Generic[T]):
+    """A logged in session and how well it has been doing"""
+    index: int
+    session: T
+    leases: int = 0
+    # consecutive failed requests
+    failures: int = 0
+    requests: int = 0
+    # moving average of request seconds, None until the first report
+    latency: Optional[float] = None
+    last_used: float = dataclasses.field(default_factory=time.time)
+    draining: bool = False
+
+    @property
+    def score(self) -> float:
+        """Lower is better"""
+        return (self.latency or 0.0) * (1 + self.failures)
+
+
+class SessionPool(Generic[T]):
+    """Leases logged in sessions to workers, one worker per session by default.
+
+    `login(index)` returns a logged in session for pool slot `index`, or
+    None if it could not log in. Every slot is logged in in parallel by
+    `start`. Workers `lease` the healthiest idle session, waiting up to a
+    timeout, and `report` how each request on it went.
+
+    A session is drained, i.e. no longer leased out, after `max_failures`
+    failures in a row, when reported logged out, when it is
+    `slow_factor` times slower than the median session, or when
+    `health_check(session)` fails for a session idle `check_interval`
+    seconds. Once its leases are returned a background thread logs the
+    slot in again.
+    """
+
+    def __init__(
+            self,
+            login: Callable[[int], Optional[T]],
+            size: int,
+            leases_per_session: int = 1,
+            login_workers: int = 10,
+            health_check: Optional[Callable[[T], bool]] = None,
+            check_interval: Optional[float] = 300,
+            max_failures: int = 3,
+            slow_factor: float = 3.0,
+            min_requests: int = 5,
+            relogin_delay: float = 30,
+            ) -> None:
+        self._login = login
+        self._size = size
+        self._leases_per_session = leases_per_session
+        self._login_workers = max(1, login_workers)
+        self._health_check = health_check
+        self._check_interval = check_interval
+        self._max_failures = max_failures
+        self._slow_factor = slow_factor
+        self._min_requests = min_requests
+        self._relogin_delay = relogin_delay
+
+        self._cond = threading.Condition()
+        self._live: dict[int, PooledSession[T]] = {}
+        self._by_session: dict[int, PooledSession[T]] = {}
+        # slot index to the time.time() a re-login may next be tried
+        self._pending: dict[int, float] = {}
+        self._relogging: set[int] = set()
+        self._closed = False
+        self._thread = None
+
+        self.logins = 0
+        self.failed_logins = 0
+        self.drained = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def size(self) -> int:
+        """Sessions currently logged in, including draining ones"""
+        with self._cond:
+            return len(self._live)
+
+    @property
+    def sessions(self) -> list[T]:
+        """Every healthy session, e.g. to share between threads without leasing"""
+        with self._cond:
+            return [x.session for x in self._live.values() if not x.draining]
+
+    def start(self) -> int:
+        """Log in every slot in parallel and start background re-logins.
+
+        Returns:
+            int: the number of sessions logged in
+        """
+        with ThreadPoolExecutor(max_workers=min(self._login_workers, max(1, self._size))) as executor:
+            results = list(executor.map(self._try_login, range(self._size)))
+
+        with self._cond:
+            for index, session in enumerate(results):
+                if session is None:
+                    self._pending[index] = time.time() + self._relogin_delay
+                else:
+                    self._add(index, session)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._maintain, name="SessionPool", daemon=True)
+                self._thread.start()
+            return len(self._live)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def acquire(self, timeout: Optional[float] = None) -> T:
+        """Lease the best idle session
+
+        Raises:
+            TimeoutError: no session came free within timeout seconds
+        """
+        start = time.time()
+        deadline = None if timeout is None else start + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Session pool is closed")
+                candidates = [
+                    x for x in self._live.values()
+                    if not x.draining and x.leases < self._leases_per_session
+                ]
+                if candidates:
+                    pooled = min(candidates, key=lambda x: (x.leases, x.score))
+                    pooled.leases += 1
+                    pooled.last_used = time.time()
+                    self.wait_seconds += pooled.last_used - start
+                    return pooled.session
+
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    self.wait_seconds += time.time() - start
+                    raise TimeoutError(f"No session free after {timeout} seconds")
+                self._cond.wait(remaining)
+
+    def release(self, session: T) -> None:
+        """Return a leased session"""
+        with self._cond:
+            pooled = self._by_session.get(id(session))
+            if pooled is None:
+                return
+            pooled.leases = max(0, pooled.leases - 1)
+            pooled.last_used = time.time()
+            if pooled.draining and pooled.leases == 0:
+                self._retire(pooled)
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[T]:
+        """Lease a session for the duration of a with block.
+
+        An exception in the block counts as a failed request on the session.
+        """
+        session = self.acquire(timeout)
+        try:
+            yield session
+        except Exception:
+            self.report(session, ok=False)
+            raise
+        finally:
+            self.release(session)
+
+    def report(
+            self,
+            session: T,
+            seconds: Optional[float] = None,
+            ok: bool = True,
+            logged_in: bool = True) -> None:
+        """Record how a request on a session went
+
+        Args:
+            session (T): the session the request was sent on
+            seconds (float, optional): how long the request took
+            ok (bool, optional): False if the request failed
+            logged_in (bool, optional): False if the page showed the
+                session is logged out. Drains the session immediately
+        """
+        with self._cond:
+            pooled = self._by_session.get(id(session))
+            if pooled is None or pooled.draining:
+                return
+            pooled.requests += 1
+            pooled.failures = 0 if ok else pooled.failures + 1
+            # Sessions used without a lease are not due a health check either
+            pooled.last_used = time.time()
+            if seconds is not None:
+                pooled.latency = seconds if pooled.latency is None \
+                    else 0.7 * pooled.latency + 0.3 * seconds
+
+            if not logged_in:
+                self._drain(pooled, "logged out")
+            elif pooled.failures >= self._max_failures:
+                self._drain(pooled, f"{pooled.failures} failures in a row")
+            elif self._is_slow(pooled):
+                self._drain(pooled, f"slow ({pooled.latency:.2f}s per request)")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "live": sum(not x.draining for x in self._live.values()),
+                "leased": sum(x.leases for x in self._live.values()),
+                "relogging": len(self._pending) + len(self._relogging),
+                "logins": self.logins,
+                "failed_logins": self.failed_logins,
+                "drained": self.drained,
+                "wait_seconds": round(self.wait_seconds, 2),
+            }
+
+    def __enter__(self) -> "SessionPool[T]":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _try_login(self, index: int) -> Optional[T]:
+        try:
+            session = self._login(index)
+        except Exception as e:
+            print(f"Login error for session {index}: {e}")
+            session = None
+        with self._cond:
+            if session is None:
+                self.failed_logins += 1
+            else:
+                self.logins += 1
+        return session
+
+    def _add(self, index: int, session: T) -> None:
+        pooled = PooledSession(index, session)
+        self._live[index] = pooled
+        self._by_session[id(session)] = pooled
+        self._cond.notify_all()
+
+    def _is_slow(self, pooled: PooledSession[T]) -> bool:
+        if pooled.requests < self._min_requests:
+            return False
+        others = [
+            x.latency for x in self._live.values()
+            if not x.draining and x.latency is not None and x.requests >= self._min_requests
+        ]
+        # Never drain the last healthy session for being slow
+        if len(others) < 2:
+            return False
+        return pooled.latency > self._slow_factor * statistics.median(others)
+
+    def _drain(self, pooled: PooledSession[T], reason: str) -> None:
+        print(f"Draining session {pooled.index}: {reason}")
+        pooled.draining = True
+        self.drained += 1
+        if pooled.leases == 0:
+            self._retire(pooled)
+
+    def _retire(self, pooled: PooledSession[T]) -> None:
+        self._live.pop(pooled.index, None)
+        self._by_session.pop(id(pooled.session), None)
+        self._pending[pooled.index] = time.time()
+        self._cond.notify_all()
+
+    def _maintain(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                now = time.time()
+                due = [x for x, t in self._pending.items() if t <= now]
+                for index in due:
+                    del self._pending[index]
+                    self._relogging.add(index)
+                stale = self._stale_sessions(now)
+                if not due and not stale:
+                    self._cond.wait(self._next_wakeup(now))
+                    continue
+
+            for pooled in stale:
+                self._check(pooled)
+            for index in due:
+                session = self._try_login(index)
+                with self._cond:
+                    self._relogging.discard(index)
+                    if self._closed:
+                        return
+                    if session is None:
+                        self._pending[index] = time.time() + self._relogin_delay
+                    else:
+                        self._add(index, session)
+
+    def _stale_sessions(self, now: float) -> list[PooledSession[T]]:
+        if self._health_check is None or self._check_interval is None:
+            return []
+        stale = [
+            x for x in self._live.values()
+            if not x.draining and x.leases == 0 and now - x.last_used >= self._check_interval
+        ]
+        # Hold a lease while checking so no worker gets it meanwhile
+        for pooled in stale:
+            pooled.leases += 1
+        return stale
+
+    def _check(self, pooled: PooledSession[T]) -> None:
+        try:
+            healthy = self._health_check(pooled.session)
+        except Exception as e:
+            print(f"Health check error for session {pooled.index}: {e}")
+            healthy = False
+        with self._cond:
+            if not healthy and not pooled.draining:
+                self._drain(pooled, "failed health check")
+        self.release(pooled.session)
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        times = list(self._pending.values())
+        if self._health_check is not None and self._check_interval is not None:
+            times.extend(
+                x.last_used + self._check_interval for x in self._live.values()
+                if not x.draining and x.leases == 0)
+        if not times:
+            return None
+        return max(0.01, min(times) - now)
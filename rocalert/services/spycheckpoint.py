@@ -0,0 +1,153 @@
+import dataclasses
+import json
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from rocalert.battlefieldtable import BattlefieldTable
+from rocalert.services.spyledger import SpyQuotaLedger
+
+_VERSION = 1
+
+
+@dataclasses.dataclass
+class SpyCheckpoint:
+    table: BattlefieldTable
+    ledger: dict[str, dict]
+    progress: dict
+    saved_at: float
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.saved_at
+
+
+def save_checkpoint(
+        path: str,
+        table: BattlefieldTable,
+        ledger: SpyQuotaLedger = None,
+        progress: dict = None) -> None:
+    """Write the scanned targets, recon counts and progress to one .npz file
+
+    The file is written next to `path` and moved over it, so a crash
+    mid-write leaves the previous checkpoint intact.
+    """
+    arrays = {"table_" + k: v for k, v in table.to_arrays().items()}
+
+    snapshot = {} if ledger is None else ledger.snapshot()
+    ids = list(snapshot)
+    arrays["ledger_ids"] = np.array(ids, dtype=str)
+    arrays["ledger_counts"] = np.array(
+        [[snapshot[x]["successes"], snapshot[x]["attempts"], snapshot[x]["errors"]] for x in ids],
+        dtype=np.int32).reshape(-1, 3)
+    arrays["ledger_retired"] = np.array([snapshot[x]["retired"] for x in ids], dtype=bool)
+
+    meta = {"version": _VERSION, "saved_at": time.time(), "progress": progress or {}}
+    arrays["meta"] = np.array(json.dumps(meta, separators=(",", ":")))
+
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    tmppath = path + ".tmp"
+    with open(tmppath, "wb") as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmppath, path)
+
+
+def load_checkpoint(path: str) -> Optional[SpyCheckpoint]:
+    """Checkpoint saved at path, None if there is none or it cannot be read"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != _VERSION:
+                print(f"Ignoring spy checkpoint {path} from another version")
+                return None
+            table = BattlefieldTable.from_arrays(
+                {k[len("table_"):]: data[k] for k in data.files if k.startswith("table_")})
+            counts = data["ledger_counts"]
+            ledger = {
+                str(x): {
+                    "successes": int(counts[i, 0]),
+                    "attempts": int(counts[i, 1]),
+                    "errors": int(counts[i, 2]),
+                    "retired": bool(data["ledger_retired"][i]),
+                }
+                for i, x in enumerate(data["ledger_ids"])
+            }
+    except Exception as e:
+        print(f"Ignoring unreadable spy checkpoint {path}: {e}")
+        return None
+    return SpyCheckpoint(table, ledger, meta["progress"], meta["saved_at"])
+
+
+class CheckpointWriter:
+    """Saves a spy checkpoint every `interval` seconds from a background thread.
+
+    A save is skipped when neither the recon counts nor the progress have
+    changed since the last one. `stop` writes a final checkpoint.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            table: BattlefieldTable,
+            ledger: SpyQuotaLedger,
+            interval: float = 30,
+            progress: Callable[[], dict] = None) -> None:
+        self._path = path
+        self._table = table
+        self._ledger = ledger
+        self._interval = interval
+        self._progress = progress
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._last = None
+        self.saves = 0
+
+    def save(self, force: bool = False) -> bool:
+        """Write a checkpoint if anything changed. Returns True if one was written"""
+        with self._lock:
+            progress = self._progress() if self._progress is not None else {}
+            state = (self._ledger.snapshot(), progress)
+            if not force and state == self._last:
+                return False
+            try:
+                save_checkpoint(self._path, self._table, self._ledger, progress)
+            except Exception as e:
+                print(f"Error saving spy checkpoint {self._path}: {e}")
+                return False
+            self._last = state
+            self.saves += 1
+            return True
+
+    def start(self) -> "CheckpointWriter":
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="SpyCheckpoint", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self._interval):
+            self.save()
+
+    def __enter__(self) -> "CheckpointWriter":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,488 @@
+import asyncio
+import dataclasses
+import datetime
+import functools
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from rocalert.captcha.imagehashindex import ImageHashIndex
+from rocalert.roc_async_web_handler import AsyncRocWebHandler
+from rocalert.roc_web_handler import Captcha
+from rocalert.rocaccount import BattlefieldTarget
+from rocalert.services.captchaservices import CaptchaSolverServiceABC
+from rocalert.services.rocwebservices import AsyncSpyService, SpyResult
+from rocalert.services.sessionpool import SessionPool
+from rocalert.services.spyledger import SpyQuotaLedger, SpySlot
+
+
+@dataclasses.dataclass
+class StageStats:
+    name: str
+    workers: int
+    processed: int = 0
+    errors: int = 0
+    # Captchas thrown away for being too close to expiring
+    expired: int = 0
+    # Summed over workers
+    busy_seconds: float = 0
+    # Items waiting in the queue that feeds this stage
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+    def per_minute(self, elapsed: float) -> float:
+        return 60 * self.processed / elapsed if elapsed > 0 else 0.0
+
+    def utilization(self, elapsed: float) -> float:
+        """Share of the stage's worker time spent busy"""
+        if elapsed <= 0 or self.workers == 0:
+            return 0.0
+        return self.busy_seconds / (elapsed * self.workers)
+
+    def describe(self, elapsed: float) -> str:
+        return (
+            f"{self.name}: {self.processed} ({self.per_minute(elapsed):.1f}/min, "
+            f"{self.errors} errors, {self.expired} expired) "
+            f"queue {self.queue_depth} max {self.max_queue_depth} | "
+            f"{self.workers} workers {self.utilization(elapsed):.0%} busy"
+        )
+
+
+@dataclasses.dataclass
+class SpyEngineStats:
+    harvest: StageStats
+    solve: StageStats
+    submit: StageStats
+    successes: int = 0
+    wrong_captchas: int = 0
+    targets_completed: int = 0
+    wall_seconds: float = 0
+
+    @property
+    def stages(self) -> List[StageStats]:
+        return [self.harvest, self.solve, self.submit]
+
+    @property
+    def recons_per_minute(self) -> float:
+        return 60 * self.successes / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.successes} recons ({self.recons_per_minute:.1f}/min), "
+            f"{self.wrong_captchas} wrong captchas, "
+            f"{self.targets_completed} targets completed in {self.wall_seconds:.1f}s"
+        ]
+        lines.extend("  " + x.describe(self.wall_seconds) for x in self.stages)
+        return "\n".join(lines)
+
+
+class PipelinedSpyEngine:
+    """Spies on targets with captcha fetching, solving and submitting overlapped.
+
+    Three pools of workers are joined by bounded queues:
+
+    harvest: loads a captcha on one of the sessions
+    solve:   answers it from the image index or the solver, in a thread
+    submit:  sends a recon with it, from the session that loaded it
+
+    A full queue holds up the stage before it, and harvesting only runs
+    ahead of the recons still needed, so captchas are not loaded faster
+    than they can be used. Captchas within `expiry_margin` seconds of
+    `Captcha.EXPIRATION_AGE` are dropped rather than submitted. Each target
+    is claimed from the SpyQuotaLedger when a captcha is ready to submit,
+    so a target that hits its limit stops taking captchas straight away.
+    Submits that fail because of the session, an exception or a logged
+    out page, give their slot back instead of counting against the target.
+
+    Ledger calls run in threads, since a file backed ledger waits on its
+    file lock. Stages wait on the ledger's recons left as last read, which
+    every change and a once a second poll refresh.
+    """
+
+    def __init__(
+            self,
+            sessions: List[AsyncRocWebHandler],
+            solver: CaptchaSolverServiceABC,
+            harvest_workers: int = 10,
+            solve_workers: int = 10,
+            submit_workers: int = 10,
+            queue_size: int = 20,
+            max_spies: int = 10,
+            max_attempts: Optional[int] = None,
+            max_target_errors: int = 3,
+            expiry_margin: float = 15,
+            image_index: ImageHashIndex = None,
+            error_delay: float = 0.5,
+            max_harvest_errors: int = 50,
+            report_interval: Optional[float] = None,
+            ledger: SpyQuotaLedger = None,
+            session_pool: SessionPool[AsyncRocWebHandler] = None,
+            ) -> None:
+        """
+        Args:
+            sessions (List[AsyncRocWebHandler]): logged in sessions
+            solver (CaptchaSolverServiceABC): solver for captchas the image
+                index does not know
+            harvest_workers, solve_workers, submit_workers (int): concurrency
+                of each stage
+            queue_size (int): capacity of each queue between stages
+            max_spies (int): successful recons wanted per target
+            max_attempts (int, optional): recons submitted per target before
+                giving up on it. Defaults to no limit
+            max_target_errors (int): failed submits before giving up on a target
+            expiry_margin (float): seconds before expiry to drop a captcha
+            image_index (ImageHashIndex, optional): answers for captchas
+                that look like ones solved before
+            error_delay (float): seconds a harvester waits after a failed load
+            max_harvest_errors (int): failed loads in a row that stop the run
+            report_interval (float, optional): seconds between printed stats
+            ledger (SpyQuotaLedger, optional): recon quotas shared with other
+                spy workers. Defaults to a ledger of its own built from
+                max_spies, max_attempts and max_target_errors
+            session_pool (SessionPool, optional): pool, or anything with its
+                `sessions` and `report`, to take its current healthy sessions
+                from for every captcha instead of `sessions`. How each
+                request went is reported back, so the pool drains slow and
+                logged out sessions
+        """
+        if not sessions and session_pool is None:
+            raise ValueError("At least one session is needed")
+
+        self._sessions = sessions
+        self._solver = solver
+        self._harvest_workers = harvest_workers
+        self._solve_workers = solve_workers
+        self._submit_workers = submit_workers
+        self._queue_size = queue_size
+        self._ledger = ledger if ledger is not None else SpyQuotaLedger(
+            max_spies, max_attempts, max_target_errors)
+        self._expiry_age = Captcha.EXPIRATION_AGE - datetime.timedelta(seconds=expiry_margin)
+        self._image_index = image_index
+        self._error_delay = error_delay
+        self._max_harvest_errors = max_harvest_errors
+        self._report_interval = report_interval
+        self._session_pool = session_pool
+
+        self._services: Dict[int, AsyncSpyService] = {}
+        self._targets: Dict[str, BattlefieldTarget] = {}
+        self._next_session = 0
+        self.stats = self._new_stats()
+
+    @property
+    def ledger(self) -> SpyQuotaLedger:
+        return self._ledger
+
+    @property
+    def completed(self) -> set:
+        """Ids of this run's targets retired in the ledger"""
+        return self._ledger.retired & set(self._targets)
+
+    def _new_stats(self) -> SpyEngineStats:
+        return SpyEngineStats(
+            StageStats("harvest", self._harvest_workers),
+            StageStats("solve", self._solve_workers),
+            StageStats("submit", self._submit_workers),
+        )
+
+    async def run(self, targets: Iterable[BattlefieldTarget]) -> SpyEngineStats:
+        self._targets = {str(x.id): x for x in targets}
+        await asyncio.to_thread(self._ledger.add_targets, self._targets)
+        # Recons the ledger could still hand out when last read
+        self._available, self._retired = await asyncio.to_thread(self._read_ledger)
+        self.stats = stats = self._new_stats()
+
+        self._changed = asyncio.Condition()
+        self._harvested = asyncio.Queue(maxsize=self._queue_size)
+        self._solved = asyncio.Queue(maxsize=self._queue_size)
+        # Captchas loading or waiting in the stages, not yet given a target
+        self._pipeline = 0
+        # Submits whose results are still being written to the ledger
+        self._recording = 0
+        self._harvest_errors = 0
+        self._finished = len(self._retired) == len(self._targets)
+
+        start = time.perf_counter()
+        workers = [asyncio.create_task(self._harvest()) for _ in range(self._harvest_workers)]
+        workers += [asyncio.create_task(self._solve()) for _ in range(self._solve_workers)]
+        workers += [asyncio.create_task(self._submit()) for _ in range(self._submit_workers)]
+        workers.append(asyncio.create_task(self._poll_ledger()))
+        if self._report_interval:
+            workers.append(asyncio.create_task(self._report(start)))
+
+        try:
+            async with self._changed:
+                # Results already sent are counted before stopping
+                await self._changed.wait_for(lambda: self._finished and not self._recording)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            stats.wall_seconds = time.perf_counter() - start
+        return stats
+
+    def _read_ledger(self, update: Callable[[], None] = None) -> Tuple[int, set]:
+        """Apply update, then read the recons left and this run's retired targets.
+        Blocks on a file backed ledger's lock, so only call it in a thread"""
+        if update is not None:
+            update()
+        return self._ledger.demand(self._targets), self.completed
+
+    def _apply_ledger(self, available: int, retired: set) -> None:
+        """Take what _read_ledger read. Call with self._changed held"""
+        self._available = available
+        if len(retired) == len(self._targets):
+            self._finished = True
+        self._changed.notify_all()
+
+    async def _update_ledger(self, update: Callable[[], None] = None) -> None:
+        view = await asyncio.to_thread(self._read_ledger, update)
+        async with self._changed:
+            self._apply_ledger(*view)
+
+    async def _poll_ledger(self, interval: float = 1) -> None:
+        """Pick up changes other workers make to a shared ledger"""
+        while True:
+            await asyncio.sleep(interval)
+            await self._update_ledger()
+
+    def _near_expiry(self, captcha: Captcha) -> bool:
+        return captcha.age >= self._expiry_age
+
+    async def _finish(self) -> None:
+        async with self._changed:
+            self._finished = True
+            self._changed.notify_all()
+
+    async def _release(self) -> None:
+        """A captcha left the pipeline without being submitted"""
+        async with self._changed:
+            self._pipeline -= 1
+            self._changed.notify_all()
+
+    @staticmethod
+    def _track_depth(stage: StageStats, queue: asyncio.Queue) -> None:
+        stage.queue_depth = queue.qsize()
+        stage.max_queue_depth = max(stage.max_queue_depth, stage.queue_depth)
+
+    def _pick_session(self) -> Optional[AsyncRocWebHandler]:
+        """Next session round robin, None while the pool has no healthy ones"""
+        sessions = self._sessions if self._session_pool is None else self._session_pool.sessions
+        if not sessions:
+            return None
+        session = sessions[self._next_session % len(sessions)]
+        self._next_session += 1
+        return session
+
+    def _service(self, session: AsyncRocWebHandler) -> AsyncSpyService:
+        service = self._services.get(id(session))
+        if service is None:
+            service = AsyncSpyService(session, max_concurrent=self._submit_workers)
+            self._services[id(session)] = service
+        return service
+
+    def _report_session(
+            self, session: AsyncRocWebHandler, seconds: Optional[float], ok: bool,
+            logged_in: bool = True) -> None:
+        if self._session_pool is not None:
+            self._session_pool.report(session, seconds, ok=ok, logged_in=logged_in)
+
+    async def _harvest(self) -> None:
+        stage = self.stats.harvest
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: self._finished or self._pipeline < self._available)
+                if self._finished:
+                    return
+                self._pipeline += 1
+
+            session = self._pick_session()
+            if session is None:
+                # Every session is logging in again
+                await self._release()
+                await asyncio.sleep(self._error_delay)
+                continue
+
+            start = time.perf_counter()
+            captcha = None
+            try:
+                captcha = await session.get_img_captcha(session.Pages.ARMORY)
+            except Exception as e:
+                print(f"Error loading spy captcha: {e}")
+            stage.busy_seconds += time.perf_counter() - start
+            self._report_session(
+                session, None, ok=captcha is not None and captcha.img is not None)
+
+            if captcha is None or captcha.img is None:
+                stage.errors += 1
+                self._harvest_errors += 1
+                await self._release()
+                if self._harvest_errors >= self._max_harvest_errors:
+                    print(f"Stopping spies after {self._harvest_errors} failed captcha loads in a row")
+                    await self._finish()
+                    return
+                await asyncio.sleep(self._error_delay)
+                continue
+
+            self._harvest_errors = 0
+            stage.processed += 1
+            await self._harvested.put((session, captcha))
+            self._track_depth(self.stats.solve, self._harvested)
+
+    def _answer(self, captcha: Captcha) -> str:
+        match = None if self._image_index is None else self._image_index.lookup(captcha.img)
+        if match is not None:
+            captcha.from_lookup = True
+            return match.answer
+        # Some solvers return None and only set captcha.ans
+        self._solver.solve_captcha(captcha)
+        return captcha.ans
+
+    async def _solve(self) -> None:
+        stage = self.stats.solve
+        while True:
+            session, captcha = await self._harvested.get()
+            self._track_depth(stage, self._harvested)
+            try:
+                if self._near_expiry(captcha):
+                    stage.expired += 1
+                    await self._release()
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    ans = await asyncio.to_thread(self._answer, captcha)
+                except Exception as e:
+                    print(f"Error solving spy captcha {captcha.hash}: {e}")
+                    ans = None
+                stage.busy_seconds += time.perf_counter() - start
+
+                if not ans or ans == "-1":
+                    stage.errors += 1
+                    await self._release()
+                    continue
+
+                captcha.ans = ans
+                stage.processed += 1
+                await self._solved.put((session, captcha))
+                self._track_depth(self.stats.submit, self._solved)
+            finally:
+                self._harvested.task_done()
+
+    async def _claim_target(self) -> Optional[SpySlot]:
+        """Slot on the next target with room for another recon, None once all are done"""
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._finished or self._available > 0)
+                if self._finished:
+                    return None
+                # Counted as claimed until the ledger is read again
+                self._available -= 1
+
+            slot = await asyncio.to_thread(self._ledger.claim, among=self._targets)
+            if slot is not None:
+                async with self._changed:
+                    self._pipeline -= 1
+                return slot
+            await self._update_ledger()
+
+    async def _submit(self) -> None:
+        stage = self.stats.submit
+        while True:
+            session, captcha = await self._solved.get()
+            self._track_depth(stage, self._solved)
+            try:
+                if self._near_expiry(captcha):
+                    stage.expired += 1
+                    await self._release()
+                    continue
+
+                slot = await self._claim_target()
+                if slot is None:
+                    await self._release()
+                    continue
+
+                target = self._targets[slot.target_id]
+                start = time.perf_counter()
+                try:
+                    result = await self._service(session).spy(target, captcha)
+                except Exception as e:
+                    print(f"Error spying on {target.name}: {e}")
+                    result = None
+                seconds = time.perf_counter() - start
+                stage.busy_seconds += seconds
+
+                # Only results with a response were sent to the site
+                sent = result is not None and result.response is not None
+                logged_in = not sent or result.response.logged_in
+                self._report_session(
+                    session, seconds if sent else None, ok=result is not None, logged_in=logged_in)
+                if not logged_in:
+                    print(f"Session logged out while spying on {target.name}")
+                    result = None
+
+                if result is None:
+                    # The session's fault, not the target's
+                    stage.errors += 1
+                    await self._update_ledger(functools.partial(self._ledger.release, slot))
+                else:
+                    await self._record(slot, target, captcha, result)
+            finally:
+                self._solved.task_done()
+
+    async def _record(
+            self, slot: SpySlot, target: BattlefieldTarget, captcha: Captcha, result: SpyResult) -> None:
+        self._recording += 1
+        try:
+            available, retired = await self._write_result(slot, target, captcha, result)
+        except BaseException:
+            async with self._changed:
+                self._recording -= 1
+                self._changed.notify_all()
+            raise
+
+        async with self._changed:
+            self._recording -= 1
+            if result.result == SpyResult.WRONG_CAPTCHA:
+                self.stats.wrong_captchas += 1
+            elif result.result in (SpyResult.SUCCESS, SpyResult.FAILURE):
+                self.stats.successes += 1
+
+            if slot.target_id not in self._retired and slot.target_id in retired:
+                self._retired.add(slot.target_id)
+                self.stats.targets_completed += 1
+            self._apply_ledger(available, retired)
+
+    async def _write_result(
+            self, slot: SpySlot, target: BattlefieldTarget, captcha: Captcha,
+            result: SpyResult) -> Tuple[int, set]:
+        stage = self.stats.submit
+        if result.result == SpyResult.ERROR:
+            stage.errors += 1
+            if result.error:
+                print(f"Error spying on {target.name}: {result.error}")
+        else:
+            stage.processed += 1
+            captcha.ans_correct = result.result != SpyResult.WRONG_CAPTCHA
+            await asyncio.to_thread(self._learn, captcha)
+
+        return await asyncio.to_thread(
+            self._read_ledger, functools.partial(self._ledger.record, slot, result.result))
+
+    def _learn(self, captcha: Captcha) -> None:
+        if not captcha.from_lookup:
+            try:
+                self._solver.report_captcha(captcha)
+            except Exception as e:
+                print(f"Error reporting captcha {captcha.hash}: {e}")
+        if self._image_index is None:
+            return
+        if captcha.ans_correct:
+            self._image_index.add(captcha.img, captcha.ans, captcha.hash)
+        else:
+            self._image_index.reject(captcha.img, captcha.ans)
+
+    async def _report(self, start: float) -> None:
+        while True:
+            await asyncio.sleep(self._report_interval)
+            self.stats.wall_seconds = time.perf_counter() - start
+            print(self.stats)
@@ -0,0 +1,255 @@
+import contextlib
+import dataclasses
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Collection, Iterable, Iterator, Optional
+
+from rocalert.services.filelock import FileLock
+from rocalert.services.rocwebservices import SpyResult
+
+
+@dataclasses.dataclass(frozen=True)
+class SpySlot:
+    """Permission to submit one recon on a target"""
+    target_id: str
+    claim_id: str
+
+
+@dataclasses.dataclass
+class _TargetQuota:
+    successes: int = 0
+    attempts: int = 0
+    errors: int = 0
+    retired: bool = False
+    # claim id to the time.time() its lease runs out
+    claims: dict = dataclasses.field(default_factory=dict)
+
+
+class SpyQuotaLedger:
+    """Hands out recon slots per target so no worker spies past the limit.
+
+    Workers `claim` a slot before loading a captcha and `record` the
+    SpyResult once submitted, or `release` the slot if nothing was sent.
+    A target never has more slots out than the recons it has left, and is
+    retired at `max_spies` successful or failed recons, on a LIMIT or
+    ADMIN result, after `max_errors` ERROR or UNKNOWN results, or after
+    `max_attempts` submits of any kind. Wrong captchas only count toward
+    `max_attempts`, so leave it None unless every submit should use up
+    the target. Slots for submits that failed because of the session,
+    not the target, should be released rather than recorded.
+
+    With a `path` the ledger lives in a JSON file under a file lock, so
+    separate processes share it. Claims in the file lease out after
+    `lease_seconds`, so slots held by a process that died are handed out
+    again.
+    """
+
+    def __init__(
+            self,
+            max_spies: int = 10,
+            max_attempts: Optional[int] = None,
+            max_errors: int = 3,
+            path: Optional[str] = None,
+            lease_seconds: float = 300,
+            ) -> None:
+        self._max_spies = max_spies
+        self._max_attempts = max_attempts
+        self._max_errors = max_errors
+        self._path = path
+        self._lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._filelock = None if path is None else FileLock(path)
+        self._targets: dict[str, _TargetQuota] = {}
+        self._next = 0
+        self._claimids = itertools.count()
+        self._prefix = uuid.uuid4().hex[:8]
+
+        self._refused = 0
+        self._wasted = 0
+
+    @property
+    def max_spies(self) -> int:
+        return self._max_spies
+
+    def add_targets(self, target_ids: Iterable[str]) -> None:
+        with self._transaction() as targets:
+            for target_id in target_ids:
+                targets.setdefault(str(target_id), _TargetQuota())
+
+    def claim(self, target_id: str = None, among: Collection[str] = None) -> Optional[SpySlot]:
+        """Reserve a recon on a target, or on the next target with room
+
+        Args:
+            target_id (str, optional): target to claim on
+            among (Collection[str], optional): without a target_id, only
+                claim on one of these targets. Defaults to any target
+
+        Returns:
+            SpySlot: the reserved slot, None if there is no room left
+        """
+        with self._transaction() as targets:
+            if target_id is not None:
+                candidates = [str(target_id)]
+            else:
+                order = list(targets) if among is None else [x for x in targets if x in among]
+                candidates = [order[(self._next + i) % len(order)] for i in range(len(order))]
+
+            for i, candidate in enumerate(candidates):
+                quota = targets.get(candidate)
+                if quota is None or self._capacity(quota) <= 0:
+                    continue
+                if target_id is None:
+                    self._next += i + 1
+                claim_id = f"{self._prefix}-{next(self._claimids)}"
+                quota.claims[claim_id] = time.time() + self._lease_seconds
+                return SpySlot(candidate, claim_id)
+
+            self._refused += 1
+            return None
+
+    def release(self, slot: SpySlot) -> None:
+        """Give back a slot that was not used to submit anything"""
+        with self._transaction() as targets:
+            quota = targets.get(slot.target_id)
+            if quota is not None:
+                quota.claims.pop(slot.claim_id, None)
+
+    def record(self, slot: SpySlot, result: int) -> None:
+        """Count the SpyResult code of a submitted recon and give back its slot"""
+        with self._transaction() as targets:
+            quota = targets.setdefault(slot.target_id, _TargetQuota())
+            quota.claims.pop(slot.claim_id, None)
+            if quota.retired:
+                self._wasted += 1
+                return
+
+            quota.attempts += 1
+            if result in (SpyResult.SUCCESS, SpyResult.FAILURE):
+                quota.successes += 1
+            elif result in (SpyResult.LIMIT, SpyResult.ADMIN):
+                quota.retired = True
+            elif result != SpyResult.WRONG_CAPTCHA:
+                # ERROR or a page that could not be read
+                quota.errors += 1
+
+            if quota.successes >= self._max_spies \
+                    or quota.errors >= self._max_errors \
+                    or self._max_attempts is not None and quota.attempts >= self._max_attempts:
+                quota.retired = True
+
+    def retire(self, target_id: str) -> None:
+        with self._transaction() as targets:
+            targets.setdefault(str(target_id), _TargetQuota()).retired = True
+
+    def remaining(self, target_id: str) -> int:
+        """Recons that can still be claimed on a target"""
+        with self._transaction(write=False) as targets:
+            quota = targets.get(str(target_id))
+            return 0 if quota is None else self._capacity(quota)
+
+    def demand(self, among: Collection[str] = None) -> int:
+        """Recons that can still be claimed over every target, or those in among"""
+        with self._transaction(write=False) as targets:
+            return sum(
+                self._capacity(quota) for x, quota in targets.items()
+                if among is None or x in among)
+
+    def successes(self, target_id: str) -> int:
+        with self._transaction(write=False) as targets:
+            quota = targets.get(str(target_id))
+            return 0 if quota is None else quota.successes
+
+    def is_retired(self, target_id: str) -> bool:
+        with self._transaction(write=False) as targets:
+            quota = targets.get(str(target_id))
+            return quota is not None and quota.retired
+
+    @property
+    def retired(self) -> set:
+        with self._transaction(write=False) as targets:
+            return {x for x, quota in targets.items() if quota.retired}
+
+    def stats(self) -> dict:
+        with self._transaction(write=False) as targets:
+            return {
+                "targets": len(targets),
+                "retired": sum(x.retired for x in targets.values()),
+                "successes": sum(x.successes for x in targets.values()),
+                "attempts": sum(x.attempts for x in targets.values()),
+                "in_flight": sum(len(x.claims) for x in targets.values()),
+                "refused_claims": self._refused,
+                "wasted_submits": self._wasted,
+            }
+
+    def snapshot(self) -> dict[str, dict]:
+        """Counts for every target, without claims, for checkpoints"""
+        with self._transaction(write=False) as targets:
+            return {
+                x: {"successes": q.successes, "attempts": q.attempts,
+                    "errors": q.errors, "retired": q.retired}
+                for x, q in targets.items()
+            }
+
+    def restore(self, snapshot: dict[str, dict]) -> None:
+        """Take the counts of a snapshot, keeping any higher counts already held"""
+        with self._transaction() as targets:
+            for target_id, counts in snapshot.items():
+                quota = targets.setdefault(str(target_id), _TargetQuota())
+                quota.successes = max(quota.successes, int(counts["successes"]))
+                quota.attempts = max(quota.attempts, int(counts["attempts"]))
+                quota.errors = max(quota.errors, int(counts["errors"]))
+                quota.retired = quota.retired or bool(counts["retired"])
+
+    def _capacity(self, quota: _TargetQuota) -> int:
+        if quota.retired:
+            return 0
+        remaining = self._max_spies - quota.successes
+        if self._max_attempts is not None:
+            remaining = min(remaining, self._max_attempts - quota.attempts)
+        return max(0, remaining - len(quota.claims))
+
+    @contextlib.contextmanager
+    def _transaction(self, write: bool = True) -> Iterator[dict[str, _TargetQuota]]:
+        with self._lock:
+            if self._filelock is None:
+                yield self._targets
+                return
+
+            with self._filelock:
+                targets = self._load()
+                self._expire_claims(targets)
+                yield targets
+                if write:
+                    self._save(targets)
+
+    @staticmethod
+    def _expire_claims(targets: dict[str, _TargetQuota]) -> None:
+        now = time.time()
+        for quota in targets.values():
+            if quota.claims:
+                quota.claims = {k: v for k, v in quota.claims.items() if v > now}
+
+    def _load(self) -> dict[str, _TargetQuota]:
+        if not os.path.exists(self._path):
+            return {}
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable spy ledger {self._path}: {e}")
+            return {}
+        return {k: _TargetQuota(**v) for k, v in data.get("targets", {}).items()}
+
+    def _save(self, targets: dict[str, _TargetQuota]) -> None:
+        dirname = os.path.dirname(self._path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        data = {"targets": {k: dataclasses.asdict(v) for k, v in targets.items()}}
+        tmppath = self._path + ".tmp"
+        with open(tmppath, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmppath, self._path)
@@ -1,7 +1,14 @@
-from datetime import datetime
 from typing import Callable
+
+import numpy as np
+
+from rocalert.battlefieldtable import BattlefieldTable
 from rocalert.captcha.captchaprovider import CaptchaProvider
-from rocalert.services.rocwebservices import BFPageServiceABC, AttackServiceABC
+from rocalert.services.bfscanner import IncrementalBattlefieldScanner
+from rocalert.services.rocwebservices import (
+    AttackServiceABC,
+    BFPageServiceABC,
+)
 from rocalert.rocaccount import BattlefieldTarget
 from rocalert.roc_web_handler import RocWebHandler, Captcha
 from rocalert.rocpurchases import ROCBuyer
@@ -10,6 +17,8 @@ import time
 
 
 class BFSellCatch:
+    captcha_timeout = 1.5
+
     def __init__(
             self,
             bf_pageservce: BFPageServiceABC,
@@ -22,6 +31,8 @@ class BFSellCatch:
         self._buyer = buyer
         self._roc = roc
         self._captcha_provider = captcha_provider
+        # Ids of players that should be hit but have not been hit yet
+        self._pending: set[str] = set()
 
     def _get_all_users(self) -> None:
         pagenum = 1
@@ -36,25 +47,26 @@ class BFSellCatch:
             newuser = self._filterusers(user_resp['result'])
             self._battlefield.extend(newuser)
 
-    def _attack_target(self, target: BattlefieldTarget) -> bool:
+    def _attack_target(self, target: BattlefieldTarget) -> bool | None:
+        """Attack a target. Returns None if no attack was sent, otherwise
+        whether the captcha was answered correctly"""
         alliance = '-' if target.alliance is None else target.alliance
         print(f'Attacking {target.name} | {alliance}'
               + f' with {target.formatted_gold()} gold')
 
-        start = datetime.now()
-        captcha = self._captcha_provider.get_solved_captcha()
-        captcha_get_time = datetime.now() - start
+        captcha = self._captcha_provider.get_solved_captcha(
+            timeout=self.captcha_timeout)
 
-        if captcha_get_time.total_seconds() > 1.5:
+        if captcha is None:
             print("took to long to get captcha.. resetting")
-            return False
+            return None
 
         if captcha.hash == 'nocaptcha':
             captcha = None
-        self._attackservice.run_service(
+        correct = self._attackservice.run_service(
             self._roc, target, captcha)
 
-        return True
+        return correct is not False
 
     def _buy(self):
         payload = self._buyer.create_order_payload()
@@ -97,29 +109,75 @@ class BFSellCatch:
             self.consecutive_captcha_failures += 1
         return captcha
 
+    def _candidates(
+            self,
+            scanner: IncrementalBattlefieldScanner,
+            pnum: int
+    ) -> tuple[list[BattlefieldTarget], list[BattlefieldTarget]]:
+        """Every target on a page, and those to check for a hit: players
+        that changed since the last sweep and ones still waiting on a hit"""
+        pagetext = self._bfps.fetch_page_text(self._roc, pnum)
+        changed = {delta.id for delta in scanner.update_page(pnum, pagetext)}
+        targets = scanner.page_targets(pnum)
+        candidates = [x for x in targets if x.id in changed or x.id in self._pending]
+        return targets, candidates
+
     def run(
             self,
             shouldhit: Callable[[BattlefieldTarget], bool],
             pagedelay: float = 0.01,
             lowpage: int = 1,
-            highpage: int = 2
+            highpage: int = 2,
+            hitmask: Callable[[BattlefieldTable], np.ndarray] = None,
+            incremental: bool = False,
     ) -> None:
+        """
+        Args:
+            shouldhit: per target check, used when hitmask is not given
+            hitmask: vectorized check returning a mask over a page's table
+            incremental: after the first pass only check players whose page
+                entry changed, plus any that should be hit but were not
+        """
+        scanner = IncrementalBattlefieldScanner() if incremental else None
 
         while True:
+            if scanner is not None:
+                scanner.begin_sweep()
             for pnum in range(lowpage, highpage+1):
-                targets = self._bfps.run_service(self._roc, pnum)['result']
-                targets.sort(reverse=True, key=lambda x: x.gold)
+                if scanner is not None:
+                    targets, candidates = self._candidates(scanner, pnum)
+                else:
+                    targets = self._bfps.run_service(self._roc, pnum)['result']
+                    candidates = targets
+                top = max(targets, key=lambda x: x.gold) if len(targets) > 0 else None
+
+                if hitmask is not None:
+                    table = BattlefieldTable.from_targets(candidates)
+                    table = table.sort_by('gold', descending=True)
+                    hits = list(table.filter(hitmask(table)))
+                else:
+                    candidates = sorted(candidates, reverse=True, key=lambda x: x.gold)
+                    hits = [x for x in candidates if shouldhit(x)]
+
+                # A candidate that no longer qualifies stops waiting, one that
+                # does waits until an attack on it goes through
+                self._pending.difference_update(x.id for x in candidates)
+                self._pending.update(x.id for x in hits)
 
-                if len(targets) == 0:
+                if top is None:
                     print(f'Top Page {pnum}: No Targets')
                 else:
-                    print(f'Top Page {pnum}: {targets[0]}')
+                    print(f'Top Page {pnum}: {top}')
 
-                for target in targets:
-                    if shouldhit(target):
-                        hittarget = self._attack_target(target)
+                for target in hits:
+                    hittarget = self._attack_target(target)
+                    if hittarget is not None:
                         if hittarget:
-                            self._buy()
-                            break
+                            self._pending.discard(target.id)
+                        self._buy()
+                        break
 
                 time.sleep(pagedelay)
+            if scanner is not None:
+                for delta in scanner.end_sweep(lowpage, highpage):
+                    self._pending.discard(delta.id)
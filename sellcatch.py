@@ -1,4 +1,3 @@
-from datetime import datetime
 import html
 import random
 import threading
@@ -40,11 +39,11 @@ def getgoldfrompage(page: str) -> int:
 
 def getgold(roc: RocWebHandler, id: str):
     url = roc.url_generator.get_home() + f"stats.php?id={id}"
-    roc.go_to_page(url)
-    if roc.r.status_code != 200:
+    resp = roc.fetch_page(url)
+    if resp.status_code != 200:
         return -1
     else:
-        return getgoldfrompage(roc.r.text)
+        return getgoldfrompage(resp.text)
 
 
 def __load_browser_cookies(roc: RocWebHandler, us: UserSettings) -> bool:
@@ -93,13 +92,10 @@ def goldformat(gold: int) -> str:
 
 
 def attack(roc: RocWebHandler, id: str, captchacache: CaptchaProvider) -> bool:
-    start = datetime.now()
-    
     if use_captcha:
-        captcha = captchacache.get_solved_captcha()
-        captcha_get_time = datetime.now() - start
+        captcha = captchacache.get_solved_captcha(timeout=1.5)
 
-        if captcha_get_time.total_seconds() > 1.5:
+        if captcha is None:
             print("took to long to get captcha.. resetting")
             return False
     else:
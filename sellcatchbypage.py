@@ -1,5 +1,6 @@
 import os
 
+from rocalert.battlefieldtable import BattlefieldTable
 from rocalert.captcha.captchaprovider import CaptchaProvider
 from rocalert.cookiehelper import (
     load_cookies_from_browser,
@@ -18,12 +19,16 @@ from rocalert.specialtools import BFSellCatch
 use_captchas = False
 minpage = 30
 maxpage = 60
+# Only re-check players that are new or gained gold since the last pass
+incremental_scan = False
+
+badranks = [112, 666]
+badids = [7530]
+bad_alliance = ["Example Alliance Name"]
+mingold = 2.5 * (10**9)  # 2.5 x (1 billion) = 2.5 bn
+
 
 def _should_att(target: BattlefieldTarget):
-    badranks = [112, 666]
-    badids = [7530]
-    bad_alliance = ["Example Alliance Name"]
-    mingold = 2.5 * (10**9)  # 2.5 x (1 billion) = 2.5 bn
     if target.gold >= mingold:
         print(f"Detected {target.name} with {target.gold} gold")
 
@@ -35,6 +40,19 @@ def _should_att(target: BattlefieldTarget):
     )
 
 
+def _att_mask(table: BattlefieldTable):
+    rich = table.gold_at_least(mingold)
+    for target in table.filter(rich):
+        print(f"Detected {target.name} with {target.gold} gold")
+
+    return (
+        rich
+        & table.id_not_in(badids)
+        & table.rank_not_in(badranks)
+        & table.alliance_not_in(bad_alliance)
+    )
+
+
 def login(roc: RocWebHandler, us: UserSettings, cookie_filename="cookies"):
     print("Logging in.")
     if __load_cookies_file(roc, cookie_filename) and roc.is_logged_in():
@@ -139,4 +157,6 @@ if __name__ == "__main__":
     captcha_provider.start()
 
     sellcatch = BFSellCatch(ps, atts, buyer, rochandler, captcha_provider)
-    sellcatch.run(_should_att, 0.35, minpage, maxpage)
+    sellcatch.run(
+        _should_att, 0.35, minpage, maxpage,
+        hitmask=_att_mask, incremental=incremental_scan)
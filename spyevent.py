@@ -1,25 +1,34 @@
+import argparse
+import asyncio
 import time
-import random
 import os
 import pickle
 from os.path import exists
 from typing import List, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
 
 from rocalert.captcha.captcha_logger import CaptchaLogger
+from rocalert.captcha.imagehashindex import ImageHashIndex
 from rocalert.cookiehelper import (
     load_cookies_from_browser,
     load_cookies_from_path,
     save_cookies_to_path,
 )
+from rocalert.cookiestore import CookieStore
 from rocalert.events import SpyEvent
+from rocalert.roc_async_web_handler import AsyncRocWebHandler
 from rocalert.roc_settings import SettingsSetupHelper, UserSettings
 from rocalert.roc_web_handler import RocWebHandler
+from rocalert.battlefieldtable import BattlefieldTable
 from rocalert.rocaccount import BattlefieldTarget
 from rocalert.services import captchaservices
 from rocalert.services.urlgenerator import ROCDecryptUrlGenerator
-from rocalert.services.rocwebservices import BattlefieldPageService
+from rocalert.services.bfscanner import StagedBattlefieldScanner
+from rocalert.services.rocwebservices import BattlefieldPageService, SpyResult
+from rocalert.services.sessionpool import SessionPool
+from rocalert.services.spyengine import PipelinedSpyEngine
+from rocalert.services.spyledger import SpyQuotaLedger
+from rocalert.services.spycheckpoint import CheckpointWriter, load_checkpoint, save_checkpoint
 
 lower_rank_cutoff = 0
 upper_rank_cutoff = None
@@ -40,15 +49,38 @@ lower_page_range = 1
 upper_page_range = None  # If None, will automatically find the largest page
 
 login_sessions = 10
-bf_scan_workers = 10
-bf_async_scan_pages = 5
+workers_per_session = 5  # spy workers sharing one session at a time
+session_lease_timeout = 60  # seconds a worker waits for a free session
+session_check_interval = 300  # seconds idle before a session's login is checked
+bf_scan_workers = 10  # threads downloading battlefield pages
+bf_parse_workers = None  # processes parsing pages. None uses every CPU
 spy_workers = 50
 spy_async_spy_counts = 10
 
+# With the ai captcha method, load, solve and submit spy captchas in
+# overlapping stages instead of one after another per user
+use_spy_pipeline = True
+spy_harvest_workers = 20  # captchas loading at once
+spy_solve_workers = 20  # captchas being solved at once
+spy_submit_workers = 20  # recons being submitted at once
+spy_queue_size = 20  # captchas waiting between stages
+spy_stats_interval = 30  # seconds between pipeline stats. None to disable
+# File to share spy quotas with other spy processes, e.g. "logs/spy_ledger.json"
+spy_ledger_path = None
+max_spies_per_user = 10
+
+# Scanned targets and recon counts are saved here while spying so that
+# --resume can skip the scan and the users already finished
+checkpoint_path = "logs/spyevent_checkpoint.npz"
+checkpoint_interval = 30  # seconds
+
 cookie_filename = "cookies" # this is old, dont use it to save the 10 cookies
 
 captchasavepath = "captcha_img/"
 captchaans_log = "logs/spyevent.log"
+# Answer captchas that look like ones solved before without asking the solver
+use_image_index = True
+image_index_max_distance = 4
 
 skip_idsstr = {str(id) for id in skip_ids}
 onlyspy_idsstr = {str(id) for id in onlyspy_ids}
@@ -60,49 +92,66 @@ class SessionManager:
     def __init__(self, user_settings: UserSettings, num_sessions: int):
         self.user_settings = user_settings
         self.num_sessions = num_sessions
-        self.sessions: List[RocWebHandler] = []
-        self.session_lock = Lock()
         self.session_dir = "sessions"
+        self.cookie_store = CookieStore(os.path.join(self.session_dir, "cookies.json"))
+        self._starting = False
+        self.pool = SessionPool(
+            self._new_session,
+            num_sessions,
+            leases_per_session=workers_per_session,
+            login_workers=num_sessions,
+            health_check=lambda roc: roc.is_logged_in(),
+            check_interval=session_check_interval,
+        )
         
         # Create sessions directory if it doesn't exist
         if not os.path.exists(self.session_dir):
             os.makedirs(self.session_dir)
+
+    @property
+    def sessions(self) -> List[RocWebHandler]:
+        """Every healthy logged in session"""
+        return self.pool.sessions
     
     def create_sessions(self) -> bool:
-        """Create and login the specified number of sessions"""
+        """Log in the specified number of sessions in parallel"""
         print(f"Creating {self.num_sessions} login sessions...")
-        
-        success_count = 0
-        for i in range(self.num_sessions):
-            try:
-                roc = RocWebHandler(ROCDecryptUrlGenerator())
-                if self._login_session(roc, i):
-                    self.sessions.append(roc)
-                    success_count += 1
-                    print(f"Session {i+1}/{self.num_sessions} created successfully")
-                else:
-                    print(f"Failed to create session {i+1}/{self.num_sessions}")
-                
-                # Small delay between logins
-                # time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error creating session {i+1}: {e}")
-        
+        self._starting = True
+        try:
+            success_count = self.pool.start()
+        finally:
+            self._starting = False
+            self._flush_cookies()
         print(f"Successfully created {success_count}/{self.num_sessions} sessions")
         return success_count > 0
+
+    def lease(self, timeout: Optional[float] = session_lease_timeout):
+        """Context manager lending out the healthiest free session"""
+        return self.pool.lease(timeout)
+
+    def close(self) -> None:
+        print(f"Session pool: {self.pool.stats()}")
+        self.pool.close()
+
+    def _new_session(self, session_id: int) -> Optional[RocWebHandler]:
+        roc = RocWebHandler(ROCDecryptUrlGenerator(), reentrant=True)
+        if self._login_session(roc, session_id):
+            print(f"Session {session_id + 1}/{self.num_sessions} logged in")
+            return roc
+        print(f"Failed to log in session {session_id + 1}/{self.num_sessions}")
+        return None
     
     def _login_session(self, roc: RocWebHandler, session_id: int) -> bool:
         """Login a single session and save cookies"""
-        session_file = os.path.join(self.session_dir, f"session_{session_id}.cookies")
+        jar_name = f"session_{session_id}"
         
         # Try to load existing cookies first
-        if self._load_session_cookies(roc, session_file) and roc.is_logged_in():
+        if self._load_session_cookies(roc, jar_name) and roc.is_logged_in():
             return True
         
         # Try browser cookies
         if self._load_browser_cookies(roc) and roc.is_logged_in():
-            self._save_session_cookies(roc, session_file)
+            self._save_session_cookies(roc, jar_name)
             return True
         
         # Perform fresh login
@@ -114,30 +163,39 @@ class SessionManager:
             # time.sleep(0.5)
             
             if roc.is_logged_in():
-                self._save_session_cookies(roc, session_file)
+                self._save_session_cookies(roc, jar_name)
                 return True
         except Exception as e:
             print(f"Login error for session {session_id}: {e}")
         
         return False
     
-    def _load_session_cookies(self, roc: RocWebHandler, session_file: str) -> bool:
-        """Load cookies from session file"""
-        if os.path.exists(session_file):
+    def _load_session_cookies(self, roc: RocWebHandler, jar_name: str) -> bool:
+        """Load cookies from the cookie store, or a session file from older versions"""
+        cookies = self.cookie_store.load(jar_name)
+        if cookies is None:
+            session_file = os.path.join(self.session_dir, f"{jar_name}.cookies")
+            if not os.path.exists(session_file):
+                return False
             try:
                 with open(session_file, 'rb') as f:
                     cookies = pickle.load(f)
-                    roc.add_cookies(cookies)
-                    return True
             except Exception as e:
                 print(f"Error loading session cookies: {e}")
-        return False
+                return False
+        roc.add_cookies(cookies)
+        return True
     
-    def _save_session_cookies(self, roc: RocWebHandler, session_file: str):
-        """Save cookies to session file"""
+    def _save_session_cookies(self, roc: RocWebHandler, jar_name: str):
+        """Save cookies to the cookie store if they changed"""
+        self.cookie_store.update(jar_name, roc.get_cookies())
+        # Logins at startup are written together once they all finish
+        if not self._starting:
+            self._flush_cookies()
+
+    def _flush_cookies(self) -> None:
         try:
-            with open(session_file, 'wb') as f:
-                pickle.dump(roc.get_cookies(), f)
+            self.cookie_store.save()
         except Exception as e:
             print(f"Error saving session cookies: {e}")
     
@@ -155,36 +213,61 @@ class SessionManager:
             except Exception as e:
                 print(f"Error loading browser cookies: {e}")
         return False
-    
-    def get_random_session(self) -> Optional[RocWebHandler]:
-        """Get a random available session"""
-        with self.session_lock:
-            if not self.sessions:
-                return None
-            return random.choice(self.sessions)
+
+
+class AsyncSessionView:
+    """A session pool's healthy sessions as async handlers sharing their cookies.
+
+    Handlers are made on first use, so sessions the pool logs in again are
+    picked up, and reports on a handler go to the session it was made from.
+    """
+
+    def __init__(self, pool: SessionPool) -> None:
+        self._pool = pool
+        # id of the pooled session to it and its async handler
+        self._handlers = {}
+        # id of an async handler to the pooled session it was made from
+        self._sources = {}
+
+    @property
+    def sessions(self) -> List[AsyncRocWebHandler]:
+        sessions = []
+        for roc in self._pool.sessions:
+            if id(roc) not in self._handlers:
+                session = AsyncRocWebHandler(ROCDecryptUrlGenerator(), default_headers=roc.headers)
+                session.add_cookies(roc.get_cookies())
+                self._handlers[id(roc)] = (roc, session)
+                self._sources[id(session)] = roc
+            sessions.append(self._handlers[id(roc)][1])
+        return sessions
+
+    def report(self, session: AsyncRocWebHandler, seconds: Optional[float] = None,
+               ok: bool = True, logged_in: bool = True) -> None:
+        roc = self._sources.get(id(session))
+        if roc is not None:
+            self._pool.report(roc, seconds, ok=ok, logged_in=logged_in)
+
+    async def aclose(self) -> None:
+        for _, session in self._handlers.values():
+            await session.aclose()
 
 
 class BattlefieldScanningWorkers:
     """Manages battlefield page scanning with multiple workers"""
     
-    def __init__(self, session_manager: SessionManager, num_workers: int, pages_per_batch: int):
+    def __init__(self, session_manager: SessionManager, num_workers: int, parse_workers: Optional[int]):
         self.session_manager = session_manager
         self.num_workers = num_workers
-        self.pages_per_batch = pages_per_batch
+        self.parse_workers = parse_workers
     
     def scan_battlefield_pages(self) -> List[BattlefieldTarget]:
         """Scan battlefield pages using multiple workers"""
-        # Get total page range using first available session
-        session = self.session_manager.get_random_session()
-        if not session:
-            print("No sessions available for battlefield scanning")
-            return []
-        
         try:
             # Use configured page range or get from battlefield
             if upper_page_range is None:
                 # Get the maximum page from battlefield
-                _, max_page = BattlefieldPageService.get_page_range(session)
+                with self.session_manager.lease() as session:
+                    _, max_page = BattlefieldPageService.get_page_range(session)
                 actual_lower = lower_page_range
                 actual_upper = max_page
                 print(f'Using configured lower page ({lower_page_range}) and auto-detected upper page ({max_page})')
@@ -194,88 +277,57 @@ class BattlefieldScanningWorkers:
                 actual_upper = upper_page_range
                 print(f'Using configured page range: {actual_lower} to {actual_upper}')
             
-            print(f'Battlefield scanning: Pages {actual_lower} to {actual_upper} with {self.num_workers} workers')
+            print(f'Battlefield scanning: Pages {actual_lower} to {actual_upper} with {self.num_workers} fetch workers')
         except Exception as e:
             print(f"Error getting page range: {e}")
             return []
         
-        all_users = []
-        page_ranges = []
-        
-        # Create page ranges for workers
-        for start in range(actual_lower, actual_upper + 1, self.pages_per_batch):
-            end = min(start + self.pages_per_batch - 1, actual_upper)
-            page_ranges.append((start, end))
-        
-        # Process page ranges with workers
-        import time
-        scan_start = time.time()
-        completed_ranges = 0
-        
-        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
-            future_to_range = {
-                executor.submit(self._scan_page_range, start, end): (start, end)
-                for start, end in page_ranges
-            }
-            
-            for future in as_completed(future_to_range):
-                start, end = future_to_range[future]
-                try:
-                    users = future.result()
-                    all_users.extend(users)
-                    completed_ranges += 1
-                    elapsed = time.time() - scan_start
-                    print(f'Scanned pages {start}-{end}: {len(users)} users ({completed_ranges}/{len(page_ranges)} ranges) - Elapsed: {elapsed:.1f}s')
-                except Exception as e:
-                    print(f'Error scanning pages {start}-{end}: {e}')
+        with StagedBattlefieldScanner(
+            self.session_manager.sessions,
+            fetch_workers=self.num_workers,
+            parse_workers=self.parse_workers,
+        ) as scanner:
+            all_users = scanner.scan(actual_lower, actual_upper)
         
-        total_scan_time = time.time() - scan_start
-        print(f'Total users scanned: {len(all_users)} in {total_scan_time:.2f} seconds')
+        print(f'Total users scanned: {len(all_users)}')
+        print(f'Scan stages: {scanner.stats}')
         return all_users
-    
-    def _scan_page_range(self, start_page: int, end_page: int) -> List[BattlefieldTarget]:
-        """Scan a range of pages using a single worker"""
-        session = self.session_manager.get_random_session()
-        if not session:
-            return []
-        
-        users = []
-        for pagenum in range(start_page, end_page + 1):
-            try:
-                user_resp = BattlefieldPageService.run_service(session, pagenum)
-                if user_resp['response'] == 'success':
-                    users.extend(user_resp['result'])
-                else:
-                    print(f'Error loading page {pagenum}: {user_resp.get("error", "Unknown error")}')
-                
-                # Small delay between pages
-                # time.sleep(0.1)
-                
-            except Exception as e:
-                print(f'Exception loading page {pagenum}: {e}')
-        
-        return users
 
 
 class SpyWorkers:
     """Manages spy operations with multiple workers"""
     
-    def __init__(self, session_manager: SessionManager, num_workers: int, spy_attempts_per_batch: int):
+    def __init__(self, session_manager: SessionManager, num_workers: int, spy_attempts_per_batch: int,
+                 image_index: Optional[ImageHashIndex] = None):
         self.session_manager = session_manager
         self.num_workers = num_workers
         self.spy_attempts_per_batch = spy_attempts_per_batch
+        self.image_index = image_index
         self.url_generator = ROCDecryptUrlGenerator()
-        self.completed_users = set()  # Track users who are completely spied on
+        # Recon slots per user, shared by every worker
+        # spy_attempts_per_batch only caps one pass over a user, see
+        # _spy_user_multiple_attempts, so wrong captchas never use up recons
+        self.ledger = SpyQuotaLedger(
+            max_spies=max_spies_per_user,
+            path=spy_ledger_path,
+        )
+
+    @property
+    def completed_users(self) -> set:
+        """Users who are completely spied on"""
+        return self.ledger.retired
     
-    def spy_on_users(self, users: List[BattlefieldTarget], user_filter_func, captcha_method: str, solver=None) -> None:
+    def spy_on_users(self, users: List[BattlefieldTarget], captcha_method: str, solver=None) -> None:
         """Spy on users using multiple workers"""
         import time
         spy_operation_start = time.time()
         
-        filtered_users = [user for user in users if user_filter_func(user) and user.id not in self.completed_users]
+        completed = self.completed_users
+        filtered_users = [user for user in users if str(user.id) not in completed]
         if not filtered_users:
             print("No users to spy on after filtering (all users already completed)")
             return
+        self.ledger.add_targets(user.id for user in filtered_users)
         
         print(f'Starting spy operations on {len(filtered_users)} users with {self.num_workers} workers')
         print(f'Users already completed: {len(self.completed_users)}')
@@ -305,41 +357,75 @@ class SpyWorkers:
                     result = future.result()
                     completed_workers += 1
                     elapsed = time.time() - spy_operation_start
-                    print(f'{worker_name} completed ({completed_workers}/{len(future_to_worker)}): {result} - Elapsed: {elapsed:.1f}s')
+                    print(f'{worker_name} completed ({completed_workers}/{len(future_to_worker)}): '
+                          + f'{result} - Elapsed: {elapsed:.1f}s')
                 except Exception as e:
                     print(f'{worker_name} failed: {e}')
         
         total_spy_time = time.time() - spy_operation_start
-        print(f'Spy operations completed in {total_spy_time:.2f} seconds. Total users fully spied: {len(self.completed_users)}')
+        print(f'Spy operations completed in {total_spy_time:.2f} seconds. '
+              + f'Total users fully spied: {len(self.completed_users)}')
+
+    def spy_on_users_pipelined(self, users: List[BattlefieldTarget], solver) -> None:
+        """Spy on users with captcha loading, solving and submitting overlapped"""
+        completed = self.completed_users
+        filtered_users = [user for user in users if str(user.id) not in completed]
+        if not filtered_users:
+            print("No users to spy on after filtering (all users already completed)")
+            return
+
+        print(f'Starting pipelined spy operations on {len(filtered_users)} users: '
+              + f'{spy_harvest_workers} loading, {spy_solve_workers} solving, {spy_submit_workers} submitting')
+        stats = asyncio.run(self._run_pipeline(filtered_users, solver))
+        print(f'Spy pipeline finished. Total users fully spied: {len(self.completed_users)}')
+        print(stats)
+        print(f'Spy quotas: {self.ledger.stats()}')
+
+    async def _run_pipeline(self, users: List[BattlefieldTarget], solver):
+        # The pool drains sessions the engine finds slow or logged out and
+        # the engine takes up the ones it logs in again
+        sessions = AsyncSessionView(self.session_manager.pool)
+        engine = PipelinedSpyEngine(
+            [],
+            solver,
+            harvest_workers=spy_harvest_workers,
+            solve_workers=spy_solve_workers,
+            submit_workers=spy_submit_workers,
+            queue_size=spy_queue_size,
+            image_index=self.image_index,
+            report_interval=spy_stats_interval,
+            ledger=self.ledger,
+            session_pool=sessions,
+        )
+        try:
+            return await engine.run(users)
+        finally:
+            await sessions.aclose()
     
     def _spy_worker(self, users: List[BattlefieldTarget], captcha_method: str, solver=None) -> dict:
         """Single spy worker that processes a batch of users"""
-        session = self.session_manager.get_random_session()
-        if not session:
-            return {"error": "No session available"}
-        
         stats = {"users_processed": 0, "successful_spies": 0, "errors": 0, "completed_users": 0}
         
         for user in users:
             try:
                 # Skip if user is already completed
-                if user.id in self.completed_users:
+                if self.ledger.is_retired(user.id):
                     continue
                 
                 #print(f'Worker spying on user #{user.rank}: {user.name}')
                 
-                # Perform spy attempts for this user
-                spy_results = self._spy_user_multiple_attempts(
-                    session, user, self.spy_attempts_per_batch, captcha_method, solver
-                )
+                # Perform spy attempts for this user, leasing a session per
+                # user so unhealthy ones are swapped out between users
+                with self.session_manager.lease() as session:
+                    spy_results = self._spy_user_multiple_attempts(
+                        session, user, self.spy_attempts_per_batch, captcha_method, solver
+                    )
                 
                 stats["users_processed"] += 1
                 stats["successful_spies"] += spy_results["successful"]
                 stats["errors"] += spy_results["errors"]
                 
-                # Mark user as completed if they hit limit or reached max attempts
                 if spy_results["completed"]:
-                    self.completed_users.add(user.id)
                     stats["completed_users"] += 1
                     print(f'✅ User #{user.rank}: {user.name} - COMPLETED (fully spied)')
                 
@@ -354,7 +440,7 @@ class SpyWorkers:
     
     def _spy_user_multiple_attempts(self, session: RocWebHandler, user: BattlefieldTarget, 
                                   num_attempts: int, captcha_method: str, solver=None) -> dict:
-        """Perform multiple spy attempts on a single user"""
+        """Perform spy attempts on a single user while the ledger has recons left for them"""
         targeturl = self.url_generator.get_home() + f'/attack.php?id={user.id}&mission_type=recon'
         payload = {
             'defender_id': user.id,
@@ -364,16 +450,16 @@ class SpyWorkers:
         }
         
         results = {"successful": 0, "errors": 0, "completed": False}
-        max_spies_per_user = 10  # Maximum spies allowed per user
         
         for attempt in range(num_attempts):
+            # Claim before loading a captcha so none are solved for a user
+            # another worker has already finished
+            slot = self.ledger.claim(user.id)
+            if slot is None:
+                break
+
+            result = None
             try:
-                # Stop if we've reached the maximum spies for this user
-                if results["successful"] >= max_spies_per_user:
-                    results["completed"] = True
-                    print(f'Reached max spies ({max_spies_per_user}) for user {user.name}')
-                    break
-                
                 # Handle captcha based on method
                 captcha = None
                 if captcha_method == "manual":
@@ -384,44 +470,62 @@ class SpyWorkers:
                     # Get and solve captcha automatically
                     captcha = session.get_img_captcha('roc_armory')
                     if captcha:
-                        solved_captcha = solver.solve_captcha(captcha)
-                        captcha.ans = solved_captcha.ans
+                        match = self.image_index.lookup(captcha.img) if self.image_index else None
+                        if match is not None:
+                            captcha.ans = match.answer
+                        else:
+                            # Some solvers return None and only set captcha.ans
+                            solver.solve_captcha(captcha)
                 
                 # Submit spy request
-                valid_captcha = session.submit_captcha_url(
+                submit_start = time.time()
+                resp = session.submit_page(
                     captcha, targeturl, payload, session.Pages.SPY
                 )
+                result = SpyResult.from_response(resp).result
+                self.session_manager.pool.report(
+                    session, time.time() - submit_start, logged_in=resp.logged_in)
+                if not resp.logged_in:
+                    # The session's fault, not the user's
+                    print(f'Session logged out while spying on {user.name}')
+                    result = None
+                    break
                 
-                if valid_captcha:
+                if captcha is not None and self.image_index is not None:
+                    if resp.captcha_correct:
+                        self.image_index.add(captcha.img, captcha.ans, captcha.hash)
+                    else:
+                        self.image_index.reject(captcha.img, captcha.ans)
+
+                if result == SpyResult.WRONG_CAPTCHA:
+                    results["errors"] += 1
+                elif result == SpyResult.LIMIT:
+                    print(f'Reached spy limit for user {user.name}')
+                elif result == SpyResult.ADMIN:
+                    print(f'Detected admin account {user.name}')
+                elif result in (SpyResult.SUCCESS, SpyResult.FAILURE):
                     results["successful"] += 1
-                    if 'You cannot recon this person' in session.r.text:
-                        print(f'Reached spy limit for user {user.name}')
-                        results["completed"] = True
-                        break
-                    elif 'Administrator account' in session.r.text:
-                        print(f'Detected admin account {user.name}')
-                        results["completed"] = True
-                        break
                 else:
                     results["errors"] += 1
                 
-                # Small delay between attempts
-                #  time.sleep(0.2)
-                
             except Exception as e:
                 print(f'Spy attempt {attempt + 1} failed for {user.name}: {e}')
+                self.session_manager.pool.report(session, ok=False)
                 results["errors"] += 1
+            finally:
+                if result is None:
+                    # No recon was made, so the slot is still available
+                    self.ledger.release(slot)
+                else:
+                    self.ledger.record(slot, result)
         
-        # Mark as completed if we've done the maximum attempts or hit limits
-        if results["successful"] >= max_spies_per_user or results["completed"]:
-            results["completed"] = True
-        
+        results["completed"] = self.ledger.is_retired(user.id)
         return results
 
 
 def user_filter(user: BattlefieldTarget) -> bool:
     if onlyspy_idsstr and len(onlyspy_idsstr) > 0:
-        return user in onlyspy_idsstr
+        return str(user.id) in onlyspy_idsstr
 
     if (
         lower_rank_cutoff
@@ -431,7 +535,19 @@ def user_filter(user: BattlefieldTarget) -> bool:
     ):
         return False
 
-    return not (user.rank in skip_ranks or user.id in skip_idsstr)
+    return not (user.rank in skip_ranks or str(user.id) in skip_idsstr)
+
+
+def user_mask(table: BattlefieldTable):
+    """Vectorized user_filter over a whole battlefield"""
+    if onlyspy_ids:
+        return table.id_in(onlyspy_ids)
+
+    return (
+        table.rank_between(lower_rank_cutoff, upper_rank_cutoff)
+        & table.rank_not_in(skip_ranks)
+        & table.id_not_in(skip_ids)
+    )
 
 
 def __load_browser_cookies(roc: RocWebHandler, us: UserSettings) -> bool:
@@ -501,7 +617,7 @@ def valid_captcha_method(method: str) -> bool:
         ))
     return (False, "Invalid captcha method")
 
-def runevent_new():
+def runevent_new(resume: bool = False):
     # Start timing the entire event
     import time
     start_time = time.time()
@@ -543,25 +659,38 @@ def runevent_new():
     session_time = time.time() - session_start
     print(f"✅ Session setup completed in {session_time:.2f} seconds")
     
-    # Create battlefield scanning workers
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if resume and checkpoint is None:
+        print(f"No spy checkpoint at {checkpoint_path}, scanning the battlefield")
+
     bf_scan_start = time.time()
-    print(f"Setting up battlefield scanning with {bf_scan_workers} workers, {bf_async_scan_pages} pages per batch...")
-    bf_scanner = BattlefieldScanningWorkers(session_manager, bf_scan_workers, bf_async_scan_pages)
-    
-    # Scan battlefield pages
-    print("Scanning battlefield pages...")
-    all_users = bf_scanner.scan_battlefield_pages()
-    
-    if not all_users:
-        print("No users found during battlefield scan. Exiting.")
-        quit()
+    if checkpoint is not None:
+        bf_table = checkpoint.table
+        print(f"✅ Resumed {len(bf_table)} scanned users from a checkpoint "
+              + f"saved {checkpoint.age_seconds / 60:.1f} minutes ago")
+    else:
+        # Create battlefield scanning workers
+        print(f"Setting up battlefield scanning with {bf_scan_workers} fetch workers, "
+              + f"{bf_parse_workers or os.cpu_count()} parse workers...")
+        bf_scanner = BattlefieldScanningWorkers(session_manager, bf_scan_workers, bf_parse_workers)
+        
+        # Scan battlefield pages
+        print("Scanning battlefield pages...")
+        all_users = bf_scanner.scan_battlefield_pages()
+        
+        if not all_users:
+            print("No users found during battlefield scan. Exiting.")
+            quit()
+
+        bf_table = BattlefieldTable.from_targets(all_users)
+        save_checkpoint(checkpoint_path, bf_table, progress={"phase": "scanned"})
     
     bf_scan_time = time.time() - bf_scan_start
     print(f"✅ Battlefield scanning completed in {bf_scan_time:.2f} seconds")
     
     # Filter users
     filter_start = time.time()
-    filtered_users = [user for user in all_users if user_filter(user)]
+    filtered_users = bf_table.filter(user_mask(bf_table)).to_targets()
     filter_time = time.time() - filter_start
     print(f"Found {len(filtered_users)} users to spy on after filtering ({filter_time:.2f}s)")
     
@@ -572,12 +701,37 @@ def runevent_new():
     # Create spy workers and perform spying
     spy_start = time.time()
     print(f"Setting up spy operations with {spy_workers} workers, {spy_async_spy_counts} attempts per user...")
-    spy_worker_manager = SpyWorkers(session_manager, spy_workers, spy_async_spy_counts)
-    
+    image_index = None
+    if use_image_index and captcha_method == "ai":
+        image_index = ImageHashIndex.from_logs(
+            captchasavepath, "logs/correct_ans.log",
+            cachepath="logs/captcha_dhash.npz",
+            max_distance=image_index_max_distance)
+        print(f"Loaded {len(image_index)} solved captcha images for matching")
+    spy_worker_manager = SpyWorkers(session_manager, spy_workers, spy_async_spy_counts, image_index)
+    if checkpoint is not None:
+        spy_worker_manager.ledger.restore(checkpoint.ledger)
+        print(f"Resuming with {len(spy_worker_manager.completed_users)} users already completed")
+
+    progress = {"phase": "spying"}
+
+    def checkpoint_progress() -> dict:
+        return dict(progress, completed_users=len(spy_worker_manager.completed_users))
+
     # Perform spy operations
-    spy_worker_manager.spy_on_users(filtered_users, user_filter, captcha_method, solver)
+    with CheckpointWriter(checkpoint_path, bf_table, spy_worker_manager.ledger,
+                          interval=checkpoint_interval, progress=checkpoint_progress):
+        try:
+            if use_spy_pipeline and captcha_method == "ai" and solver:
+                spy_worker_manager.spy_on_users_pipelined(filtered_users, solver)
+            else:
+                spy_worker_manager.spy_on_users(filtered_users, captcha_method, solver)
+            progress["phase"] = "done"
+        finally:
+            progress["spy_seconds"] = time.time() - spy_start
     
     spy_time = time.time() - spy_start
+    session_manager.close()
     total_time = time.time() - start_time
     
     print("\n" + "="*60)
@@ -590,10 +744,19 @@ def runevent_new():
     print(f"   Spy Operations:    {spy_time:.2f} seconds")
     print(f"   ⏱️  TOTAL TIME:      {total_time:.2f} seconds ({total_time/60:.2f} minutes)")
     print(f"📈 STATISTICS:")
-    print(f"   Total Users Found: {len(all_users)}")
+    print(f"   Total Users Found: {len(bf_table)}")
     print(f"   Users Spied On:    {len(filtered_users)}")
     print(f"   Users Completed:   {len(spy_worker_manager.completed_users)}")
+    if image_index is not None:
+        stats = image_index.stats()
+        print(f"   Image Index Hits:  {stats['hits']}/{stats['lookups']} "
+              + f"({stats['hit_rate']:.0%}, {stats['mean_lookup_ms']:.2f}ms per lookup)")
     print("="*60)
 
 
-runevent_new()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a spy event")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help=f"continue from {checkpoint_path} instead of scanning the battlefield again")
+    runevent_new(resume=parser.parse_args().resume)
@@ -2,6 +2,7 @@ import typing
 import datetime as dt
 import dataclasses
 
+from rocalert.accountstate import AccountState
 from rocalert.pages.training import RocTrainingTableEntry
 from rocalert.pages.genericpages import WeaponDistTableEntry
 
@@ -160,6 +161,7 @@ class UserSettings:
 class RocWebHandler:
     def __init__(self, current_gold=None,) -> None:
         self._currentgold = current_gold
+        self.account_state = AccountState()
 
     def current_gold(self) -> int:
         if self._currentgold is None:
@@ -0,0 +1,117 @@
+import random
+import unittest
+
+from rocalert.roc_web_handler import Captcha
+from rocalert.services.captchaservices import (
+    AdaptiveCaptchaSolverService,
+    CaptchaSolveException,
+    SolverStats,
+)
+from tests.service_tests.test_racingsolver import FakeSolver
+
+
+def _solve(sut: AdaptiveCaptchaSolverService, hash: str = "abc", correct: bool = True) -> Captcha:
+    captcha = sut.solve_captcha(Captcha(hash, b"img"))
+    captcha.ans_correct = correct
+    sut.report_captcha(captcha)
+    return captcha
+
+
+class SolverStatsTest(unittest.TestCase):
+    def test_accuracy_decays_toward_recent_results(self):
+        sut = SolverStats(decay=0.5)
+        for _ in range(10):
+            sut.record_report(False)
+
+        self.assertLess(sut.accuracy, 0.01)
+        sut.record_report(True)
+        self.assertAlmostEqual(sut.accuracy, 0.5, places=2)
+
+    def test_backoff_doubles(self):
+        sut = SolverStats()
+        sut.record_error(0.1, 100, base_backoff=5, max_backoff=12)
+        self.assertEqual(sut.backoff_until, 105)
+        sut.record_error(0.1, 100, base_backoff=5, max_backoff=12)
+        self.assertEqual(sut.backoff_until, 110)
+        sut.record_error(0.1, 100, base_backoff=5, max_backoff=12)
+        self.assertEqual(sut.backoff_until, 112)
+
+    def test_expected_seconds_grows_with_failures(self):
+        good, bad = SolverStats(), SolverStats()
+        for stats in (good, bad):
+            stats.record_solve(1.0)
+        for _ in range(20):
+            bad.record_report(False)
+
+        self.assertGreater(bad.expected_seconds(), good.expected_seconds())
+        self.assertGreater(bad.expected_seconds(2), bad.expected_seconds())
+        self.assertEqual(good.expected_seconds(2), good.expected_seconds())
+
+
+class AdaptiveCaptchaSolverServiceTest(unittest.TestCase):
+    def _sut(self, solvers: dict, **kwargs) -> AdaptiveCaptchaSolverService:
+        return AdaptiveCaptchaSolverService(solvers, explore=0, rng=random.Random(0), **kwargs)
+
+    def test_prefers_faster_solver(self):
+        fast = FakeSolver("1", delay=0.001)
+        slow = FakeSolver("2", delay=0.02)
+        sut = self._sut({"slow": slow, "fast": fast})
+
+        answers = [_solve(sut, f"h{i}").ans for i in range(10)]
+
+        self.assertEqual(answers[-5:], ["1"] * 5)
+
+    def test_prefers_accurate_solver(self):
+        wrong = FakeSolver("1")
+        right = FakeSolver("2", delay=0.005)
+        sut = self._sut({"wrong": wrong, "right": right})
+
+        for i in range(20):
+            captcha = sut.solve_captcha(Captcha(f"h{i}", b"img"))
+            captcha.ans_correct = captcha.ans == "2"
+            sut.report_captcha(captcha)
+
+        self.assertEqual(sut.solve_captcha(Captcha("last", b"img")).ans, "2")
+        self.assertLess(sut.stats()["wrong"]["accuracy"], 0.5)
+
+    def test_falls_through_and_backs_off_failing_solver(self):
+        broken = FakeSolver("1", error=True)
+        working = FakeSolver("2", delay=0.01)
+        sut = self._sut({"broken": broken, "working": working}, base_backoff=60)
+
+        self.assertEqual(_solve(sut, "a").ans, "2")
+        self.assertEqual(_solve(sut, "b").ans, "2")
+
+        stats = sut.stats()
+        self.assertEqual(stats["broken"]["errors"], 1)
+        self.assertGreater(stats["broken"]["backoff_seconds"], 0)
+
+    def test_raises_when_all_fail(self):
+        sut = self._sut({"broken": FakeSolver("1", error=True)})
+
+        with self.assertRaises(CaptchaSolveException):
+            sut.solve_captcha(Captcha("abc", b"img"))
+
+    def test_reports_to_answering_solver(self):
+        first = FakeSolver("1")
+        second = FakeSolver("2", delay=0.01)
+        sut = self._sut({"first": first, "second": second})
+
+        _solve(sut, "abc")
+
+        self.assertEqual(first.reported + second.reported, ["abc"])
+
+    def test_costly_solver_avoided_with_cost_weight(self):
+        cheap = FakeSolver("1", delay=0.01)
+        costly = FakeSolver("2")
+        sut = self._sut({"cheap": cheap, "costly": costly},
+                        costs={"costly": 1.0}, cost_weight=10)
+
+        answers = [_solve(sut, f"h{i}").ans for i in range(5)]
+
+        self.assertEqual(answers, ["1"] * 5)
+        self.assertEqual(sut.stats()["costly"]["solves"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
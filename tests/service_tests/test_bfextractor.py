@@ -0,0 +1,62 @@
+import os
+import unittest
+
+from rocalert.services.bfextractor import BattlefieldExtractor
+from rocalert.services.rocwebservices import BattlefieldPageService
+
+
+def _read_testpage(path: str) -> str:
+    filepath = os.path.join(os.path.dirname(os.path.dirname(__file__)), path)
+    with open(filepath, encoding="utf-8") as f:
+        return f.read()
+
+
+BATTLEFIELD_PAGES = ["testpages/battlefield/battlefield_p3.html"]
+
+
+class BattlefieldExtractorTest(unittest.TestCase):
+    def test_targets_match_soup_parser(self):
+        for path in BATTLEFIELD_PAGES:
+            with self.subTest(path=path):
+                text = _read_testpage(path)
+                expected = BattlefieldPageService.parse_page_soup(text, 3)
+                actual = BattlefieldPageService.parse_page(text, 3)
+
+                self.assertEqual(actual["response"], expected["response"])
+                self.assertEqual(
+                    [vars(x) for x in actual["result"]],
+                    [vars(x) for x in expected["result"]],
+                )
+
+    def test_page_range_matches_soup_parser(self):
+        for path in BATTLEFIELD_PAGES:
+            with self.subTest(path=path):
+                text = _read_testpage(path)
+                self.assertEqual(
+                    BattlefieldPageService.parse_page_range(text),
+                    BattlefieldPageService.parse_page_range_soup(text),
+                )
+
+    def test_invalid_page_number(self):
+        text = _read_testpage(BATTLEFIELD_PAGES[0])
+
+        self.assertEqual(
+            BattlefieldPageService.parse_page(text, 30),
+            BattlefieldPageService.parse_page_soup(text, 30),
+        )
+
+    def test_extracted_values(self):
+        page = BattlefieldExtractor(_read_testpage(BATTLEFIELD_PAGES[0]))
+        targets = page.targets()
+
+        self.assertEqual(page.page_range(), (3, 24))
+        self.assertEqual(page.user_count(), 1187)
+        self.assertEqual(len(targets), 50)
+        self.assertEqual(targets[1].name, "Lord & Lady")
+        self.assertEqual(targets[1].alliance, "TSG")
+        self.assertIsNone(targets[0].alliance)
+        self.assertEqual(targets[3].gold, -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from rocalert.services.bfscanner import (
+    IncrementalBattlefieldScanner,
+    PlayerDelta,
+    StagedBattlefieldScanner,
+    WorkStealingPageQueue,
+)
+from rocalert.services.rocwebservices import BattlefieldPageService
+from tests.service_tests.test_bfextractor import BATTLEFIELD_PAGES, _read_testpage
+from tests.test_rocwebhandler import _make_handler
+
+
+def _make_session(pagenums: list[int]):
+    text = _read_testpage(BATTLEFIELD_PAGES[0])
+    roc = _make_handler()
+    for pagenum in pagenums:
+        roc.session.pages[BattlefieldPageService.page_url(roc, pagenum)] = text
+    return roc
+
+
+class FailingExecutor(ThreadPoolExecutor):
+    """Refuses the first parse, like a broken process pool"""
+
+    def __init__(self) -> None:
+        super().__init__(max_workers=1)
+        self._lock = threading.Lock()
+        self.failed = False
+
+    def submit(self, *args, **kwargs):
+        with self._lock:
+            if not self.failed:
+                self.failed = True
+                raise RuntimeError("cannot schedule new futures after shutdown")
+        return super().submit(*args, **kwargs)
+
+
+class StagedBattlefieldScannerTest(unittest.TestCase):
+    def test_scan_with_process_pool(self):
+        roc = _make_session([1, 2, 3])
+
+        with StagedBattlefieldScanner([roc], fetch_workers=2, parse_workers=2) as scanner:
+            targets = scanner.scan(1, 3)
+
+        expected = BattlefieldPageService.parse_page(_read_testpage(BATTLEFIELD_PAGES[0]), 1)
+        self.assertEqual(len(targets), 150)
+        self.assertEqual(vars(targets[0]), vars(expected["result"][0]))
+        self.assertEqual(scanner.stats.pages, 3)
+        self.assertEqual(scanner.stats.errors, 0)
+        self.assertGreater(scanner.stats.parse_seconds, 0)
+
+    def test_invalid_pages_counted_as_errors(self):
+        roc = _make_session([24, 25])
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scanner = StagedBattlefieldScanner([roc], parse_executor=executor)
+            targets = scanner.scan(24, 25)
+
+        self.assertEqual(len(targets), 50)
+        self.assertEqual(scanner.stats.pages, 1)
+        self.assertEqual(scanner.stats.errors, 1)
+
+    def test_no_session(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scanner = StagedBattlefieldScanner([], parse_executor=executor)
+            targets = scanner.scan(1, 2)
+
+        self.assertEqual(targets, [])
+        self.assertEqual(scanner.stats.errors, 2)
+
+    def test_failed_page_retried_on_other_session(self):
+        good = _make_session([1, 2, 3, 4])
+        bad = _make_session([])
+        bad.session.get = lambda *args, **kwargs: (_ for _ in ()).throw(ConnectionError())
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scanner = StagedBattlefieldScanner([bad, good], fetch_workers=2, parse_executor=executor)
+            targets = scanner.scan(1, 4)
+
+        self.assertEqual(len(targets), 200)
+        self.assertEqual(scanner.stats.errors, 0)
+        self.assertGreater(scanner.stats.retries, 0)
+        self.assertEqual(len(scanner.stats.page_latencies), 4)
+
+    def test_retries_capped(self):
+        bad = _make_session([])
+        bad.session.get = lambda *args, **kwargs: (_ for _ in ()).throw(ConnectionError())
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            scanner = StagedBattlefieldScanner(
+                [bad], fetch_workers=2, parse_executor=executor, max_retries=2)
+            targets = scanner.scan(1, 3)
+
+        self.assertEqual(targets, [])
+        self.assertEqual(scanner.stats.errors, 3)
+        self.assertEqual(scanner.stats.retries, 6)
+
+    def test_failed_parse_submit_does_not_hang(self):
+        roc = _make_session(list(range(1, 7)))
+        results = []
+
+        with FailingExecutor() as executor:
+            scanner = StagedBattlefieldScanner([roc], fetch_workers=2, parse_executor=executor)
+            scan = threading.Thread(target=lambda: results.append(scanner.scan(1, 6)), daemon=True)
+            scan.start()
+            scan.join(10)
+
+        self.assertFalse(scan.is_alive())
+        self.assertEqual(len(results[0]), 250)
+        self.assertEqual(scanner.stats.errors, 1)
+        self.assertEqual(scanner.stats.pages, 5)
+
+
+class WorkStealingPageQueueTest(unittest.TestCase):
+    def test_pages_split_into_blocks(self):
+        queue = WorkStealingPageQueue(range(1, 7), [0, 1])
+
+        self.assertEqual(queue.get(0).pagenum, 1)
+        self.assertEqual(queue.get(1).pagenum, 4)
+
+    def test_idle_worker_steals_from_back(self):
+        queue = WorkStealingPageQueue(range(1, 7), [0, 1])
+        for _ in range(3):
+            queue.get(1)
+            queue.done()
+
+        self.assertEqual(queue.get(1).pagenum, 3)
+        self.assertEqual(queue.steals, 1)
+
+    def test_retry_goes_to_other_session(self):
+        queue = WorkStealingPageQueue(range(1, 3), [0, 1])
+        task = queue.get(0)
+
+        queue.retry(task, 0)
+
+        self.assertEqual([x.pagenum for x in queue._queues[1]], [2, 1])
+
+    def test_finished_queue_returns_none(self):
+        queue = WorkStealingPageQueue([1], [0])
+        queue.get(0)
+        queue.done()
+
+        self.assertIsNone(queue.get(0))
+
+
+class IncrementalBattlefieldScannerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.text = _read_testpage(BATTLEFIELD_PAGES[0])
+        self.scanner = IncrementalBattlefieldScanner()
+
+    def _sweep(self, pagetext: str) -> list[PlayerDelta]:
+        self.scanner.begin_sweep()
+        deltas = self.scanner.update_page(3, pagetext)
+        return deltas + self.scanner.end_sweep(3, 3)
+
+    def test_first_sweep_reports_new_players(self):
+        deltas = self._sweep(self.text)
+
+        self.assertEqual(len(deltas), 50)
+        self.assertTrue(all(x.kind == PlayerDelta.NEW for x in deltas))
+        self.assertEqual(len(self.scanner.targets), 50)
+
+    def test_unchanged_page_is_not_parsed(self):
+        self._sweep(self.text)
+        # Only the player list is fingerprinted
+        deltas = self._sweep(self.text.replace("Training Center", "Battlefield"))
+
+        self.assertEqual(deltas, [])
+        self.assertEqual(self.scanner.stats.pages_unchanged, 1)
+        self.assertEqual(self.scanner.stats.pages_parsed, 0)
+
+    def test_gold_change(self):
+        self._sweep(self.text)
+        deltas = self._sweep(self.text.replace("698,935,572 Gold", "998,935,572 Gold"))
+
+        self.assertEqual(len(deltas), 1)
+        self.assertEqual(deltas[0].kind, PlayerDelta.GOLD_UP)
+        self.assertEqual(deltas[0].id, "43445")
+        self.assertEqual(deltas[0].old.gold, 698935572)
+        self.assertEqual(deltas[0].new.gold, 998935572)
+
+    def test_vanished_and_new_player(self):
+        self._sweep(self.text)
+        deltas = self._sweep(self.text.replace("player_43445", "player_99"))
+
+        kinds = {(x.kind, x.id) for x in deltas}
+        self.assertEqual(kinds, {(PlayerDelta.NEW, "99"), (PlayerDelta.VANISHED, "43445")})
+        self.assertNotIn("43445", [x.id for x in self.scanner.targets])
+
+    def test_failed_page_keeps_last_snapshot(self):
+        self._sweep(self.text)
+        deltas = self._sweep("")
+
+        self.assertEqual(deltas, [])
+        self.assertEqual(self.scanner.stats.errors, 1)
+        self.assertEqual(len(self.scanner.targets), 50)
+        self.assertEqual(self._sweep(self.text), [])
+
+    def test_sweep_fetches_pages(self):
+        roc = _make_session([3])
+        scanner = IncrementalBattlefieldScanner(lambda: roc)
+
+        self.assertEqual(len(list(scanner.sweep(3, 3))), 50)
+        self.assertEqual(list(scanner.sweep(3, 3)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
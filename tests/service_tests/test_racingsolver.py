@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+
+from rocalert.roc_web_handler import Captcha
+from rocalert.services.captchaservices import (
+    CaptchaSolveException,
+    CaptchaSolverServiceABC,
+    RacingCaptchaSolverService,
+)
+
+
+class FakeSolver(CaptchaSolverServiceABC):
+    def __init__(self, ans: str, confidence: float = None, delay: float = 0, error: bool = False) -> None:
+        self.ans = ans
+        self.confidence = confidence
+        self.delay = delay
+        self.error = error
+        self.reported = []
+        self.finished = threading.Event()
+
+    def solve_captcha(self, captcha: Captcha) -> Captcha:
+        time.sleep(self.delay)
+        self.finished.set()
+        if self.error:
+            raise CaptchaSolveException("solver down")
+        captcha.ans = self.ans
+        captcha.confidence = self.confidence
+        return captcha
+
+    def report_captcha(self, captcha: Captcha) -> None:
+        self.reported.append(captcha.hash)
+
+
+class RacingCaptchaSolverServiceTest(unittest.TestCase):
+    def test_first_confident_answer_wins(self):
+        fast = FakeSolver("3", 0.95)
+        slow = FakeSolver("4", 0.99, delay=1)
+        sut = RacingCaptchaSolverService([slow, fast], min_confidence=0.9)
+
+        start = time.monotonic()
+        captcha = sut.solve_captcha(Captcha("abc", b"img"))
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(captcha.ans, "3")
+        self.assertEqual(captcha.confidence, 0.95)
+
+    def test_waits_past_unconfident_answer(self):
+        unsure = FakeSolver("3", 0.5)
+        sure = FakeSolver("4", 0.95, delay=0.05)
+        sut = RacingCaptchaSolverService([unsure, sure], min_confidence=0.9)
+
+        self.assertEqual(sut.solve_captcha(Captcha("abc", b"img")).ans, "4")
+
+    def test_falls_back_to_most_confident(self):
+        sut = RacingCaptchaSolverService(
+            [FakeSolver("3", 0.5), FakeSolver("4", 0.7)], min_confidence=0.9)
+
+        self.assertEqual(sut.solve_captcha(Captcha("abc", b"img")).ans, "4")
+
+    def test_unrated_answers_use_default_confidence(self):
+        sut = RacingCaptchaSolverService(
+            [FakeSolver("3", 0.5), FakeSolver("4", None, delay=0.05)],
+            min_confidence=0.9, unrated_confidence=1.0)
+
+        self.assertEqual(sut.solve_captcha(Captcha("abc", b"img")).ans, "4")
+
+    def test_errors_are_skipped(self):
+        sut = RacingCaptchaSolverService([FakeSolver("3", error=True), FakeSolver("4", 0.2)])
+
+        self.assertEqual(sut.solve_captcha(Captcha("abc", b"img")).ans, "4")
+
+    def test_raises_when_no_solver_answers(self):
+        sut = RacingCaptchaSolverService([FakeSolver("3", error=True)])
+
+        with self.assertRaises(CaptchaSolveException):
+            sut.solve_captcha(Captcha("abc", b"img"))
+
+    def test_timeout(self):
+        slow = FakeSolver("3", delay=0.5)
+        sut = RacingCaptchaSolverService([slow], timeout=0.05)
+
+        with self.assertRaises(CaptchaSolveException):
+            sut.solve_captcha(Captcha("abc", b"img"))
+        slow.finished.wait(1)
+
+    def test_reports_only_to_winner(self):
+        winner = FakeSolver("3", 0.95)
+        loser = FakeSolver("4", 0.5)
+        sut = RacingCaptchaSolverService([loser, winner])
+
+        captcha = sut.solve_captcha(Captcha("abc", b"img"))
+        captcha.ans_correct = True
+        sut.report_captcha(captcha)
+
+        self.assertEqual(winner.reported, ["abc"])
+        self.assertEqual(loser.reported, [])
+        self.assertEqual(sut.wins(), {"FakeSolver": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from rocalert.services.requestlogger import RequestLogWriter
+
+
+class BlockedRequestLogWriter(RequestLogWriter):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    def _write_batch(self, batch: list[dict]) -> None:
+        self.release.wait()
+        super()._write_batch(batch)
+
+
+class RequestLogWriterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.logdir = self._tmpdir.name
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def _read_lines(self, path: str) -> list[str]:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_writes_one_compact_record_per_line(self):
+        writer = RequestLogWriter(logdir=self.logdir)
+        writer.log_request("url1", {"a": 1}, {"h": "v"})
+        writer.log_request("url2", {"b": 2}, {"h": "v"})
+        writer.close()
+
+        files = os.listdir(self.logdir)
+        self.assertEqual(len(files), 1)
+        lines = self._read_lines(os.path.join(self.logdir, files[0]))
+
+        self.assertEqual(len(lines), 2)
+        self.assertNotIn(": ", lines[0])
+        record = json.loads(lines[0])
+        self.assertEqual(record["url"], "url1")
+        self.assertEqual(record["payload"], {"a": 1})
+        self.assertIn("timestamp", record)
+
+    def test_rotates_by_size(self):
+        writer = RequestLogWriter(logdir=self.logdir, max_bytes=10, batch_size=1)
+        for i in range(3):
+            writer.log_request(f"url{i}", {}, {})
+            writer.flush()
+        writer.close()
+
+        self.assertEqual(len(os.listdir(self.logdir)), 3)
+
+    def test_compresses_closed_files(self):
+        writer = RequestLogWriter(logdir=self.logdir, compress=True)
+        writer.log_request("url", {}, {})
+        writer.close()
+
+        files = os.listdir(self.logdir)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith(".jsonl.gz"))
+        self.assertEqual(len(self._read_lines(os.path.join(self.logdir, files[0]))), 1)
+
+    def test_drops_when_queue_full(self):
+        writer = BlockedRequestLogWriter(logdir=self.logdir, queue_size=1, batch_size=1)
+
+        results = [writer.log_request(f"url{i}", {}, {}) for i in range(5)]
+        writer.release.set()
+        writer.close()
+
+        self.assertFalse(all(results))
+        self.assertEqual(writer.dropped, results.count(False))
+        self.assertEqual(writer.written, results.count(True))
+
+    def test_block_policy_waits_then_drops(self):
+        writer = BlockedRequestLogWriter(
+            logdir=self.logdir, queue_size=1, batch_size=1,
+            overflow=RequestLogWriter.BLOCK, block_timeout=0.01)
+
+        results = [writer.log_request(f"url{i}", {}, {}) for i in range(5)]
+        writer.release.set()
+        writer.close()
+
+        self.assertGreater(writer.dropped, 0)
+        self.assertEqual(writer.written, results.count(True))
+
+    def test_blocked_callers_wait_together(self):
+        writer = BlockedRequestLogWriter(
+            logdir=self.logdir, queue_size=1, batch_size=1,
+            overflow=RequestLogWriter.BLOCK, block_timeout=0.2)
+        writer.log_request("url", {}, {})
+        writer.log_request("url", {}, {})
+
+        threads = [threading.Thread(target=writer.log_request, args=("url", {}, {})) for _ in range(5)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        writer.release.set()
+        writer.close()
+
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(writer.dropped, 5)
+
+    def test_counts_every_record_from_many_threads(self):
+        writer = BlockedRequestLogWriter(logdir=self.logdir, queue_size=5, batch_size=1)
+        results = []
+
+        def log_many():
+            results.extend(writer.log_request("url", {}, {}) for _ in range(200))
+
+        threads = [threading.Thread(target=log_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writer.release.set()
+        writer.close()
+
+        self.assertEqual(writer.dropped, results.count(False))
+        self.assertEqual(writer.written, results.count(True))
+        self.assertFalse(writer.log_request("url", {}, {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import threading
+import time
+import unittest
+
+from rocalert.services.sessionpool import SessionPool
+
+
+class FakeSession:
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.logged_in = True
+
+
+class FakeLogin:
+    """Logs in every slot, optionally failing some and taking a while"""
+
+    def __init__(self, fail: set = None, delay: float = 0) -> None:
+        self.fail = fail if fail is not None else set()
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, index: int) -> FakeSession:
+        with self._lock:
+            self.calls.append(index)
+        time.sleep(self.delay)
+        if index in self.fail:
+            return None
+        return FakeSession(index)
+
+
+class SessionPoolTest(unittest.TestCase):
+    def _pool(self, login: FakeLogin = None, size: int = 3, **kwargs) -> SessionPool:
+        pool = SessionPool(login or FakeLogin(), size, relogin_delay=0.05, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def _wait_for(self, predicate, timeout: float = 2) -> None:
+        deadline = time.time() + timeout
+        while not predicate():
+            if time.time() > deadline:
+                self.fail("Timed out waiting")
+            time.sleep(0.01)
+
+    def test_logs_in_in_parallel(self):
+        sut = self._pool(FakeLogin(delay=0.2), size=5)
+
+        start = time.time()
+        self.assertEqual(sut.start(), 5)
+
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual(len(sut.sessions), 5)
+
+    def test_leases_are_exclusive(self):
+        sut = self._pool(size=2)
+        sut.start()
+
+        first = sut.acquire()
+        second = sut.acquire()
+
+        self.assertIsNot(first, second)
+        with self.assertRaises(TimeoutError):
+            sut.acquire(timeout=0.05)
+        sut.release(first)
+        self.assertIs(sut.acquire(timeout=0.05), first)
+
+    def test_leases_per_session(self):
+        sut = self._pool(size=1, leases_per_session=2)
+        sut.start()
+
+        self.assertIs(sut.acquire(), sut.acquire())
+        with self.assertRaises(TimeoutError):
+            sut.acquire(timeout=0.01)
+
+    def test_waiting_worker_gets_returned_session(self):
+        sut = self._pool(size=1)
+        sut.start()
+        leased = sut.acquire()
+        threading.Timer(0.05, sut.release, args=(leased,)).start()
+
+        with sut.lease(timeout=1) as session:
+            self.assertIs(session, leased)
+
+    def test_prefers_faster_session(self):
+        sut = self._pool(size=2)
+        sut.start()
+        slow, fast = sut.sessions
+        sut.report(slow, 1.0)
+        sut.report(fast, 0.1)
+
+        with sut.lease() as session:
+            self.assertIs(session, fast)
+
+    def test_failed_login_retried_in_background(self):
+        login = FakeLogin(fail={1})
+        sut = self._pool(login, size=2)
+
+        self.assertEqual(sut.start(), 1)
+        login.fail.clear()
+
+        self._wait_for(lambda: sut.size == 2)
+        self.assertGreaterEqual(login.calls.count(1), 2)
+
+    def test_logged_out_session_drained_and_replaced(self):
+        sut = self._pool(size=2)
+        sut.start()
+
+        with sut.lease() as session:
+            sut.report(session, 0.1, logged_in=False)
+            self.assertNotIn(session, sut.sessions)
+
+        self._wait_for(lambda: len(sut.sessions) == 2)
+        self.assertNotIn(session, sut.sessions)
+        self.assertEqual(sut.stats()["drained"], 1)
+
+    def test_failures_in_a_row_drain(self):
+        sut = self._pool(size=2, max_failures=2)
+        sut.start()
+        session = sut.sessions[0]
+
+        sut.report(session, ok=False)
+        sut.report(session, ok=True)
+        sut.report(session, ok=False)
+        self.assertIn(session, sut.sessions)
+        sut.report(session, ok=False)
+        self.assertNotIn(session, sut.sessions)
+
+    def test_exception_in_lease_counts_as_failure(self):
+        sut = self._pool(size=1, max_failures=1)
+        sut.start()
+
+        with self.assertRaises(ValueError):
+            with sut.lease() as session:
+                raise ValueError()
+
+        self.assertNotIn(session, sut.sessions)
+
+    def test_slow_session_drained(self):
+        sut = self._pool(size=3, min_requests=2)
+        sut.start()
+        slow, *others = sut.sessions
+        for _ in range(2):
+            for session in others:
+                sut.report(session, 0.1)
+        sut.report(slow, 1.0)
+        self.assertIn(slow, sut.sessions)
+
+        sut.report(slow, 1.0)
+
+        self.assertNotIn(slow, sut.sessions)
+
+    def test_idle_session_health_checked(self):
+        sut = self._pool(
+            size=2, health_check=lambda session: session.logged_in, check_interval=0.05)
+        sut.start()
+        session = sut.sessions[0]
+        session.logged_in = False
+
+        self._wait_for(lambda: session not in sut.sessions)
+        self._wait_for(lambda: len(sut.sessions) == 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
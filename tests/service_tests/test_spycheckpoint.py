@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+from rocalert.battlefieldtable import BattlefieldTable
+from rocalert.rocaccount import BattlefieldTarget
+from rocalert.services.rocwebservices import SpyResult
+from rocalert.services.spycheckpoint import CheckpointWriter, load_checkpoint, save_checkpoint
+from rocalert.services.spyledger import SpyQuotaLedger
+
+
+def _table() -> BattlefieldTable:
+    return BattlefieldTable.from_targets([
+        BattlefieldTarget("10", 1, "alpha", "TSG", 500, "Soldiers", 900),
+        BattlefieldTarget("20", 2, "bravo", None, 400, "Mercenaries", 100),
+    ])
+
+
+def _ledger() -> SpyQuotaLedger:
+    ledger = SpyQuotaLedger(max_spies=2)
+    ledger.add_targets(["10", "20"])
+    ledger.record(ledger.claim("10"), SpyResult.SUCCESS)
+    ledger.record(ledger.claim("10"), SpyResult.SUCCESS)
+    ledger.record(ledger.claim("20"), SpyResult.ERROR)
+    return ledger
+
+
+class SpyCheckpointTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, "logs", "checkpoint.npz")
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def test_round_trip(self):
+        save_checkpoint(self.path, _table(), _ledger(), {"phase": "spying"})
+
+        checkpoint = load_checkpoint(self.path)
+
+        self.assertEqual([vars(x) for x in checkpoint.table], [vars(x) for x in _table()])
+        self.assertEqual(checkpoint.ledger, _ledger().snapshot())
+        self.assertEqual(checkpoint.progress, {"phase": "spying"})
+        self.assertLess(checkpoint.age_seconds, 60)
+
+    def test_restored_ledger_skips_completed_targets(self):
+        save_checkpoint(self.path, _table(), _ledger())
+
+        ledger = SpyQuotaLedger(max_spies=2)
+        ledger.restore(load_checkpoint(self.path).ledger)
+
+        self.assertEqual(ledger.retired, {"10"})
+        self.assertEqual(ledger.remaining("20"), 2)
+        self.assertIsNone(ledger.claim("10"))
+
+    def test_overwrite_leaves_no_temp_file(self):
+        save_checkpoint(self.path, _table())
+        save_checkpoint(self.path, _table(), _ledger())
+
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["checkpoint.npz"])
+        self.assertEqual(len(load_checkpoint(self.path).ledger), 2)
+
+    def test_missing_or_unreadable(self):
+        self.assertIsNone(load_checkpoint(self.path))
+
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "wb") as f:
+            f.write(b"not a checkpoint")
+        self.assertIsNone(load_checkpoint(self.path))
+
+    def test_writer_skips_unchanged(self):
+        ledger = _ledger()
+        sut = CheckpointWriter(self.path, _table(), ledger, progress=lambda: {"phase": "spying"})
+
+        self.assertTrue(sut.save())
+        self.assertFalse(sut.save())
+        ledger.record(ledger.claim("20"), SpyResult.SUCCESS)
+        self.assertTrue(sut.save())
+        self.assertTrue(sut.save(force=True))
+        self.assertEqual(sut.saves, 3)
+
+    def test_writer_saves_on_stop(self):
+        ledger = _ledger()
+        with CheckpointWriter(self.path, _table(), ledger, interval=60):
+            ledger.retire("20")
+
+        self.assertTrue(load_checkpoint(self.path).ledger["20"]["retired"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+import asyncio
+import itertools
+import os
+import tempfile
+import unittest
+
+import httpx
+
+from rocalert.roc_async_web_handler import AsyncRocWebHandler
+from rocalert.roc_web_handler import Captcha
+from rocalert.rocaccount import BattlefieldTarget
+from rocalert.services.rocwebservices import SpyResult
+from rocalert.services.sessionpool import SessionPool
+from rocalert.services.spyengine import PipelinedSpyEngine
+from rocalert.services.spyledger import SpyQuotaLedger
+from rocalert.services.urlgenerator import ROCDecryptUrlGenerator
+from tests.service_tests.test_racingsolver import FakeSolver
+
+
+def _target(id: str) -> BattlefieldTarget:
+    return BattlefieldTarget(id, 1, f"user{id}", None, 1, "Soldiers", 1)
+
+
+class FakeRoc:
+    """Serves captchas and answers recons. The answer 9 is always wrong.
+
+    The first `failing_posts` recons raise a connection error and the
+    `logged_out_posts` after them get the login page.
+    """
+
+    def __init__(
+            self, limit_after: dict = None, admins: set = None,
+            failing_posts: int = 0, logged_out_posts: int = 0) -> None:
+        self.counter = itertools.count()
+        self.recons: dict[str, int] = {}
+        self.limit_after = limit_after if limit_after is not None else {}
+        self.admins = admins if admins is not None else set()
+        self.failing_posts = failing_posts
+        self.logged_out_posts = logged_out_posts
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        if "img.php" in url:
+            return httpx.Response(200, content=b"image")
+        if "report_id" in url:
+            return httpx.Response(200, text="Your spy enters undetected")
+        if request.method == "POST":
+            if self.failing_posts > 0:
+                self.failing_posts -= 1
+                raise httpx.ConnectError("connection reset", request=request)
+            if self.logged_out_posts > 0:
+                self.logged_out_posts -= 1
+                return httpx.Response(200, text='<form action="login.php" method="post">')
+            body = request.content.decode()
+            target = request.url.params["id"]
+            if "num=9" in body:
+                return httpx.Response(200, text="You hit the wrong number. ")
+            if target in self.admins:
+                return httpx.Response(200, text="non-player Administrator account")
+            if self.recons.get(target, 0) >= self.limit_after.get(target, 99):
+                return httpx.Response(200, text="You cannot recon this person")
+            self.recons[target] = self.recons.get(target, 0) + 1
+            return httpx.Response(302, headers={"Location": "/report.php?report_id=1"})
+        text = '[click the correct number to proceed] ' \
+            + f'<img src="img.php?hash=hash{next(self.counter)}">'
+        return httpx.Response(200, text=text)
+
+    def session(self) -> AsyncRocWebHandler:
+        roc = AsyncRocWebHandler(
+            ROCDecryptUrlGenerator(), transport=httpx.MockTransport(self.handler))
+        roc._log_request = lambda url, payload, headers: None
+        return roc
+
+
+class AlternatingSolver(FakeSolver):
+    """Gets every other captcha wrong"""
+
+    def __init__(self) -> None:
+        super().__init__("1")
+        self.count = itertools.count()
+
+    def solve_captcha(self, captcha: Captcha) -> Captcha:
+        captcha.ans = "9" if next(self.count) % 2 else "1"
+        return captcha
+
+
+class InPlaceSolver(FakeSolver):
+    """Sets the answer on the captcha and returns None, like 2captcha"""
+
+    def solve_captcha(self, captcha: Captcha) -> None:
+        super().solve_captcha(captcha)
+
+
+class PipelinedSpyEngineTest(unittest.IsolatedAsyncioTestCase):
+    async def test_spies_each_target_up_to_max(self):
+        roc = FakeRoc()
+        solver = FakeSolver("1")
+        sut = PipelinedSpyEngine(
+            [roc.session(), roc.session()], solver,
+            harvest_workers=3, solve_workers=2, submit_workers=2, queue_size=2, max_spies=3)
+
+        stats = await sut.run([_target("1"), _target("2")])
+
+        self.assertEqual(roc.recons, {"1": 3, "2": 3})
+        self.assertEqual(stats.successes, 6)
+        self.assertEqual(stats.targets_completed, 2)
+        self.assertEqual(sut.completed, {"1", "2"})
+        self.assertEqual(stats.submit.processed, 6)
+        self.assertEqual(len(solver.reported), 6)
+        self.assertLessEqual(stats.solve.max_queue_depth, 2)
+
+    async def test_solver_setting_answer_in_place(self):
+        roc = FakeRoc()
+        sut = PipelinedSpyEngine([roc.session()], InPlaceSolver("1"), max_spies=2)
+
+        stats = await sut.run([_target("1")])
+
+        self.assertEqual(roc.recons, {"1": 2})
+        self.assertEqual(stats.solve.errors, 0)
+
+    async def test_wrong_answers_are_retried(self):
+        roc = FakeRoc()
+        sut = PipelinedSpyEngine([roc.session()], AlternatingSolver(), max_spies=4)
+
+        stats = await sut.run([_target("1")])
+
+        self.assertEqual(roc.recons, {"1": 4})
+        self.assertGreater(stats.wrong_captchas, 0)
+        self.assertEqual(stats.submit.processed, stats.successes + stats.wrong_captchas)
+
+    async def test_limit_and_admin_complete_targets(self):
+        roc = FakeRoc(limit_after={"1": 2}, admins={"2"})
+        sut = PipelinedSpyEngine([roc.session()], FakeSolver("1"), max_spies=10)
+
+        stats = await sut.run([_target("1"), _target("2")])
+
+        self.assertEqual(roc.recons, {"1": 2})
+        self.assertEqual(stats.successes, 2)
+        self.assertEqual(sut.completed, {"1", "2"})
+
+    async def test_max_attempts_gives_up(self):
+        roc = FakeRoc()
+        sut = PipelinedSpyEngine([roc.session()], FakeSolver("9"), max_attempts=3)
+
+        stats = await sut.run([_target("1")])
+
+        self.assertEqual(stats.wrong_captchas, 3)
+        self.assertEqual(sut.completed, {"1"})
+
+    async def test_target_dropped_after_errors(self):
+        roc = FakeRoc()
+        sut = PipelinedSpyEngine(
+            [roc.session()], FakeSolver("1"), submit_workers=1, max_target_errors=2)
+
+        stats = await sut.run([_target(None)])
+
+        self.assertEqual(stats.submit.errors, 2)
+        self.assertEqual(stats.targets_completed, 1)
+
+    async def test_session_errors_do_not_retire_targets(self):
+        roc = FakeRoc(failing_posts=3)
+        ledger = SpyQuotaLedger(max_spies=2)
+        sut = PipelinedSpyEngine(
+            [roc.session()], FakeSolver("1"), submit_workers=1, ledger=ledger)
+
+        stats = await sut.run([_target("1")])
+
+        self.assertEqual(roc.recons, {"1": 2})
+        self.assertEqual(stats.submit.errors, 3)
+        self.assertEqual(ledger.snapshot()["1"], {
+            "successes": 2, "attempts": 2, "errors": 0, "retired": True})
+
+    async def test_logged_out_pages_do_not_retire_targets(self):
+        roc = FakeRoc(logged_out_posts=3)
+        ledger = SpyQuotaLedger(max_spies=2)
+        sut = PipelinedSpyEngine(
+            [roc.session()], FakeSolver("1"), submit_workers=1, ledger=ledger)
+
+        stats = await sut.run([_target("1")])
+
+        self.assertEqual(roc.recons, {"1": 2})
+        self.assertEqual(stats.submit.errors, 3)
+        self.assertEqual(ledger.snapshot()["1"]["errors"], 0)
+
+    async def test_file_ledger(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            roc = FakeRoc()
+            ledger = SpyQuotaLedger(max_spies=3, path=os.path.join(tmpdir, "ledger.json"))
+            sut = PipelinedSpyEngine([roc.session()], FakeSolver("1"), ledger=ledger)
+
+            stats = await sut.run([_target("1"), _target("2")])
+
+            self.assertEqual(roc.recons, {"1": 3, "2": 3})
+            self.assertEqual(stats.successes, 6)
+            self.assertEqual(ledger.stats()["in_flight"], 0)
+
+    async def test_logged_out_pool_session_drained(self):
+        bad, good = FakeRoc(logged_out_posts=100), FakeRoc()
+        pool = SessionPool(lambda i: [bad, good][i].session(), 2, relogin_delay=60)
+        pool.start()
+        self.addCleanup(pool.close)
+        sut = PipelinedSpyEngine([], FakeSolver("1"), max_spies=3, session_pool=pool)
+
+        stats = await sut.run([_target("1")])
+
+        # Slot 0 logs in again straight away, and may be drained again
+        self.assertEqual(good.recons, {"1": 3})
+        self.assertEqual(bad.recons, {})
+        self.assertEqual(stats.successes, 3)
+        self.assertGreaterEqual(pool.stats()["drained"], 1)
+
+    async def test_shared_ledger_limits_recons(self):
+        roc = FakeRoc()
+        ledger = SpyQuotaLedger(max_spies=10)
+        ledger.add_targets(["1"])
+        for _ in range(8):
+            ledger.record(ledger.claim("1"), SpyResult.SUCCESS)
+        sut = PipelinedSpyEngine([roc.session()], FakeSolver("1"), ledger=ledger)
+
+        stats = await sut.run([_target("1")])
+
+        self.assertEqual(roc.recons, {"1": 2})
+        self.assertEqual(stats.successes, 2)
+        self.assertTrue(ledger.is_retired("1"))
+
+    async def test_expiring_captchas_dropped(self):
+        roc = FakeRoc()
+        # Every captcha is already inside the expiry margin
+        margin = Captcha.EXPIRATION_AGE.total_seconds() + 1
+        sut = PipelinedSpyEngine([roc.session()], FakeSolver("1"), expiry_margin=margin)
+
+        run = asyncio.create_task(sut.run([_target("1")]))
+        while sut.stats.solve.expired < 5:
+            await asyncio.sleep(0.001)
+        await sut._finish()
+        stats = await run
+
+        self.assertGreaterEqual(stats.solve.expired, 5)
+        self.assertEqual(stats.solve.processed, 0)
+        self.assertEqual(roc.recons, {})
+
+    async def test_no_targets(self):
+        sut = PipelinedSpyEngine([FakeRoc().session()], FakeSolver("1"))
+
+        stats = await sut.run([])
+
+        self.assertEqual(stats.successes, 0)
+
+    def test_needs_a_session(self):
+        with self.assertRaises(ValueError):
+            PipelinedSpyEngine([], FakeSolver("1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
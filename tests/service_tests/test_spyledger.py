@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from rocalert.services.rocwebservices import SpyResult
+from rocalert.services.spyledger import SpyQuotaLedger
+
+
+def _spy_from_process(path: str, count: int) -> None:
+    ledger = SpyQuotaLedger(max_spies=10, path=path)
+    for _ in range(count):
+        slot = ledger.claim("1")
+        if slot is None:
+            return
+        ledger.record(slot, SpyResult.SUCCESS)
+
+
+class SpyQuotaLedgerTest(unittest.TestCase):
+    def test_claims_stop_at_remaining_quota(self):
+        sut = SpyQuotaLedger(max_spies=3)
+        sut.add_targets(["1"])
+
+        slots = [sut.claim("1") for _ in range(5)]
+
+        self.assertEqual(sum(x is not None for x in slots), 3)
+        self.assertEqual(sut.remaining("1"), 0)
+        self.assertEqual(sut.stats()["refused_claims"], 2)
+
+    def test_released_slot_can_be_claimed_again(self):
+        sut = SpyQuotaLedger(max_spies=1)
+        sut.add_targets(["1"])
+
+        slot = sut.claim("1")
+        sut.release(slot)
+
+        self.assertIsNotNone(sut.claim("1"))
+
+    def test_wrong_captcha_keeps_quota(self):
+        sut = SpyQuotaLedger(max_spies=2)
+        sut.add_targets(["1"])
+
+        sut.record(sut.claim("1"), SpyResult.WRONG_CAPTCHA)
+        sut.record(sut.claim("1"), SpyResult.SUCCESS)
+
+        self.assertEqual(sut.successes("1"), 1)
+        self.assertEqual(sut.remaining("1"), 1)
+
+    def test_wrong_captchas_do_not_use_up_recons(self):
+        sut = SpyQuotaLedger(max_spies=10)
+        sut.add_targets(["1"])
+
+        sut.record(sut.claim("1"), SpyResult.WRONG_CAPTCHA)
+        for _ in range(9):
+            sut.record(sut.claim("1"), SpyResult.SUCCESS)
+
+        self.assertFalse(sut.is_retired("1"))
+        self.assertEqual(sut.remaining("1"), 1)
+        sut.record(sut.claim("1"), SpyResult.FAILURE)
+        self.assertEqual(sut.successes("1"), 10)
+        self.assertTrue(sut.is_retired("1"))
+
+    def test_unknown_result_is_an_error(self):
+        sut = SpyQuotaLedger(max_errors=2)
+        sut.add_targets(["1"])
+
+        sut.record(sut.claim("1"), SpyResult.UNKNOWN)
+
+        self.assertEqual(sut.successes("1"), 0)
+        sut.record(sut.claim("1"), SpyResult.UNKNOWN)
+        self.assertTrue(sut.is_retired("1"))
+
+    def test_retires_at_max_spies(self):
+        sut = SpyQuotaLedger(max_spies=2)
+        sut.add_targets(["1"])
+
+        sut.record(sut.claim("1"), SpyResult.SUCCESS)
+        sut.record(sut.claim("1"), SpyResult.FAILURE)
+
+        self.assertTrue(sut.is_retired("1"))
+        self.assertIsNone(sut.claim("1"))
+        self.assertEqual(sut.retired, {"1"})
+
+    def test_limit_and_admin_retire(self):
+        sut = SpyQuotaLedger()
+        sut.add_targets(["1", "2"])
+
+        sut.record(sut.claim("1"), SpyResult.LIMIT)
+        sut.record(sut.claim("2"), SpyResult.ADMIN)
+
+        self.assertEqual(sut.retired, {"1", "2"})
+        self.assertEqual(sut.stats()["successes"], 0)
+
+    def test_retires_after_errors_and_attempts(self):
+        sut = SpyQuotaLedger(max_attempts=3, max_errors=2)
+        sut.add_targets(["1", "2"])
+
+        for _ in range(2):
+            sut.record(sut.claim("1"), SpyResult.ERROR)
+        for _ in range(3):
+            sut.record(sut.claim("2"), SpyResult.WRONG_CAPTCHA)
+
+        self.assertEqual(sut.retired, {"1", "2"})
+
+    def test_late_result_on_retired_target_counted_as_wasted(self):
+        sut = SpyQuotaLedger()
+        sut.add_targets(["1"])
+        first, second = sut.claim("1"), sut.claim("1")
+
+        sut.record(first, SpyResult.LIMIT)
+        sut.record(second, SpyResult.SUCCESS)
+
+        self.assertEqual(sut.successes("1"), 0)
+        self.assertEqual(sut.stats()["wasted_submits"], 1)
+
+    def test_claim_any_round_robin(self):
+        sut = SpyQuotaLedger(max_spies=1)
+        sut.add_targets(["1", "2", "3"])
+
+        claimed = [sut.claim(among={"1", "2"}).target_id for _ in range(2)]
+
+        self.assertEqual(sorted(claimed), ["1", "2"])
+        self.assertIsNone(sut.claim(among={"1", "2"}))
+        self.assertEqual(sut.demand(), 1)
+
+    def test_threads_never_exceed_quota(self):
+        sut = SpyQuotaLedger(max_spies=10)
+        sut.add_targets(["1"])
+        granted = []
+
+        def worker():
+            while True:
+                slot = sut.claim("1")
+                if slot is None:
+                    return
+                granted.append(slot)
+                sut.record(slot, SpyResult.SUCCESS)
+
+        threads = [threading.Thread(target=worker) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(granted), 10)
+        self.assertEqual(sut.successes("1"), 10)
+
+
+class FileSpyQuotaLedgerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, "ledger.json")
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def test_ledgers_on_one_file_share_quota(self):
+        first = SpyQuotaLedger(max_spies=2, path=self.path)
+        second = SpyQuotaLedger(max_spies=2, path=self.path)
+        first.add_targets(["1"])
+
+        self.assertIsNotNone(first.claim("1"))
+        self.assertIsNotNone(second.claim("1"))
+        self.assertIsNone(first.claim("1"))
+
+    def test_expired_leases_handed_out_again(self):
+        first = SpyQuotaLedger(max_spies=1, path=self.path, lease_seconds=0.05)
+        first.add_targets(["1"])
+        self.assertIsNotNone(first.claim("1"))
+
+        time.sleep(0.1)
+        self.assertIsNotNone(SpyQuotaLedger(max_spies=1, path=self.path).claim("1"))
+
+    def test_processes_never_exceed_quota(self):
+        SpyQuotaLedger(path=self.path).add_targets(["1"])
+
+        ctx = multiprocessing.get_context("spawn")
+        procs = [ctx.Process(target=_spy_from_process, args=(self.path, 10)) for _ in range(3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        ledger = SpyQuotaLedger(path=self.path)
+        self.assertEqual(ledger.successes("1"), 10)
+        self.assertTrue(ledger.is_retired("1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+from rocalert.accountstate import AccountState
+from rocalert.roc_web_handler import RocResponse
+from tests.test_rocwebhandler import _make_handler, _read_testpage
+
+
+class AccountStateTest(unittest.TestCase):
+    def test_update_from_page(self):
+        text = _read_testpage("testpages/training/training0am.html")
+        state = AccountState()
+
+        state.update_from_response(RocResponse("https://example.com/train.php", 200, text))
+
+        self.assertEqual(state.gold(), 24140)
+        self.assertEqual(state.rank(), 50)
+        self.assertEqual(state.turns(), 5100)
+        self.assertTrue(state.logged_in())
+        self.assertFalse(state.on_cooldown())
+
+    def test_logged_out_page_keeps_other_fields(self):
+        state = AccountState()
+        state.update(AccountState.GOLD, 100)
+
+        state.update_from_response(RocResponse(
+            "https://example.com/login.php", 200,
+            '<form action="login.php" method="post">'))
+
+        self.assertFalse(state.logged_in())
+        self.assertEqual(state.gold(), 100)
+
+    def test_max_age(self):
+        state = AccountState()
+        state.update(AccountState.GOLD, 100, timestamp=time.monotonic() - 30)
+
+        self.assertIsNone(state.gold(max_age=10))
+        self.assertEqual(state.gold(max_age=60), 100)
+        self.assertGreaterEqual(state.age(AccountState.GOLD), 30)
+
+    def test_older_update_ignored(self):
+        state = AccountState()
+        now = time.monotonic()
+        state.update(AccountState.GOLD, 200, timestamp=now)
+        state.update(AccountState.GOLD, 100, timestamp=now - 1)
+
+        self.assertEqual(state.gold(), 200)
+
+    def test_handler_updates_state(self):
+        text = _read_testpage("testpages/recruit/recruit_captcha.html")
+        handler = _make_handler({"a": text})
+
+        handler.fetch_page("a")
+
+        self.assertEqual(handler.account_state.gold(max_age=5), 22326)
+        self.assertEqual(handler.account_state.turns(), 5013)
+
+
+if __name__ == "__main__":
+    unittest.main()
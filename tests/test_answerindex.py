@@ -0,0 +1,111 @@
+import os
+import tempfile
+import unittest
+
+from rocalert.captcha.answerindex import CaptchaAnswerIndex, parse_answer_line
+
+
+class ParseAnswerLineTest(unittest.TestCase):
+    def test_plain_line(self):
+        self.assertEqual(parse_answer_line("abc123:4\n"), ("abc123", "4"))
+
+    def test_timestamped_line_with_correctness(self):
+        self.assertEqual(parse_answer_line("12:30:01: abc123:4:True\n"), ("abc123", "4"))
+
+    def test_incorrect_answer_skipped(self):
+        self.assertIsNone(parse_answer_line("12:30:01: abc123:4:False\n"))
+
+    def test_csv_line(self):
+        self.assertEqual(parse_answer_line("abc123,4,1,1700000000\n"), ("abc123", "4"))
+        self.assertEqual(parse_answer_line("abc123,4,,\n"), ("abc123", "4"))
+
+    def test_incorrect_csv_answer_skipped(self):
+        self.assertIsNone(parse_answer_line("abc123,4,0,1700000000\n"))
+
+    def test_blank_line_skipped(self):
+        self.assertIsNone(parse_answer_line("\n"))
+
+
+class CaptchaAnswerIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.indexpath = os.path.join(self._tmpdir.name, "index.bin")
+        self.logpath = os.path.join(self._tmpdir.name, "correct_ans.log")
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def _write_log(self, lines: list[str], mode: str = "w") -> None:
+        with open(self.logpath, mode, encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in lines)
+
+    def test_unknown_hash_misses(self):
+        sut = CaptchaAnswerIndex(self.indexpath)
+
+        self.assertIsNone(sut.lookup("abc"))
+        self.assertEqual(sut.stats()["misses"], 1)
+        sut.close()
+
+    def test_added_answer_found_before_and_after_save(self):
+        sut = CaptchaAnswerIndex(self.indexpath)
+        sut.add("abc", "3")
+        self.assertEqual(sut.lookup("abc"), "3")
+
+        sut.save()
+        sut.close()
+        reopened = CaptchaAnswerIndex(self.indexpath, lru_size=0)
+
+        self.assertEqual(reopened.lookup("abc"), "3")
+        self.assertEqual(len(reopened), 1)
+        reopened.close()
+
+    def test_loads_answers_from_log(self):
+        self._write_log([f"hash{i}:{i % 9 + 1}" for i in range(100)])
+
+        sut = CaptchaAnswerIndex(self.indexpath, self.logpath, lru_size=0)
+
+        self.assertEqual(len(sut), 100)
+        self.assertEqual(sut.lookup("hash17"), "9")
+        self.assertIsNone(sut.lookup("hash100"))
+        sut.close()
+
+    def test_reads_only_new_log_lines(self):
+        self._write_log(["a:1", "b:2"])
+        CaptchaAnswerIndex(self.indexpath, self.logpath).close()
+
+        self._write_log(["c:3"], mode="a")
+        # Existing lines are not read again, so changing them has no effect
+        with open(self.logpath, "r+", encoding="utf-8") as f:
+            f.write("a:9")
+        sut = CaptchaAnswerIndex(self.indexpath, self.logpath, lru_size=0)
+
+        self.assertEqual(sut.lookup("a"), "1")
+        self.assertEqual(sut.lookup("c"), "3")
+        sut.close()
+
+    def test_discard_removes_stored_answer(self):
+        sut = CaptchaAnswerIndex(self.indexpath)
+        sut.add("abc", "3")
+        sut.save()
+
+        sut.discard("abc")
+        self.assertIsNone(sut.lookup("abc"))
+        sut.save()
+        sut.close()
+
+        reopened = CaptchaAnswerIndex(self.indexpath)
+        self.assertIsNone(reopened.lookup("abc"))
+        reopened.close()
+
+    def test_corrupt_index_ignored(self):
+        with open(self.indexpath, "wb") as f:
+            f.write(b"not an index file at all, not at all")
+
+        sut = CaptchaAnswerIndex(self.indexpath)
+
+        self.assertEqual(len(sut), 0)
+        sut.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
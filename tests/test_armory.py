@@ -32,6 +32,18 @@ class RocBuyerTests(unittest.TestCase):
 
         self.assertFalse(purchase_required)
 
+    def test_recent_account_state_gold_is_used(self):
+        roc = mock.RocWebHandler(current_gold=1000)
+        roc.account_state.update(roc.account_state.GOLD, 50000)
+        buyersettings = mock.BuyerSettings(
+            min_gold_to_buy=10000,
+            dagger=1)
+        buyer = roc_buyer.ROCBuyer(roc, buyersettings)
+
+        purchase_required = buyer.check_purchase_required()
+
+        self.assertTrue(purchase_required)
+
     def test_when_nightmode_and_buying_enabled_should_buy(self):
         roc = mock.RocWebHandler(current_gold=1000)
         buyersettings = mock.BuyerSettings(
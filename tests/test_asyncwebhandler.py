@@ -0,0 +1,86 @@
+import unittest
+
+import httpx
+
+from rocalert.roc_async_web_handler import AsyncRocWebHandler
+from rocalert.roc_web_handler import Captcha
+from rocalert.rocaccount import BattlefieldTarget
+from rocalert.services.rocwebservices import AsyncSpyService, SpyResult
+from rocalert.services.urlgenerator import ROCDecryptUrlGenerator
+
+
+def _make_handler(handler, logged: list = None) -> AsyncRocWebHandler:
+    roc = AsyncRocWebHandler(
+        ROCDecryptUrlGenerator(), transport=httpx.MockTransport(handler)
+    )
+    logged = logged if logged is not None else []
+    roc._log_request = lambda url, payload, headers: logged.append(url)
+    return roc
+
+
+class AsyncRocWebHandlerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_get_img_captcha(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            if "img.php" in str(request.url):
+                return httpx.Response(200, content=b"imagebytes")
+            text = '[click the correct number to proceed] <img src="img.php?hash=abc123">'
+            return httpx.Response(200, text=text)
+
+        async with _make_handler(handler) as roc:
+            captcha = await roc.get_img_captcha(roc.Pages.ARMORY)
+
+        self.assertEqual(captcha.hash, "abc123")
+        self.assertEqual(captcha.img, b"imagebytes")
+        self.assertEqual(captcha.type, Captcha.CaptchaType.IMAGE)
+
+    async def test_is_logged_in(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, text='<form action="login.php" method="post">')
+
+        async with _make_handler(handler) as roc:
+            self.assertFalse(await roc.is_logged_in())
+
+    async def test_submit_captcha_url_wrong_number(self):
+        posted = []
+        logged = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            posted.append(request.content.decode())
+            return httpx.Response(200, text="You hit the wrong number. ")
+
+        async with _make_handler(handler, logged) as roc:
+            captcha = Captcha("abc123", ans="5")
+            correct = await roc.submit_captcha_url(
+                captcha, roc.url_generator.get_armory(), {}, roc.Pages.ARMORY
+            )
+
+        self.assertFalse(correct)
+        self.assertIn("captcha=abc123", posted[0])
+        self.assertIn("num=5", posted[0])
+        self.assertEqual(len(logged), 1)
+
+
+class AsyncSpyServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_results_for_each_target(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            if "id=1" in str(request.url):
+                return httpx.Response(200, text="non-player Administrator account")
+            return httpx.Response(200, text="You hit the wrong number. ")
+
+        targets = [
+            (BattlefieldTarget("1", 1, "admin", None, 1, "Soldiers", 1), Captcha("a", ans="1")),
+            (BattlefieldTarget("2", 2, "user", None, 1, "Soldiers", 1), Captcha("b", ans="2")),
+        ]
+
+        async with _make_handler(handler) as roc:
+            service = AsyncSpyService(roc, targets)
+            results = await service.run_service()
+
+        self.assertEqual(
+            [x.result for x in results], [SpyResult.ADMIN, SpyResult.WRONG_CAPTCHA]
+        )
+        self.assertEqual(len(await service.run_service()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
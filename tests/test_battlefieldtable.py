@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from rocalert.battlefieldtable import BattlefieldTable
+from rocalert.rocaccount import BattlefieldTarget
+
+
+def _targets() -> list[BattlefieldTarget]:
+    return [
+        BattlefieldTarget("10", 1, "alpha", "TSG", 500, "Soldiers", 900),
+        BattlefieldTarget("20", 2, "bravo", None, 400, "Soldiers", -1),
+        BattlefieldTarget("30", 3, "charlie", "BOB", 300, "Mercenaries", 5000),
+        BattlefieldTarget("40", 4, "delta", "TSG", 200, "Soldiers", 100),
+        BattlefieldTarget("50", 5, "echo", None, 100, "Soldiers", 5000),
+    ]
+
+
+class BattlefieldTableTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.table = BattlefieldTable.from_targets(_targets())
+
+    def _names(self, table: BattlefieldTable) -> list[str]:
+        return [x.name for x in table]
+
+    def test_round_trip(self):
+        self.assertEqual(
+            [vars(x) for x in self.table.to_targets()],
+            [vars(x) for x in _targets()],
+        )
+
+    def test_arrays_round_trip(self):
+        table = BattlefieldTable.from_arrays(self.table.to_arrays())
+        self.assertEqual(
+            [vars(x) for x in table],
+            [vars(x) for x in _targets()],
+        )
+        self.assertEqual(self._names(table.filter(table.alliance_in(["TSG"]))), ["alpha", "delta"])
+
+    def test_gold_at_least(self):
+        table = self.table.filter(self.table.gold_at_least(900))
+        self.assertEqual(self._names(table), ["alpha", "charlie", "echo"])
+
+    def test_rank_predicates(self):
+        mask = self.table.rank_between(2, 4) & self.table.rank_not_in({3})
+        self.assertEqual(self._names(self.table.filter(mask)), ["bravo", "delta"])
+
+    def test_rank_between_open_bounds(self):
+        self.assertTrue(self.table.rank_between(0, None).all())
+
+    def test_alliance_in(self):
+        table = self.table.filter(self.table.alliance_in(["TSG", None]))
+        self.assertEqual(self._names(table), ["alpha", "bravo", "delta", "echo"])
+
+    def test_alliance_not_in_unknown_alliance(self):
+        self.assertTrue(self.table.alliance_not_in(["nobody"]).all())
+
+    def test_id_predicates_accept_str_and_int(self):
+        np.testing.assert_array_equal(
+            self.table.id_in({"10", 30}), [True, False, True, False, False]
+        )
+        self.assertEqual(self.table.id_not_in([]).sum(), 5)
+
+    def test_sort_by_is_stable(self):
+        table = self.table.sort_by("gold", descending=True)
+        self.assertEqual(
+            self._names(table), ["charlie", "echo", "alpha", "delta", "bravo"]
+        )
+
+    def test_top_k(self):
+        self.assertEqual(self._names(self.table.top_k("tff", 2)), ["alpha", "bravo"])
+        self.assertEqual(len(self.table.top_k("tff", 10)), 5)
+        self.assertEqual(len(self.table.top_k("tff", 0)), 0)
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            self.table.sort_by("name")
+
+    def test_empty_table(self):
+        table = BattlefieldTable.from_targets([])
+        self.assertEqual(len(table.filter(table.gold_at_least(0))), 0)
+        self.assertEqual(len(table.top_k("gold", 3)), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from rocalert.roc_web_handler import Captcha
+from rocalert.services.rocwebservices import BattlefieldPageService
+from rocalert.specialtools import BFSellCatch
+from tests.service_tests.test_bfextractor import BATTLEFIELD_PAGES, _read_testpage
+
+
+class _StopRun(Exception):
+    pass
+
+
+class FakePageService(BattlefieldPageService):
+    """Serves the same page every sweep, stopping run after `sweeps`"""
+
+    def __init__(self, sweeps: int) -> None:
+        self.sweeps = sweeps
+        self.text = _read_testpage(BATTLEFIELD_PAGES[0])
+
+    def fetch_page_text(self, roc, pagenum: int) -> str:
+        if self.sweeps == 0:
+            raise _StopRun()
+        self.sweeps -= 1
+        return self.text
+
+
+class FakeAttackService:
+    def __init__(self) -> None:
+        self.attacked = []
+
+    def run_service(self, roc, target, captcha) -> bool:
+        self.attacked.append(target.id)
+        return True
+
+
+class FakeCaptchaProvider:
+    """Times out on the first captcha, then hands out ones that need no answer"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def get_solved_captcha(self, timeout: float = None) -> Captcha:
+        self.calls += 1
+        return None if self.calls == 1 else Captcha('nocaptcha')
+
+
+class FakeBuyer:
+    def create_order_payload(self) -> dict:
+        return {}
+
+
+class BFSellCatchTest(unittest.TestCase):
+    def _run(self, sweeps: int, shouldhit) -> FakeAttackService:
+        attacks = FakeAttackService()
+        sut = BFSellCatch(
+            FakePageService(sweeps), attacks, FakeBuyer(), None, FakeCaptchaProvider())
+        with self.assertRaises(_StopRun):
+            sut.run(shouldhit, pagedelay=0, lowpage=3, highpage=3, incremental=True)
+        return attacks
+
+    def test_failed_attack_retried_on_unchanged_page(self):
+        attacks = self._run(3, lambda x: x.id == "43445")
+
+        # The first attack timed out waiting for a captcha, the page did not
+        # change, and the target is attacked on the next sweep
+        self.assertEqual(attacks.attacked, ["43445"])
+
+    def test_targets_after_a_hit_tried_next_sweep(self):
+        attacks = self._run(4, lambda x: x.gold >= 800000000)
+
+        # The richest timed out and the second was hit, then each sweep
+        # stops after hitting the next target still waiting
+        self.assertEqual(attacks.attacked, ["73016", "41580", "48393", "11173"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,19 @@
+import multiprocessing
 import os
+import tempfile
+import threading
+import time
 import unittest
+from rocalert.captcha.answerindex import parse_answer_line
 from rocalert.captcha.captcha_logger import Captcha, CaptchaLogger
 
 
+def _log_from_process(logger: CaptchaLogger, prefix: str, count: int) -> None:
+    for i in range(count):
+        logger.log_captcha(Captcha(f'{prefix}{i}', None, '1', True))
+    logger.close()
+
+
 class CaptchaLoggerTest(unittest.TestCase):
     def __init__(self, methodName: str = ...) -> None:
         super().__init__(methodName)
@@ -16,6 +27,8 @@ class CaptchaLoggerTest(unittest.TestCase):
 
     def delete_logfile(self) -> None:
         os.remove(self.logFileName)
+        if os.path.exists(self.logFileName + '.lock'):
+            os.remove(self.logFileName + '.lock')
 
     def make_simple_logger(self) -> CaptchaLogger:
         logger = CaptchaLogger(
@@ -45,5 +58,129 @@ class CaptchaLoggerTest(unittest.TestCase):
         self.assertEqual('{0}:{1}'.format(c.hash, ans), res)
 
 
+class BatchedCaptchaLoggerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.logpath = os.path.join(self._tmpdir.name, 'captchas.log')
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def read_lines(self) -> list[str]:
+        with open(self.logpath, 'r', encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_writes_text_format_in_order(self):
+        logger = CaptchaLogger(self.logpath, batched=True)
+        logger.log_captcha(Captcha('hash1', None, '4', True))
+        logger.log_captcha(Captcha('hash2', None, '7', False))
+        logger.close()
+
+        self.assertEqual(self.read_lines(), ['hash1:4:True', 'hash2:7:False'])
+        self.assertEqual(logger.written, 2)
+
+    def test_nothing_written_before_flush(self):
+        logger = CaptchaLogger(self.logpath, batched=True, flush_interval=60)
+        logger.log_captcha(Captcha('hash1', None, '4', True))
+
+        self.assertFalse(os.path.exists(self.logpath))
+        logger.flush()
+        self.assertEqual(self.read_lines(), ['hash1:4:True'])
+        logger.close()
+
+    def test_full_batch_written_without_flush(self):
+        logger = CaptchaLogger(
+            self.logpath, batched=True, batch_size=3, flush_interval=60)
+        for i in range(3):
+            logger.log_captcha(Captcha(f'hash{i}', None, '1', True))
+
+        for _ in range(200):
+            if os.path.exists(self.logpath):
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(self.read_lines()), 3)
+        logger.close()
+
+    def test_csv_format_parsed_by_answer_index(self):
+        logger = CaptchaLogger(
+            self.logpath, timestamp=True, batched=True, fmt=CaptchaLogger.CSV)
+        logger.log_captcha(Captcha('hash1', None, '4', True))
+        logger.log_captcha(Captcha('hash2', None, '7', False))
+        logger.close()
+
+        lines = self.read_lines()
+        self.assertTrue(lines[0].startswith('hash1,4,1,'))
+        self.assertEqual(parse_answer_line(lines[0]), ('hash1', '4'))
+        self.assertIsNone(parse_answer_line(lines[1]))
+
+    def test_threads_do_not_interleave(self):
+        logger = CaptchaLogger(self.logpath, batched=True, batch_size=7)
+
+        def log_many(prefix: str):
+            for i in range(100):
+                logger.log_captcha(Captcha(f'{prefix}{i}', None, '1', True))
+
+        threads = [threading.Thread(target=log_many, args=(f't{n}-',)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        logger.close()
+
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 800)
+        self.assertTrue(all(line.endswith(':1:True') for line in lines))
+
+    def test_shared_across_processes(self):
+        logger = CaptchaLogger(self.logpath, batched=True)
+        logger.log_captcha(Captcha('parent', None, '1', True))
+
+        ctx = multiprocessing.get_context('spawn')
+        procs = [
+            ctx.Process(target=_log_from_process, args=(logger, f'p{n}-', 50))
+            for n in range(3)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        logger.close()
+
+        lines = self.read_lines()
+        self.assertEqual(len(lines), 151)
+        self.assertEqual(len(set(lines)), 151)
+
+    def test_closed_logger_drops_lines(self):
+        logger = CaptchaLogger(self.logpath, batched=True)
+        logger.close()
+
+        self.assertFalse(logger.log_captcha(Captcha('hash1', None, '4', True)))
+
+    def test_lines_logged_while_closing_are_written_or_refused(self):
+        logger = CaptchaLogger(self.logpath, batched=True, batch_size=5)
+        results = []
+        start = threading.Event()
+
+        def log_many(prefix: str):
+            start.wait()
+            for i in range(200):
+                results.append(logger.log_captcha(Captcha(f'{prefix}{i}', None, '1', True)))
+
+        threads = [threading.Thread(target=log_many, args=(f't{n}-',)) for n in range(4)]
+        for t in threads:
+            t.start()
+        start.set()
+        logger.close()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(logger.written, results.count(True))
+        self.assertEqual(len(self.read_lines()) if os.path.exists(self.logpath) else 0,
+                         results.count(True))
+
+    def test_unknown_format_rejected(self):
+        with self.assertRaises(ValueError):
+            CaptchaLogger(self.logpath, fmt='xml')
+
+
 if __name__ == "__main__":
     unittest.main()
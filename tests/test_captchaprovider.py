@@ -0,0 +1,114 @@
+import threading
+import time
+import unittest
+
+from rocalert.captcha.captchaprovider import CaptchaProvider
+from rocalert.roc_web_handler import Captcha
+
+
+class CountingProvider:
+    def __init__(self, delay: float = 0) -> None:
+        self.delay = delay
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def __call__(self) -> Captcha:
+        self.release.wait()
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls += 1
+            return Captcha(f"hash{self.calls}", ans="1")
+
+
+class CaptchaProviderTest(unittest.TestCase):
+    def _wait_for(self, condition, timeout: float = 2) -> None:
+        end = time.monotonic() + timeout
+        while not condition() and time.monotonic() < end:
+            time.sleep(0.01)
+
+    def test_fills_cache_to_size(self):
+        sut = CaptchaProvider(CountingProvider(), cachesize=3, fillers=2)
+        sut.start()
+        self._wait_for(lambda: len(sut) == 3)
+        sut.stop(1)
+
+        self.assertEqual(len(sut), 3)
+
+    def test_get_returns_cached_captcha_in_order(self):
+        sut = CaptchaProvider(CountingProvider(), cachesize=2)
+        sut.start()
+        self._wait_for(lambda: len(sut) == 2)
+
+        captcha = sut.get_solved_captcha(timeout=1)
+        sut.stop(1)
+
+        self.assertEqual(captcha.hash, "hash1")
+
+    def test_get_times_out_when_nothing_ready(self):
+        provider = CountingProvider()
+        provider.release.clear()
+        sut = CaptchaProvider(provider, cachesize=1)
+        sut.start()
+
+        start = time.monotonic()
+        captcha = sut.get_solved_captcha(timeout=0.1)
+        waited = time.monotonic() - start
+        provider.release.set()
+        sut.stop(1)
+
+        self.assertIsNone(captcha)
+        self.assertGreaterEqual(waited, 0.1)
+        self.assertLess(waited, 1)
+        self.assertEqual(sut.stats()["timeouts"], 1)
+
+    def test_past_deadline_does_not_wait(self):
+        provider = CountingProvider()
+        provider.release.clear()
+        sut = CaptchaProvider(provider, cachesize=1)
+
+        self.assertIsNone(sut.get_solved_captcha(deadline=time.monotonic() - 1))
+
+    def test_waiting_consumer_woken_by_filler(self):
+        provider = CountingProvider()
+        provider.release.clear()
+        sut = CaptchaProvider(provider, cachesize=1)
+        sut.start()
+
+        threading.Timer(0.05, provider.release.set).start()
+        captcha = sut.get_solved_captcha(timeout=2)
+        sut.stop(1)
+
+        self.assertIsNotNone(captcha)
+        self.assertGreater(sut.stats()["last_wait_seconds"], 0)
+
+    def test_refills_after_get(self):
+        provider = CountingProvider()
+        sut = CaptchaProvider(provider, cachesize=2)
+        sut.start()
+        self._wait_for(lambda: len(sut) == 2)
+
+        sut.get_solved_captcha(timeout=1)
+        self._wait_for(lambda: provider.calls == 3)
+        sut.stop(1)
+
+        self.assertEqual(provider.calls, 3)
+        self.assertEqual(len(sut), 2)
+
+    def test_stats_report_oldest_expiry(self):
+        sut = CaptchaProvider(CountingProvider(), cachesize=1)
+        self.assertIsNone(sut.stats()["oldest_expires_in"])
+
+        sut.start()
+        self._wait_for(lambda: len(sut) == 1)
+        stats = sut.stats()
+        sut.stop(1)
+
+        self.assertGreater(stats["oldest_expires_in"], 0)
+        self.assertLessEqual(
+            stats["oldest_expires_in"], Captcha.EXPIRATION_AGE.total_seconds())
+
+
+if __name__ == "__main__":
+    unittest.main()
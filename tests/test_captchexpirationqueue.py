@@ -227,3 +227,72 @@ class TimerTests(unittest.TestCase):
     def test_starts_with_no_timer(self):
         sut = CaptchaExpirationQueue()
         self.assertIsNone(sut._timer)
+
+    def test_timer_scheduled_for_next_expiry(self):
+        sut = CaptchaExpirationQueue()
+        sut.add(Captcha("abc123", creation_date=datetime.now()))
+        first_timer = sut._timer
+        sut.add(Captcha("abc124", creation_date=datetime.now()))
+
+        self.assertIsNotNone(first_timer)
+        self.assertIs(sut._timer, first_timer)
+        self.assertAlmostEqual(
+            first_timer.interval, Captcha.EXPIRATION_AGE.total_seconds(), delta=1)
+
+        sut.remove(captchahash="abc123")
+        sut.remove(captchahash="abc124")
+        self.assertIsNone(sut._timer)
+
+    def test_timer_clears_expired_captchas(self):
+        sut = CaptchaExpirationQueue()
+        almost_expired = datetime.now() - Captcha.EXPIRATION_AGE + timedelta(seconds=0.05)
+        sut.add(Captcha("abc123", creation_date=almost_expired))
+
+        sleep(0.2)
+
+        self.assertEqual(len(sut), 0)
+        self.assertIsNone(sut._timer)
+
+
+class HeapQueueTests(unittest.TestCase):
+    def test_pop_returns_oldest_captcha(self):
+        sut = CaptchaExpirationQueue()
+        now = datetime.now()
+        captchas = [Captcha(str(i), creation_date=now - timedelta(seconds=i)) for i in range(5)]
+        for captcha in captchas:
+            sut.add(captcha)
+
+        self.assertEqual([sut.pop() for _ in range(5)], captchas[::-1])
+        self.assertIsNone(sut.pop())
+
+    def test_remove_by_hash_and_captcha(self):
+        sut = CaptchaExpirationQueue()
+        captcha = Captcha("abc123", creation_date=datetime.now() - timedelta(seconds=2))
+        captcha2 = Captcha("abc124", creation_date=datetime.now() - timedelta(seconds=1))
+        captcha3 = Captcha("abc125", creation_date=datetime.now())
+        for x in [captcha, captcha2, captcha3]:
+            sut.add(x)
+
+        self.assertTrue(sut.remove(captcha=captcha, captchahash=captcha3.hash))
+        self.assertTrue(sut.remove(captchahash=captcha2.hash))
+        self.assertFalse(sut.remove(captchahash="missing"))
+        self.assertEqual(len(sut), 1)
+        self.assertIs(sut.pop(), captcha3)
+
+    def test_pop_skips_expired_captcha(self):
+        sut = CaptchaExpirationQueue()
+        captcha = Captcha("abc123", creation_date=datetime.now())
+        sut.add(captcha)
+        sut._heap[0][0] = 0
+
+        self.assertIsNone(sut.pop())
+        self.assertEqual(len(sut), 0)
+
+    def test_expired_captcha_not_added(self):
+        sut = CaptchaExpirationQueue()
+        captcha = Captcha(
+            "abc123", creation_date=datetime.now() - Captcha.EXPIRATION_AGE - timedelta(days=1))
+
+        self.assertFalse(sut.add(captcha))
+        self.assertEqual(len(sut), 0)
+        self.assertIsNone(sut._timer)
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from requests.cookies import RequestsCookieJar
+
+from rocalert.cookiestore import CookieStore
+
+
+def _jar(value: str, name: str = "PHPSESSID") -> RequestsCookieJar:
+    jar = RequestsCookieJar()
+    jar.set(name, value, domain="ruinsofchaos.com", path="/",
+            secure=True, expires=2000000000, rest={"HttpOnly": None})
+    return jar
+
+
+def _save_from_process(path: str, name: str) -> None:
+    store = CookieStore(path)
+    store.update(name, _jar(name))
+    store.save()
+
+
+class CookieStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, "sessions", "cookies.json")
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def test_round_trip(self):
+        sut = CookieStore(self.path)
+        sut.update("session_0", _jar("abc"))
+        sut.save()
+
+        jar = CookieStore(self.path).load("session_0")
+
+        cookie = next(iter(jar))
+        self.assertEqual(jar.get("PHPSESSID"), "abc")
+        self.assertTrue(cookie.secure)
+        self.assertEqual(cookie.expires, 2000000000)
+        self.assertTrue(cookie.has_nonstandard_attr("HttpOnly"))
+
+    def test_missing_jar(self):
+        self.assertIsNone(CookieStore(self.path).load("session_0"))
+
+    def test_unchanged_jar_not_written(self):
+        sut = CookieStore(self.path)
+        self.assertTrue(sut.update("session_0", _jar("abc")))
+        self.assertEqual(sut.save(), 1)
+
+        self.assertFalse(sut.update("session_0", _jar("abc")))
+        self.assertFalse(sut.dirty)
+        self.assertEqual(sut.save(), 0)
+        self.assertEqual(sut.writes, 1)
+
+        self.assertTrue(sut.update("session_0", _jar("def")))
+        self.assertEqual(sut.save(), 1)
+
+    def test_save_keeps_jars_from_other_stores(self):
+        first = CookieStore(self.path)
+        second = CookieStore(self.path)
+        first.update("session_0", _jar("abc"))
+        second.update("session_1", _jar("def"))
+
+        first.save()
+        second.save()
+
+        self.assertEqual(sorted(CookieStore(self.path).names()), ["session_0", "session_1"])
+        self.assertEqual(second.load("session_0").get("PHPSESSID"), "abc")
+
+    def test_reload_sees_other_stores(self):
+        first = CookieStore(self.path)
+        first.names()
+        second = CookieStore(self.path)
+        second.update("session_1", _jar("def"))
+        second.save()
+
+        first.reload()
+
+        self.assertEqual(first.load("session_1").get("PHPSESSID"), "def")
+
+    def test_unreadable_store_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as f:
+            f.write("not json")
+
+        sut = CookieStore(self.path)
+
+        self.assertEqual(sut.names(), [])
+        sut.update("session_0", _jar("abc"))
+        sut.save()
+        self.assertEqual(CookieStore(self.path).names(), ["session_0"])
+
+    def test_processes_keep_each_others_jars(self):
+        ctx = multiprocessing.get_context("spawn")
+        names = [f"session_{i}" for i in range(4)]
+        procs = [ctx.Process(target=_save_from_process, args=(self.path, x)) for x in names]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        store = CookieStore(self.path)
+        self.assertEqual(sorted(store.names()), names)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
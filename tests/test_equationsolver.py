@@ -0,0 +1,42 @@
+import subprocess
+import sys
+import unittest
+from fractions import Fraction
+
+from rocalert.captcha.equation_solver import EquationSolver
+
+
+class EquationSolverTest(unittest.TestCase):
+    def test_integer_arithmetic(self):
+        self.assertEqual(EquationSolver.solve_equation('2 + 3 * 4'), '14')
+        self.assertEqual(EquationSolver.solve_equation('5 - 9'), '-4')
+        self.assertEqual(EquationSolver.solve_equation('-3 * -2'), '6')
+
+    def test_division_is_exact(self):
+        self.assertEqual(EquationSolver.solve_equation('8 / 4'), '2')
+        self.assertEqual(EquationSolver.solve_equation('7/2'), '7/2')
+        self.assertEqual(EquationSolver.evaluate('10 / 4 * 2'), Fraction(5))
+
+    def test_rejects_anything_but_integer_arithmetic(self):
+        for eq in ['2 ** 3', '1.5 + 1', 'x + 1', '__import__("os")', '1 / 0', '']:
+            with self.subTest(eq=eq):
+                self.assertIsNone(EquationSolver.evaluate(eq))
+
+    def test_falls_back_to_sympy(self):
+        self.assertEqual(EquationSolver.solve_equation('2**3'), '8')
+
+    def test_memoized(self):
+        EquationSolver.solve_equation('12 + 30')
+        hits = EquationSolver.solve_equation.cache_info().hits
+        self.assertEqual(EquationSolver.solve_equation('12 + 30'), '42')
+        self.assertEqual(EquationSolver.solve_equation.cache_info().hits, hits + 1)
+
+    def test_import_does_not_load_sympy(self):
+        code = 'import sys, rocalert.captcha.equation_solver; print("sympy" in sys.modules)'
+        out = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), 'False')
+
+
+if __name__ == "__main__":
+    unittest.main()
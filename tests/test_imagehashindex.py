@@ -0,0 +1,140 @@
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import PIL.Image
+
+from rocalert.captcha.imagehashindex import (
+    ImageHashIndex,
+    dhash,
+    hamming_distances,
+    load_answer_log,
+)
+
+
+def _image(seed: int, noise: int = 0, fmt: str = "PNG") -> bytes:
+    rng = np.random.default_rng(seed)
+    pixels = np.kron(rng.integers(0, 256, (8, 9)), np.ones((10, 10))).astype(np.int16)
+    if noise:
+        pixels += np.random.default_rng(seed + 1000).integers(-noise, noise + 1, pixels.shape)
+    img = PIL.Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "L")
+    out = io.BytesIO()
+    img.save(out, format=fmt)
+    return out.getvalue()
+
+
+class DHashTest(unittest.TestCase):
+    def test_same_image_different_encoding_matches(self):
+        self.assertLessEqual(
+            hamming_distances(
+                np.array([dhash(_image(1))], dtype=np.uint64), dhash(_image(1, fmt="JPEG")))[0],
+            2)
+
+    def test_different_images_far_apart(self):
+        distance = hamming_distances(
+            np.array([dhash(_image(1))], dtype=np.uint64), dhash(_image(2)))[0]
+        self.assertGreater(distance, 10)
+
+
+class ImageHashIndexTest(unittest.TestCase):
+    def test_exact_match_full_confidence(self):
+        sut = ImageHashIndex()
+        sut.add(_image(1), "4", "hash1")
+        sut.add(_image(2), "7", "hash2")
+
+        match = sut.lookup(_image(1))
+
+        self.assertEqual(match.answer, "4")
+        self.assertEqual(match.distance, 0)
+        self.assertEqual(match.confidence, 1.0)
+        self.assertEqual(match.captchahash, "hash1")
+
+    def test_near_duplicate_matches(self):
+        sut = ImageHashIndex()
+        sut.add(_image(1), "4")
+
+        match = sut.lookup(_image(1, noise=3))
+
+        self.assertIsNotNone(match)
+        self.assertEqual(match.answer, "4")
+
+    def test_unknown_image_misses(self):
+        sut = ImageHashIndex()
+        sut.add(_image(1), "4")
+
+        self.assertIsNone(sut.lookup(_image(2)))
+        stats = sut.stats()
+        self.assertEqual(stats["lookups"], 1)
+        self.assertEqual(stats["hits"], 0)
+
+    def test_conflicting_answers_lower_confidence(self):
+        sut = ImageHashIndex(min_confidence=0)
+        sut.add(_image(1), "4")
+        sut.add(_image(1), "5")
+
+        self.assertEqual(sut.lookup(_image(1)).confidence, 0.5)
+
+    def test_reject_drops_wrong_answer(self):
+        sut = ImageHashIndex()
+        sut.add(_image(1), "4")
+        sut.add(_image(2), "4")
+
+        self.assertEqual(sut.reject(_image(1), "4"), 1)
+        self.assertIsNone(sut.lookup(_image(1)))
+        self.assertIsNotNone(sut.lookup(_image(2)))
+
+    def test_rejected_hash_can_be_added_again(self):
+        sut = ImageHashIndex()
+        sut.add(_image(1), "4", "hash1")
+        self.assertFalse(sut.add(_image(1), "4", "hash1"))
+
+        sut.reject(_image(1), "4")
+
+        self.assertFalse(sut.knows("hash1"))
+        self.assertTrue(sut.add(_image(1), "5", "hash1"))
+        self.assertEqual(sut.lookup(_image(1)).answer, "5")
+
+    def test_grows_past_initial_capacity(self):
+        sut = ImageHashIndex()
+        values = np.random.default_rng(0).integers(0, 2**63, 100)
+        for i, value in enumerate(values):
+            sut.add_hash(int(value), str(i % 9 + 1))
+
+        self.assertEqual(len(sut), 100)
+        self.assertEqual(sut.lookup_hash(int(values[99])).answer, "1")
+
+    def test_loads_directory_with_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            imgdir = os.path.join(tmpdir, "captcha_img")
+            os.makedirs(imgdir)
+            for i in range(3):
+                with open(os.path.join(imgdir, f"hash{i}.png"), "wb") as f:
+                    f.write(_image(i))
+            logpath = os.path.join(tmpdir, "correct_ans.log")
+            with open(logpath, "w") as f:
+                f.write("hash0:1\nhash1:2\n")
+            cachepath = os.path.join(tmpdir, "dhash.npz")
+
+            sut = ImageHashIndex.from_logs(imgdir, logpath, cachepath)
+            self.assertEqual(len(sut), 2)
+            self.assertEqual(sut.lookup(_image(1)).answer, "2")
+
+            # Cached hashes are used even when the image can no longer be read
+            with open(os.path.join(imgdir, "hash1.png"), "wb") as f:
+                f.write(b"broken")
+            cached = ImageHashIndex.from_logs(imgdir, logpath, cachepath)
+            self.assertEqual(cached.lookup(_image(1)).answer, "2")
+
+    def test_load_answer_log_skips_wrong_answers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            logpath = os.path.join(tmpdir, "answers.log")
+            with open(logpath, "w") as f:
+                f.write("01:02:03: a:1:True\n01:02:04: b:2:False\n")
+
+            self.assertEqual(load_answer_log(logpath), {"a": "1"})
+
+
+if __name__ == "__main__":
+    unittest.main()
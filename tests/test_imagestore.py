@@ -0,0 +1,169 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import unittest
+
+from rocalert.captcha.imagestore import CaptchaImageStore, image_digest
+
+
+class BlockedCaptchaImageStore(CaptchaImageStore):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    def _write(self, captchahash: str, imgbytes: bytes) -> None:
+        self.release.wait()
+        super()._write(captchahash, imgbytes)
+
+
+class FailingCaptchaImageStore(CaptchaImageStore):
+    """Fails the first write, like a full disk"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.failures = 1
+
+    def _write(self, captchahash: str, imgbytes: bytes) -> None:
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("No space left on device")
+        super()._write(captchahash, imgbytes)
+
+
+def _save_from_process(root: str, prefix: str, count: int) -> None:
+    store = CaptchaImageStore(root, pack=True)
+    for i in range(count):
+        store.save(f"{prefix}{i}", f"{prefix} image {i}".encode() * (i + 1))
+    store.close()
+
+
+class CaptchaImageStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.root = self._tmpdir.name
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    def _files(self) -> list[str]:
+        return sorted(
+            os.path.relpath(os.path.join(path, name), self.root)
+            for path, _, names in os.walk(self.root) for name in names)
+
+    def test_saved_bytes_read_back_unchanged(self):
+        sut = CaptchaImageStore(self.root)
+        sut.save("hash1", b"png bytes")
+
+        self.assertEqual(sut.get("hash1"), b"png bytes")
+        sut.close()
+        self.assertEqual(CaptchaImageStore(self.root).get("hash1"), b"png bytes")
+
+    def test_loose_layout_by_digest(self):
+        sut = CaptchaImageStore(self.root)
+        sut.save("hash1", b"png bytes")
+        sut.close()
+
+        digest = image_digest(b"png bytes")
+        self.assertEqual(
+            self._files(),
+            ["index.log", "index.log.lock", os.path.join("objects", digest[:2], digest + ".png")])
+
+    def test_same_image_stored_once(self):
+        sut = CaptchaImageStore(self.root)
+        sut.save("hash1", b"same image")
+        sut.save("hash2", b"same image")
+        sut.close()
+
+        reopened = CaptchaImageStore(self.root)
+        self.assertEqual(len(self._files()), 3)
+        self.assertEqual(reopened.get("hash2"), b"same image")
+        self.assertEqual(list(reopened.hashes()), ["hash1", "hash2"])
+
+    def test_pack_file(self):
+        sut = CaptchaImageStore(self.root, pack=True)
+        sut.save("hash1", b"first")
+        sut.save("hash2", b"second image")
+        sut.save("hash3", b"first")
+        sut.close()
+
+        reopened = CaptchaImageStore(self.root, pack=True)
+        self.assertEqual(self._files(), ["images.pack", "index.log", "index.log.lock"])
+        self.assertEqual(os.path.getsize(os.path.join(self.root, "images.pack")), 17)
+        self.assertEqual(dict(reopened.images()), {
+            "hash1": b"first", "hash2": b"second image", "hash3": b"first"})
+
+    def test_stores_sharing_a_pack(self):
+        first = CaptchaImageStore(self.root, pack=True)
+        second = CaptchaImageStore(self.root, pack=True)
+        for i in range(20):
+            first.save(f"a{i}", b"first store %d" % i)
+            second.save(f"b{i}", b"second store image %d" % i)
+        first.close()
+        second.close()
+
+        images = dict(CaptchaImageStore(self.root, pack=True).images())
+        self.assertEqual(len(images), 40)
+        self.assertEqual(images["a7"], b"first store 7")
+        self.assertEqual(images["b13"], b"second store image 13")
+
+    def test_processes_sharing_a_pack(self):
+        ctx = multiprocessing.get_context("spawn")
+        procs = [
+            ctx.Process(target=_save_from_process, args=(self.root, prefix, 25))
+            for prefix in "abc"
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        images = dict(CaptchaImageStore(self.root, pack=True).images())
+        self.assertEqual(len(images), 75)
+        for prefix in "abc":
+            for i in range(25):
+                self.assertEqual(images[f"{prefix}{i}"], f"{prefix} image {i}".encode() * (i + 1))
+
+    def test_legacy_files_found(self):
+        with open(os.path.join(self.root, "oldhash.png"), "wb") as f:
+            f.write(b"old image")
+        sut = CaptchaImageStore(self.root)
+        sut.save("newhash", b"new image")
+        sut.flush()
+
+        self.assertIn("oldhash", sut)
+        self.assertEqual(list(sut.hashes()), ["newhash", "oldhash"])
+        self.assertEqual(sut.get("oldhash"), b"old image")
+        sut.close()
+
+    def test_drops_when_queue_full(self):
+        sut = BlockedCaptchaImageStore(self.root, queue_size=1)
+
+        results = [sut.save(f"hash{i}", f"image{i}".encode()) for i in range(5)]
+        sut.release.set()
+        sut.close()
+
+        self.assertFalse(all(results))
+        self.assertEqual(sut.dropped, results.count(False))
+
+    def test_failed_write_is_retried(self):
+        sut = FailingCaptchaImageStore(self.root)
+        sut.save("hash1", b"image")
+        sut.flush()
+
+        self.assertNotIn("hash1", sut)
+        self.assertEqual(sut.dropped, 1)
+
+        self.assertTrue(sut.save("hash1", b"image"))
+        sut.close()
+        self.assertEqual(CaptchaImageStore(self.root).get("hash1"), b"image")
+
+    def test_closed_store_rejects_saves(self):
+        sut = CaptchaImageStore(self.root)
+        sut.close()
+
+        self.assertFalse(sut.save("hash1", b"image"))
+
+
+if __name__ == "__main__":
+    unittest.main()
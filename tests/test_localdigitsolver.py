@@ -0,0 +1,123 @@
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+
+from rocalert.captcha.solvers.localdigitsolver import (
+    LocalDigitClassifier,
+    load_corpus,
+    split_corpus,
+)
+from rocalert.roc_web_handler import Captcha
+from rocalert.services.captchaservices import (
+    CaptchaSolveException,
+    LocalCaptchaSolverService,
+)
+
+
+def _digit_image(digit: str, rng: np.random.Generator) -> bytes:
+    img = PIL.Image.new("L", (40, 40), 255)
+    draw = PIL.ImageDraw.Draw(img)
+    font = PIL.ImageFont.load_default(size=28)
+    draw.text((12 + rng.integers(-2, 3), 4 + rng.integers(-2, 3)), digit, fill=0, font=font)
+    pixels = np.asarray(img, dtype=np.int16) + rng.integers(-20, 21, (40, 40))
+    out = io.BytesIO()
+    PIL.Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(out, format="PNG")
+    return out.getvalue()
+
+
+def _corpus(count: int, seed: int = 0) -> tuple[list[bytes], list[str]]:
+    rng = np.random.default_rng(seed)
+    labels = [str(rng.integers(1, 10)) for _ in range(count)]
+    return [_digit_image(label, rng) for label in labels], labels
+
+
+class LocalDigitClassifierTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.images, cls.labels = _corpus(360)
+        cls.model = LocalDigitClassifier().fit(cls.images, cls.labels, epochs=20)
+
+    def test_learns_synthetic_digits(self):
+        test_images, test_labels = _corpus(90, seed=1)
+
+        self.assertGreater(self.model.accuracy(test_images, test_labels), 0.9)
+
+    def test_batch_matches_single_predictions(self):
+        batch = self.model.predict_batch(self.images[:5])
+
+        for image, (answer, confidence) in zip(self.images[:5], batch):
+            single = self.model.predict(image)
+            self.assertEqual(single[0], answer)
+            self.assertAlmostEqual(single[1], confidence, places=5)
+            self.assertTrue(0 < confidence <= 1)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "model.npz")
+            self.model.save(path)
+            loaded = LocalDigitClassifier.load(path)
+
+        self.assertEqual(loaded.predict_batch(self.images[:10]), self.model.predict_batch(self.images[:10]))
+
+    def test_service_sets_answer_and_confidence(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "model.npz")
+            self.model.save(path)
+            sut = LocalCaptchaSolverService(path)
+
+        captchas = [Captcha(f"hash{i}", img) for i, img in enumerate(self.images[:3])]
+        sut.solve_batch(captchas)
+        single = sut.solve_captcha(Captcha("single", self.images[0]))
+
+        self.assertEqual(single.ans, captchas[0].ans)
+        self.assertIsNotNone(captchas[2].confidence)
+
+    def test_service_requires_model(self):
+        with self.assertRaises(CaptchaSolveException):
+            LocalCaptchaSolverService("missing/model.npz")
+
+    def test_untrained_model_refuses_to_predict(self):
+        with self.assertRaises(ValueError):
+            LocalDigitClassifier().predict(self.images[0])
+
+
+class CorpusTest(unittest.TestCase):
+    def test_loads_labelled_images_only(self):
+        images, labels = _corpus(3)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for i, img in enumerate(images):
+                with open(os.path.join(tmpdir, f"hash{i}.png"), "wb") as f:
+                    f.write(img)
+            logpath = os.path.join(tmpdir, "answers.log")
+            with open(logpath, "w") as f:
+                f.write(f"hash0:{labels[0]}\nhash2:{labels[2]}\n")
+
+            loaded, loaded_labels = load_corpus(tmpdir, logpath)
+
+        self.assertEqual(loaded, [images[0], images[2]])
+        self.assertEqual(loaded_labels, [labels[0], labels[2]])
+
+    def test_split_keeps_holdout_share(self):
+        images = [f"image{i}".encode() for i in range(1000)]
+        train_x, train_y, test_x, test_y = split_corpus(images, images, 0.2)
+
+        self.assertAlmostEqual(len(test_x) / len(images), 0.2, delta=0.05)
+        self.assertEqual(sorted(train_x + test_x), sorted(images))
+        self.assertEqual(train_x, train_y)
+
+    def test_split_stable_as_corpus_grows(self):
+        images = [f"image{i}".encode() for i in range(200)]
+        _, _, test_x, _ = split_corpus(images, images, 0.2)
+        grown = [f"new{i}".encode() for i in range(100)] + images
+        _, _, grown_test_x, _ = split_corpus(grown, grown, 0.2)
+
+        self.assertEqual([x for x in grown_test_x if x in images], test_x)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from rocalert.captcha.answerindex import CaptchaAnswerIndex
+from rocalert.captcha.imagehashindex import ImageHashIndex
+from rocalert.captcha.imagestore import CaptchaImageStore
+from rocalert.pyrocalert import RocAlert
+from rocalert.roc_web_handler import Captcha
+from rocalert.services.captchaservices import CaptchaSolverServiceABC
+from tests.test_imagehashindex import _image
+
+
+class HashMapSolver(CaptchaSolverServiceABC):
+    """Like the rocapi solver, only captchas it solved can be reported"""
+
+    def __init__(self) -> None:
+        self._solved = {}
+        self.reported = []
+
+    def solve_captcha(self, captcha: Captcha) -> Captcha:
+        self._solved[captcha.hash] = "request"
+        captcha.ans = "5"
+        return captcha
+
+    def report_captcha(self, captcha: Captcha) -> None:
+        self._solved[captcha.hash]
+        self.reported.append(captcha.hash)
+
+
+class StatsSolver(HashMapSolver):
+    def stats(self) -> dict:
+        return {"local": {"p50_ms": 12, "accuracy": 0.9, "error_rate": 0, "solves": 4}}
+
+
+class FakeRoc:
+    def __init__(self, captchahash: str) -> None:
+        self.captchahash = captchahash
+
+    def get_img_captcha(self, page: str) -> Captcha:
+        return Captcha(self.captchahash, _image(1), captype=Captcha.CaptchaType.IMAGE)
+
+    def submit_captcha(self, captcha, ans, page, payload, manual_page) -> bool:
+        return True
+
+
+class FakeRemote:
+    def lookup_remote(self, captcha: Captcha) -> str:
+        return None
+
+    def add_remote(self, captcha: Captcha) -> None:
+        pass
+
+
+class FakeSettings:
+    def __init__(self, savepath: str) -> None:
+        self.savepath = savepath
+
+    def get_settings_old(self) -> dict:
+        return {"captcha_save_path": self.savepath}
+
+
+class RocAlertTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        self.index = CaptchaAnswerIndex(os.path.join(self._tmpdir.name, "answers.idx"))
+        self.image_index = ImageHashIndex()
+        self.solver = HashMapSolver()
+
+    def _alert(self, captchahash: str = "hash") -> RocAlert:
+        store = CaptchaImageStore(self._tmpdir.name)
+        self.addCleanup(store.close)
+        return RocAlert(
+            FakeRoc(captchahash),
+            FakeSettings(self._tmpdir.name),
+            remoteCaptcha=FakeRemote(),
+            capsolver=self.solver,
+            answerIndex=self.index,
+            imageIndex=self.image_index,
+            imageStore=store,
+        )
+
+    def _solve(self, captchahash: str) -> Captcha:
+        sut = self._alert(captchahash)
+        captcha = sut._RocAlert__handle_img_captcha("roc_armory")
+        sut._RocAlert__captcha_final(captcha)
+        return captcha
+
+    def test_indexed_answer_not_reported(self):
+        self.index.add("known", "3")
+
+        captcha = self._solve("known")
+
+        self.assertTrue(captcha.from_lookup)
+        self.assertEqual(captcha.ans, "3")
+        self.assertEqual(self.solver.reported, [])
+
+    def test_similar_image_answer_not_reported(self):
+        self.image_index.add(_image(1, noise=2), "7", "seen")
+
+        captcha = self._solve("unseen")
+
+        self.assertTrue(captcha.from_lookup)
+        self.assertEqual(captcha.ans, "7")
+        self.assertEqual(self.solver.reported, [])
+
+    def test_solved_answer_reported_and_indexed(self):
+        captcha = self._solve("new")
+
+        self.assertFalse(captcha.from_lookup)
+        self.assertEqual(self.solver.reported, ["new"])
+        self.assertEqual(self.index.lookup("new"), "5")
+
+    def test_solver_and_index_stats_logged_without_page_cache(self):
+        self.solver = StatsSolver()
+        self.image_index.lookup(_image(1))
+        out = io.StringIO()
+
+        with contextlib.redirect_stdout(out):
+            self._alert()._RocAlert__log_stats()
+
+        self.assertIn("Solver local: p50 12ms", out.getvalue())
+        self.assertIn("Image index: 0% hit rate over 1 lookups", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+import os
+import threading
+import time
+import unittest
+
+from rocalert.roc_web_handler import _MAX_CACHED_PAGES, Captcha, RocResponse, RocWebHandler
+from rocalert.services.urlgenerator import ROCDecryptUrlGenerator
+
+
+def _get_dir():
+    lastslash = max(__file__.rfind("\\"), __file__.rfind("/"))
+    return __file__[: lastslash + 1]
+
+
+def _read_testpage(path: str) -> str:
+    filepath = _get_dir() + path
+    if not os.path.exists(filepath):
+        raise Exception(f"File does not exist at {filepath}")
+
+    with open(filepath) as f:
+        return f.read()
+
+
+class FakeResponse:
+    def __init__(self, url: str, text: str = "", status_code: int = 200) -> None:
+        self.url = url
+        self.text = text
+        self.content = text.encode()
+        self.status_code = status_code
+
+
+class FakeSession:
+    def __init__(self, pages: dict[str, str] = None) -> None:
+        self.pages = pages if pages else {}
+        self.cookies = {}
+        self.posts = []
+        self.gets = []
+
+    def get(self, url, headers=None, allow_redirects=True):
+        self.gets.append(url)
+        return FakeResponse(url, self.pages.get(url, ""))
+
+    def post(self, url, payload, headers=None):
+        self.posts.append((url, payload))
+        return FakeResponse(url, self.pages.get(url, ""))
+
+
+class BlockingSession(FakeSession):
+    """Holds GETs of `url` until `release` is set"""
+
+    def __init__(self, pages: dict[str, str], url: str) -> None:
+        super().__init__(pages)
+        self.url = url
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def get(self, url, headers=None, allow_redirects=True):
+        if url == self.url:
+            self.started.set()
+            self.release.wait(5)
+        return super().get(url, headers, allow_redirects)
+
+
+def _make_handler(
+    pages: dict[str, str] = None, reentrant: bool = False, cache_ttl: float = 0
+):
+    handler = RocWebHandler(
+        ROCDecryptUrlGenerator(), reentrant=reentrant, cache_ttl=cache_ttl
+    )
+    handler.session = FakeSession(pages)
+    handler._log_request = lambda url, payload, headers: None
+    return handler
+
+
+class RocResponseTest(unittest.TestCase):
+    def test_image_captcha_detected(self):
+        text = _read_testpage("testpages/recruit/recruit_captcha.html")
+        resp = RocResponse("https://example.com/recruiter.php", 200, text)
+
+        self.assertEqual(resp.captcha_type, Captcha.CaptchaType.IMAGE)
+        self.assertEqual(resp.captcha_hash, "05537ef36072099afa7011808bdf40e3")
+
+    def test_no_captcha_detected(self):
+        text = _read_testpage("testpages/recruit/recruit_no_captcha.html")
+        resp = RocResponse("https://example.com/recruiter.php", 200, text)
+
+        self.assertIsNone(resp.captcha_type)
+        self.assertIsNone(resp.captcha_hash)
+
+    def test_cooldown_is_text_captcha(self):
+        resp = RocResponse("https://example.com/cooldown.php", 200, "")
+        self.assertEqual(resp.captcha_type, Captcha.CaptchaType.TEXT)
+
+    def test_gold(self):
+        text = _read_testpage("testpages/recruit/recruit_captcha.html")
+        resp = RocResponse("https://example.com/recruiter.php", 200, text)
+
+        self.assertEqual(resp.gold, 22326)
+
+    def test_wrong_number(self):
+        resp = RocResponse("https://example.com/", 200, "You hit the wrong number. ")
+        self.assertFalse(resp.captcha_correct)
+
+    def test_equation(self):
+        resp = RocResponse("https://example.com/", 200, "<h1>What is 5 + 3?</h1>")
+        self.assertEqual(resp.equation, "5 + 3")
+
+
+class RocWebHandlerReentrantTest(unittest.TestCase):
+    def test_fetch_page_does_not_change_last_response(self):
+        handler = _make_handler({"a": "page a", "b": "page b"})
+
+        handler.go_to_page("a")
+        resp = handler.fetch_page("b")
+
+        self.assertEqual(resp.text, "page b")
+        self.assertEqual(handler.r.text, "page a")
+
+    def test_submit_page_does_not_change_last_response(self):
+        handler = _make_handler({"a": "page a", "b": "wrong number"})
+
+        handler.go_to_page("a")
+        resp = handler.submit_page(None, "b", {}, RocWebHandler.Pages.SPY)
+
+        self.assertFalse(resp.captcha_correct)
+        self.assertEqual(handler.r.text, "page a")
+
+    def test_reentrant_last_response_is_per_thread(self):
+        handler = _make_handler({"a": "page a", "b": "page b"}, reentrant=True)
+        results = {}
+        barrier = threading.Barrier(2)
+
+        def visit(url):
+            handler.go_to_page(url)
+            barrier.wait()
+            results[url] = handler.r.text
+
+        threads = [threading.Thread(target=visit, args=[x]) for x in ["a", "b"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {"a": "page a", "b": "page b"})
+        self.assertIsNone(handler.r)
+
+    def test_non_reentrant_last_response_is_shared(self):
+        handler = _make_handler({"a": "page a"})
+
+        thread = threading.Thread(target=handler.go_to_page, args=["a"])
+        thread.start()
+        thread.join()
+
+        self.assertEqual(handler.r.text, "page a")
+
+
+class RocWebHandlerCacheTest(unittest.TestCase):
+    def test_cache_disabled_by_default(self):
+        handler = _make_handler({"a": "page a"})
+
+        handler.go_to_page("a")
+        handler.go_to_page("a")
+
+        self.assertEqual(len(handler.session.gets), 2)
+        self.assertEqual(handler.cache_stats()["hits"], 0)
+
+    def test_repeat_get_is_cached(self):
+        handler = _make_handler({"a": "page a"}, cache_ttl=60)
+
+        handler.go_to_page("a")
+        resp = handler.fetch_page("a")
+
+        self.assertEqual(resp.text, "page a")
+        self.assertEqual(handler.session.gets, ["a"])
+        self.assertEqual(handler.cache_stats()["hits"], 1)
+        self.assertEqual(handler.cache_stats()["misses"], 1)
+
+    def test_cache_expires(self):
+        handler = _make_handler({"a": "page a"}, cache_ttl=0.01)
+
+        handler.go_to_page("a")
+        time.sleep(0.02)
+        handler.go_to_page("a")
+
+        self.assertEqual(len(handler.session.gets), 2)
+
+    def test_bypass_cache(self):
+        handler = _make_handler({"a": "page a"}, cache_ttl=60)
+
+        handler.go_to_page("a")
+        handler.go_to_page("a", bypass_cache=True)
+
+        self.assertEqual(len(handler.session.gets), 2)
+
+    def test_cache_size_capped(self):
+        pages = {f"p{i}": f"page {i}" for i in range(_MAX_CACHED_PAGES + 1)}
+        handler = _make_handler(pages, cache_ttl=60)
+
+        for url in pages:
+            handler.go_to_page(url)
+        handler.go_to_page("p1")
+        handler.go_to_page("p0")
+
+        self.assertEqual(handler.cache_stats()["size"], _MAX_CACHED_PAGES)
+        self.assertEqual(handler.session.gets.count("p1"), 1)
+        self.assertEqual(handler.session.gets.count("p0"), 2)
+
+    def test_post_clears_cache(self):
+        handler = _make_handler({"a": "page a"}, cache_ttl=60)
+
+        handler.go_to_page("a")
+        handler.submit_page(None, "b", {}, RocWebHandler.Pages.SPY)
+        handler.go_to_page("a")
+
+        self.assertEqual(len(handler.session.gets), 2)
+
+    def test_add_cookies_clears_cache(self):
+        handler = _make_handler({"a": "page a"}, cache_ttl=60)
+
+        handler.go_to_page("a")
+        handler.add_cookies({"session": "new"})
+        handler.go_to_page("a")
+
+        self.assertEqual(len(handler.session.gets), 2)
+
+    def test_get_finishing_after_post_not_cached(self):
+        handler = _make_handler(reentrant=True, cache_ttl=60)
+        handler.session = BlockingSession({
+            "a": '<span id="s_gold">100</span>',
+            "b": '<span id="s_gold">5</span>',
+        }, "a")
+
+        get = threading.Thread(target=handler.fetch_page, args=("a",))
+        get.start()
+        handler.session.started.wait(5)
+        handler.submit_page(None, "b", {}, RocWebHandler.Pages.SPY)
+        handler.session.release.set()
+        get.join(5)
+
+        self.assertEqual(handler.cache_stats()["size"], 0)
+        self.assertEqual(handler.account_state.gold(), 5)
+
+    def test_captcha_pages_not_cached(self):
+        text = _read_testpage("testpages/recruit/recruit_captcha.html")
+        handler = _make_handler(cache_ttl=60)
+        handler.session.pages[handler.url_generator.get_recruit()] = text
+
+        handler.recruit_has_captcha()
+        captcha = handler.get_img_captcha(RocWebHandler.Pages.RECRUIT)
+        handler.get_img_captcha(RocWebHandler.Pages.RECRUIT)
+
+        self.assertEqual(captcha.hash, "05537ef36072099afa7011808bdf40e3")
+        self.assertEqual(len(handler.session.gets), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
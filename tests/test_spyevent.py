@@ -0,0 +1,99 @@
+import unittest
+
+from rocalert.roc_web_handler import RocResponse, RocWebHandler
+from rocalert.rocaccount import BattlefieldTarget
+from rocalert.services.sessionpool import SessionPool
+from spyevent import AsyncSessionView, SpyWorkers
+from tests.test_rocwebhandler import _make_handler
+
+
+SPIED = "Your spy enters undetected"
+LOGGED_OUT = '<form action="login.php" method="post">'
+
+
+class FakeSession:
+    """Answers every recon with the next of `pages`, raising exceptions"""
+    Pages = RocWebHandler.Pages
+
+    def __init__(self, *pages) -> None:
+        self.pages = list(pages)
+        self.submits = 0
+
+    def submit_page(self, captcha, url, payload, manual_page) -> RocResponse:
+        self.submits += 1
+        page = self.pages.pop(0)
+        if isinstance(page, Exception):
+            raise page
+        if page == SPIED:
+            return RocResponse("https://roc/report.php?report_id=1", 200, page)
+        return RocResponse(url, 200, page)
+
+
+class FakeSessionManager:
+    def __init__(self) -> None:
+        self.pool = SessionPool(lambda index: None, 0)
+
+
+class SpyWorkersTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sut = SpyWorkers(FakeSessionManager(), 1, 10)
+        self.user = BattlefieldTarget("1", 1, "user1", None, 1, "Soldiers", 1)
+        self.sut.ledger.add_targets(["1"])
+
+    def _spy(self, session: FakeSession, attempts: int = 10) -> dict:
+        return self.sut._spy_user_multiple_attempts(session, self.user, attempts, "none")
+
+    def test_logged_out_session_does_not_count_against_user(self):
+        session = FakeSession(SPIED, LOGGED_OUT)
+
+        self._spy(session)
+
+        self.assertEqual(session.submits, 2)
+        self.assertEqual(self.sut.ledger.successes("1"), 1)
+        self.assertEqual(self.sut.ledger.remaining("1"), 9)
+        self.assertEqual(self.sut.ledger.stats()["attempts"], 1)
+
+    def test_session_errors_do_not_retire_user(self):
+        session = FakeSession(*[ConnectionError("reset")] * 5)
+
+        self._spy(session, attempts=5)
+
+        self.assertFalse(self.sut.ledger.is_retired("1"))
+        self.assertEqual(self.sut.ledger.remaining("1"), 10)
+
+    def test_spies_up_to_quota(self):
+        session = FakeSession(*[SPIED] * 12)
+
+        results = self._spy(session, attempts=12)
+
+        self.assertEqual(session.submits, 10)
+        self.assertEqual(results["successful"], 10)
+        self.assertTrue(results["completed"])
+
+
+class AsyncSessionViewTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.pool = SessionPool(lambda index: _make_handler(), 2, relogin_delay=60)
+        self.pool.start()
+        self.addCleanup(self.pool.close)
+        self.sut = AsyncSessionView(self.pool)
+        self.addAsyncCleanup(self.sut.aclose)
+
+    async def test_handlers_made_once_per_session(self):
+        sessions = self.sut.sessions
+
+        self.assertEqual(len(sessions), 2)
+        self.assertEqual([id(x) for x in self.sut.sessions], [id(x) for x in sessions])
+
+    async def test_logged_out_report_drains_pooled_session(self):
+        session = self.sut.sessions[0]
+
+        self.sut.report(session, 0.1, logged_in=False)
+
+        self.assertEqual(self.pool.stats()["drained"], 1)
+        self.assertEqual(len(self.sut.sessions), 1)
+        self.assertNotIn(session, self.sut.sessions)
+
+
+if __name__ == "__main__":
+    unittest.main()